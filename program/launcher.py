@@ -449,4 +449,7 @@ def main():
 
 
 if __name__ == "__main__":
+    # 打包后的 exe 中进程池子进程需要此入口
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,6 @@
+"""python -m tools.label_box：标签箱唛命令行入口"""
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+标签箱唛 性能基准（合成数据，不依赖真实模板/配货表）
+
+用法（在 program 目录下）：
+    python -m tools.label_box.benchmark -o bench_new.json
+    python -m tools.label_box.benchmark --templates 2000 --rows 1000 --boxes 200 --repeat 5
+    python -m tools.label_box.benchmark -o bench_new.json --compare bench_old.json
+
+在临时目录生成合成 .pld（GBK 文本、*PO* 条码、SN 串、目的库房字段）与配货表工作簿
+（四张配货表 + 拆1/拆2 + 箱唛表），分阶段计时 core.py 的热点函数，结果以 JSON 输出，
+便于不同版本之间对比回归。
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from openpyxl import Workbook
+from openpyxl.styles import Font
+
+try:
+    from . import core
+except ImportError:
+    import core
+
+BENCH_SCHEMA = 1
+SHOP_DIRS = ["外星人", "三只梨", "兽", "兽无人机"]
+DATA_SHEETS = ["外仓库配货表", "梨配货表", "兽仓库配货表", "兽无人机拆1", "兽无人机拆2", "兽无人机仓库配货表总"]
+DEPOTS = {
+    "北京": "北京亚一-CHN", "上海": "上海亚一-CHN", "广州": "广州东莞1号库-CHN", "成都": "成都亚一-CHN",
+    "武汉": "武汉亚一-CHN", "沈阳": "沈阳亚一-CHN", "西安": "西安亚一-CHN", "德州": "德州亚一-CHN",
+}
+PLD_HEADER = (b"-" * 33 + b"\r\nLabelShop Document\r\nfor PosteK7 8.27.10 Build 1339\r\n"
+              b"http://www.LabelShop.com.cn\r\n" + b"-" * 33 + b"\r\n")
+
+# ===================== 合成数据 =====================
+
+def synth_pld_bytes(rng: random.Random, fields: list, size: int) -> bytes:
+    """按 LabelShop 文件的大致结构拼出 .pld：文件头 + 若干 CVariable 块（随机填充 + 字段文本），补齐到 size 字节"""
+    parts = [PLD_HEADER]
+    for text in fields:
+        parts += [b"CVariable", rng.randbytes(rng.randint(16, 96)), b"\x00",
+                  text.encode("gbk") if isinstance(text, str) else text, b"\x00"]
+    body = b"".join(parts)
+    if len(body) < size:
+        body += rng.randbytes(size - len(body))
+    return body
+
+def label_fields(rng: random.Random, stem: str, mmdd: str) -> list:
+    po = rng.randint(300_000_000, 399_999_999)
+    return [
+        "商品名称", stem, "SN序列号", f"SN2025{mmdd}{rng.randint(0, 999):03d}",
+        "日期", mmdd, f"*{po}*", "Input:", "0123456789",
+    ]
+
+def box_fields(rng: random.Random, city: str) -> list:
+    return [
+        "采购单号", f"*{rng.randint(100_000_000, 999_999_999)}*", "Input:", "1234567890",
+        "商家名称", "stsnb", "箱唛序号", "1",
+        "目的库房", "：", DEPOTS[city].replace("-CHN", ""), "-CHN", "目的城市", core.CITY_META[city]["combined"],
+    ]
+
+def make_template_tree(root: Path, rng: random.Random, n_templates: int, pld_size: int, mmdd: str = "0918"):
+    """生成 标签模板/3C标签（按店铺分子目录）与 箱唛模板/3C箱唛；返回 (标签目录, 箱唛目录, 模板编号列表)"""
+    label_dir = root / "标签模板" / "3C标签"
+    box_dir = root / "箱唛模板" / "3C箱唛"
+    stems = []
+    for i in range(n_templates):
+        stem = f"{i + 1}.JD-{rng.randint(10000, 99999)}{rng.choice(['', '+', '蓝', '+1'])}"
+        shop = rng.choice(SHOP_DIRS)
+        # 约三成模板带店铺前缀，覆盖 candidate_filenames 的前缀分支
+        name = f"{shop}{stem}" if rng.random() < 0.3 else stem
+        d = label_dir / shop
+        d.mkdir(parents=True, exist_ok=True)
+        (d / f"{name}.pld").write_bytes(synth_pld_bytes(rng, label_fields(rng, stem, mmdd), pld_size))
+        stems.append(stem)
+    box_dir.mkdir(parents=True, exist_ok=True)
+    for i, city in enumerate(core.CITY_KEYS, start=1):
+        (box_dir / f"{i}.{city}箱唛.pld").write_bytes(synth_pld_bytes(rng, box_fields(rng, city), pld_size))
+    backdate_dirs(root)
+    return label_dir, box_dir, stems
+
+def backdate_dirs(root: Path, age_ns: int = 10 * core.MTIME_RACY_NS):
+    """
+    把 root 及其下所有目录的 mtime 调早 age_ns：刚生成的目录落在模板索引缓存的“mtime 不可信”窗口
+    （core.MTIME_RACY_NS）内，热缓存计时会退化为每次全量重扫，测不到真实的缓存命中路径。
+    """
+    ts = time.time_ns() - age_ns
+    for d in [root, *(p for p in root.rglob("*") if p.is_dir())]:
+        os.utime(d, ns=(ts, ts))
+
+def make_workbook(path: Path, rng: random.Random, stems: list, n_rows: int, n_boxes: int, mmdd: str = "0918"):
+    """生成配货表：六张数据表（A=商品编号 E=编号 G-N=城市数量）+ 箱唛表（含隐藏行）"""
+    wb = Workbook()
+    wb.remove(wb.active)
+    for sheet in DATA_SHEETS:
+        ws = wb.create_sheet(sheet)
+        ws.append(["商品编号", "3C", "名称", "SN", "编号", "备注"] + core.CITY_KEYS)
+        for r in range(n_rows):
+            roll = rng.random()
+            if roll < 0.85:
+                e = rng.choice(stems).split(".", 1)[-1]
+            elif roll < 0.9:
+                e = "售止" + rng.choice(stems).split(".", 1)[-1]
+            elif roll < 0.95:
+                e = "螺旋桨"
+            else:
+                e = f"{rng.randint(1, 999)}不存在"
+            ws.append([str(100_000_000_000 + rng.randint(0, n_rows * 2)), None, None,
+                       f"SN2025{mmdd}{r % 1000:03d}", e, None]
+                      + [rng.choice([0, 0, 1, 3]) for _ in core.CITY_KEYS])
+            if sheet == "兽无人机拆2" and r % 5 == 0:
+                ws.cell(ws.max_row, 5).font = Font(color="FFFF0000")
+        ws.append(["合计"])
+    ws = wb.create_sheet("箱唛")
+    ws.append(["兽无人机 店箱唛"])
+    for i in range(n_boxes):
+        city = rng.choice(core.CITY_KEYS)
+        ws.append([f"目的地：{city}", f"序号{i + 1}"])
+        ws.append(["供应商简码", "ABC12"])
+        ws.append(["采购单号", str(rng.randint(100_000_000, 999_999_999))])
+        ws.append(["目的库房", DEPOTS[city]])
+        ws.append([])
+        if i % 10 == 9:
+            # 隐藏的作废箱：parse_entries 应跳过
+            ws.append([f"目的地：{city}", "作废"])
+            ws.row_dimensions[ws.max_row].hidden = True
+    wb.save(path)
+
+# ===================== 计时 =====================
+
+def timed(fn, repeat: int):
+    """运行 repeat 次，返回 (每次耗时秒数列表, 最后一次结果)"""
+    samples, result = [], None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - t0)
+    return samples, result
+
+def stage_record(samples: list, n_items: int) -> dict:
+    best = min(samples)
+    return {
+        "n": n_items,
+        "runs": len(samples),
+        "best_ms": round(best * 1000, 3),
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "per_item_us": round(best * 1e6 / n_items, 3) if n_items else None,
+    }
+
+def run_benchmark(work_dir: Path, n_templates: int = 300, n_rows: int = 200, n_boxes: int = 40,
+                  pld_size: int = 4096, repeat: int = 3, seed: int = 20250918, callback=None) -> dict:
+    def log(msg):
+        if callback:
+            callback(msg)
+
+    rng = random.Random(seed)
+    label_dir, box_dir, stems = make_template_tree(work_dir / "templates", rng, n_templates, pld_size)
+    wb_path = work_dir / "配货表.xlsx"
+    make_workbook(wb_path, rng, stems, n_rows, n_boxes)
+    log(f"合成数据：{n_templates} 个标签模板，{len(DATA_SHEETS)} 张表 × {n_rows} 行，{n_boxes} 个箱唛")
+
+    results = {}
+
+    def record(stage, samples, n_items):
+        results[stage] = stage_record(samples, n_items)
+        log(f"  {stage:<28} best {results[stage]['best_ms']:>10.3f} ms  (n={n_items})")
+
+    samples, _ = timed(lambda: core.WorkbookSource(wb_path).close(), repeat)
+    record("load_workbook_stream", samples, 1)
+    def load_full():
+        with core.WorkbookSource(wb_path) as source:
+            return source.full()
+    samples, _ = timed(load_full, repeat)
+    record("load_workbook_full", samples, 1)
+
+    cache_path = core.pld_index_cache_path(label_dir)
+    def cold_index():
+        cache_path.unlink(missing_ok=True)
+        return core.build_pld_index(label_dir, use_cache=False)
+    samples, (pld_index, pld_entries) = timed(cold_index, repeat)
+    record("build_pld_index_cold", samples, len(pld_index))
+    core.build_pld_index(label_dir, use_cache=True)
+    samples, _ = timed(lambda: core.build_pld_index(label_dir, use_cache=True), repeat)
+    record("build_pld_index_cached", samples, len(pld_index))
+
+    with core.WorkbookSource(wb_path) as source:
+        wb = source.stream
+        sheet_name_map = core.resolve_sheet_names(wb)
+        sheet_rows = [(exp, core.read_id_sku_e_from_sheet(wb, real)) for exp, real in sheet_name_map.items() if real]
+
+        def match_all():
+            # 与主流程一致：解析器查找，未命中再按数字前缀兜底
+            resolver = core.TemplateResolver(pld_index, pld_entries)
+            n_found = 0
+            for exp_sheet, rows in sheet_rows:
+                for raw_id, sku, e_txt, _row in rows:
+                    found, _cands, _forced = resolver.resolve(exp_sheet, raw_id, sku=sku, e_txt=e_txt)
+                    if not found:
+                        num_pref = core.numeric_prefix(raw_id)
+                        if num_pref:
+                            found = core.fallback_by_number_prefix(pld_entries, num_pref, exp_sheet)
+                    n_found += len(found)
+            return n_found
+        n_match_rows = sum(len(rows) for _, rows in sheet_rows)
+        samples, _ = timed(match_all, repeat)
+        record("match_templates", samples, n_match_rows)
+
+        res_out = work_dir / "out" / "预定表.xlsx"
+        res_out.parent.mkdir(parents=True, exist_ok=True)
+        samples, _ = timed(lambda: core.generate_reservation_table(wb, sheet_name_map, res_out), repeat)
+        record("generate_reservation_table", samples, n_rows * 4)
+
+        ws_box = core.find_box_sheet(source.stream)
+        samples, entries = timed(lambda: core.parse_entries(ws_box, source), repeat)
+        record("parse_entries", samples, ws_box.max_row)
+
+    # 日期批改：在副本上交替改写两个日期，保证每次都真正写盘
+    patch_dir = work_dir / "patch"
+    shutil.copytree(label_dir, patch_dir)
+    targets = sorted(patch_dir.rglob("*.pld"))
+    mmdd = ["0918"]
+    def patch_all():
+        mmdd[0] = "1231" if mmdd[0] == "0918" else "0918"
+        return [core.process_pld_file(p, mmdd[0], False, False) for p in targets]
+    samples, patched = timed(patch_all, repeat)
+    record("process_pld_file", samples, len(targets))
+
+    box_out = work_dir / "out" / "箱唛"
+    jobs = []
+    for i, ent in enumerate(entries):
+        tpl = core.find_city_template(box_dir, ent["city"])
+        if tpl:
+            jobs.append((tpl, box_out / f"{i}-{tpl.name}", ent))
+    samples, _ = timed(lambda: [core.patch_pld_with_entry(tpl, out, ent) for tpl, out, ent in jobs], repeat)
+    record("patch_pld_with_entry", samples, len(jobs))
+
+    # 单条箱唛改写的纯计算开销（模板已在内存，不含读写盘），衡量定位/替换本身
+    tpl_bytes = {tpl: tpl.read_bytes() for tpl, _, _ in jobs}
+    samples, _ = timed(lambda: [core._patch_box_buffer(core._BoxMarkBuffer(tpl_bytes[tpl]), ent)
+                                for tpl, _, ent in jobs], repeat)
+    record("patch_box_buffer", samples, len(jobs))
+
+    def patch_cached():
+        patcher = core.BoxMarkPatcher()
+        return [patcher.patch(tpl, out, ent) for tpl, out, ent in jobs]
+    samples, _ = timed(patch_cached, repeat)
+    record("box_mark_patcher", samples, len(jobs))
+
+    return results
+
+def compare_results(old: dict, new: dict, threshold: float = 0.10) -> list:
+    """按阶段对比 best_ms，返回可读行；变慢超过 threshold 的阶段以 ! 标出"""
+    lines = []
+    old_stages = old.get("results", {})
+    for stage, rec in new.get("results", {}).items():
+        prev = old_stages.get(stage)
+        if not prev or not prev.get("best_ms"):
+            lines.append(f"  {stage:<28} {rec['best_ms']:>10.3f} ms  （旧结果无此阶段）")
+            continue
+        ratio = rec["best_ms"] / prev["best_ms"]
+        flag = "!" if ratio > 1 + threshold else " "
+        lines.append(f"{flag} {stage:<28} {prev['best_ms']:>10.3f} → {rec['best_ms']:>10.3f} ms  ×{ratio:.2f}")
+    return lines
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m tools.label_box.benchmark",
+                                     description="标签箱唛性能基准：合成模板与配货表，分阶段计时，输出 JSON")
+    parser.add_argument("--templates", type=int, default=300, help="标签模板数量")
+    parser.add_argument("--rows", type=int, default=200, help="每张配货表的数据行数")
+    parser.add_argument("--boxes", type=int, default=40, help="箱唛表中的箱数")
+    parser.add_argument("--pld-size", type=int, default=4096, help="每个合成 .pld 的字节数")
+    parser.add_argument("--repeat", type=int, default=3, help="每个阶段重复次数（取最好成绩）")
+    parser.add_argument("--seed", type=int, default=20250918, help="随机种子（相同种子生成相同数据）")
+    parser.add_argument("-o", "--output", default=None, help="结果 JSON 保存路径（默认只输出到 stdout）")
+    parser.add_argument("--compare", default=None, help="与之前保存的结果 JSON 对比")
+    parser.add_argument("--keep", action="store_true", help="保留合成数据目录")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    def log(msg):
+        print(msg, file=sys.stderr, flush=True)
+
+    work_dir = Path(tempfile.mkdtemp(prefix="label_box_bench_"))
+    try:
+        # generate_reservation_table 等会 print 调试信息，运行期间转到 stderr，保证 stdout 只有 JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            results = run_benchmark(work_dir, n_templates=args.templates, n_rows=args.rows, n_boxes=args.boxes,
+                                    pld_size=args.pld_size, repeat=args.repeat, seed=args.seed, callback=log)
+    finally:
+        if args.keep:
+            log(f"合成数据保留在：{work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "schema": BENCH_SCHEMA,
+        "core_version": core.VERSION,
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {"templates": args.templates, "rows": args.rows, "boxes": args.boxes,
+                   "pld_size": args.pld_size, "repeat": args.repeat, "seed": args.seed},
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+        log(f"结果已保存：{args.output}")
+    print(text, flush=True)
+
+    if args.compare:
+        old = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if old.get("params") != report["params"]:
+            log("注意：两次基准参数不同，对比仅供参考")
+        log(f"对比 {args.compare}（{old.get('core_version', '?')}）：")
+        for line in compare_results(old, report):
+            log(line)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
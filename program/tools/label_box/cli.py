@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+标签箱唛 命令行/批处理入口（无界面）
+
+用法（在 program 目录下）：
+    python -m tools.label_box 配货表1.xlsx 配货表2.xlsx
+    python -m tools.label_box "D:/订单/1028/*.xlsx" --output-mode label --workers 0 --zip
+    python -m tools.label_box 配货表.xlsx --type 3c --shops 外星人玩具,三只梨 -o D:/输出
+    python -m tools.label_box --watch D:/配货表收件箱 -o D:/输出 --zip（常驻监视，见 watch.py）
+
+同一进程内的多个工作簿共用模板索引；结果以 JSON 输出到 stdout，处理日志输出到 stderr。
+"""
+import argparse
+import glob
+import json
+import sys
+from pathlib import Path
+
+try:
+    from . import wrapper
+except ImportError:
+    import wrapper
+
+EXCEL_SUFFIXES = {".xlsx", ".xlsm", ".xltx", ".xltm"}
+
+
+def expand_workbooks(patterns):
+    """展开文件/通配符参数（Windows 命令行不会替我们展开），去重保序并跳过 Excel 锁文件"""
+    paths, seen = [], set()
+    for pat in patterns:
+        hits = sorted(glob.glob(pat)) if glob.has_magic(pat) else [pat]
+        for h in hits:
+            p = Path(h)
+            if p.name.startswith("~$") or p.suffix.lower() not in EXCEL_SUFFIXES:
+                continue
+            key = str(p.resolve())
+            if key not in seen:
+                seen.add(key)
+                paths.append(p)
+    return paths
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m tools.label_box",
+        description="标签箱唛批处理：按配货表生成标签/箱唛，结果以 JSON 输出",
+    )
+    parser.add_argument("workbooks", nargs="*", help="配货表文件或通配符（如 *.xlsx）")
+    parser.add_argument("-o", "--output", default=None, help="输出目录（默认系统下载文件夹）")
+    parser.add_argument("--type", dest="type_mode", choices=["auto", "3c", "toy"], default="auto",
+                        help="类型：auto=按 B1 自动识别，3c/toy=强制")
+    parser.add_argument("--output-mode", choices=["both", "label", "box", "reservation"], default="both",
+                        help="输出内容：标签+箱唛 / 仅标签 / 仅箱唛 / 仅预定表")
+    parser.add_argument("--shops", default="", help="只处理这些店铺文件夹，逗号分隔（如 外星人玩具,三只梨）")
+    parser.add_argument("--zip", action="store_true", help="完成后打包 ZIP")
+    parser.add_argument("--zip-level", type=int, choices=range(10), default=6, metavar="0-9",
+                        help="ZIP 压缩级别（0=仅存储，默认 6）")
+    parser.add_argument("--zip-threads", type=int, default=1, help="ZIP 压缩线程数（默认 1）")
+    parser.add_argument("--workers", type=int, default=1, help="日期批改进程数（1=串行，0=按CPU核数）")
+    parser.add_argument("--full", action="store_true", help="忽略输出清单，全部重新生成（默认跳过上次已生成且未变动的文件）")
+    parser.add_argument("--quiet", action="store_true", help="不输出处理日志，只输出 JSON 结果")
+    watch = parser.add_argument_group("监视模式")
+    watch.add_argument("--watch", metavar="收件箱", default=None,
+                       help="常驻监视该目录，自动处理放入的配货表（每个工作簿输出一行 JSON）")
+    watch.add_argument("--jobs", type=int, default=1, help="同时处理的工作簿数（默认 1）")
+    watch.add_argument("--poll", type=float, default=2.0, help="轮询间隔秒数（默认 2）")
+    watch.add_argument("--settle", type=float, default=2.0, help="文件最后修改后需静置的秒数（默认 2）")
+    return parser
+
+
+def run_batch(workbooks, output=None, type_mode="auto", output_mode="both", shops=None,
+              create_zip=False, workers=1, incremental=True, zip_level=6, zip_threads=1, callback=None):
+    """依次处理多个工作簿，模板索引在整批内复用；返回 [{"workbook": 路径, "result": 结果字典}, ...]"""
+    index_cache = {}
+    results = []
+    for wb_path in workbooks:
+        if callback:
+            callback(f"\n##### {wb_path} #####")
+        try:
+            result = wrapper.process_excel_file(
+                str(wb_path), output_base=output, callback=callback,
+                type_mode=type_mode, output_mode=output_mode, create_zip=create_zip,
+                selected_shops=shops or None, workers=workers, index_cache=index_cache,
+                incremental=incremental, zip_level=zip_level, zip_threads=zip_threads,
+            )
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        results.append({"workbook": str(wb_path), "result": result})
+    return results
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    def log(msg):
+        print(msg, file=sys.stderr, flush=True)
+
+    shops = [s.strip() for s in args.shops.split(",") if s.strip()]
+    if args.watch:
+        try:
+            from . import watch
+        except ImportError:
+            import watch
+        return watch.run_watch(
+            args.watch, output=args.output, jobs=args.jobs, poll=args.poll, settle=args.settle,
+            callback=(lambda msg: None) if args.quiet else log,
+            type_mode=args.type_mode, output_mode=args.output_mode, selected_shops=shops or None,
+            create_zip=args.zip, workers=args.workers, incremental=not args.full,
+            zip_level=args.zip_level, zip_threads=args.zip_threads,
+        )
+
+    workbooks = expand_workbooks(args.workbooks)
+    if not workbooks:
+        print(json.dumps({"success": False, "error": "未找到任何 Excel 工作簿", "results": []},
+                         ensure_ascii=False), flush=True)
+        return 2
+
+    results = run_batch(
+        workbooks, output=args.output, type_mode=args.type_mode, output_mode=args.output_mode,
+        shops=shops, create_zip=args.zip, workers=args.workers, incremental=not args.full,
+        zip_level=args.zip_level, zip_threads=args.zip_threads,
+        callback=(lambda msg: None) if args.quiet else log,
+    )
+    ok = all(r["result"].get("success") for r in results)
+    print(json.dumps({"success": ok, "results": results}, ensure_ascii=False, indent=2, default=str), flush=True)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,8 +12,14 @@
 - 标签拷贝、.pld 日期批改、箱唛批处理等
 """
 
-import re, sys, traceback, shutil, os, datetime
+import re, sys, traceback, shutil, os, datetime, importlib, fnmatch, hashlib, json, mmap, struct, threading, time, zipfile, zlib
+from collections import deque
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime as dt
+from functools import lru_cache
+from itertools import repeat
 from pathlib import Path
 
 # ---------- GUI ----------
@@ -40,20 +46,16 @@ VERSION = "v2025-09-02-merge-LB-BOX-gz-safe-logsdir+propeller-map+use-拆1+patch
 def strip_norm(s: str) -> str:
     return (s or "").strip()
 
+# 全角→半角：U+3000 → 空格，U+FF01..U+FF5E → U+0021..U+007E
+HALFWIDTH_TABLE = {0x3000: " ", **{code: code - 0xFEE0 for code in range(0xFF01, 0xFF5F)}}
+
 def to_halfwidth(s: str) -> str:
-    res = []
-    for ch in str(s):
-        code = ord(ch)
-        if code == 0x3000:
-            res.append(" ")
-        elif 0xFF01 <= code <= 0xFF5E:
-            res.append(chr(code - 0xFEE0))
-        else:
-            res.append(ch)
-    return "".join(res)
+    return str(s).translate(HALFWIDTH_TABLE)
+
+FOUR_DIGITS_RE = re.compile(r"\d{4}")
 
 def looks_like_mmdd(s4: str) -> bool:
-    if not re.fullmatch(r"\d{4}", s4): return False
+    if not FOUR_DIGITS_RE.fullmatch(s4): return False
     mm = int(s4[:2]); dd = int(s4[2:])
     return 1 <= mm <= 12 and 1 <= dd <= 31
 
@@ -85,6 +87,34 @@ def choose_workbook(initial_dir: Path) -> Path:
         raise RuntimeError("未选择 Excel 文件。")
     return Path(file_path)
 
+class WorkbookSource:
+    """
+    配货表工作簿加载层：每个工作簿只打开一次，类型检查与主流程共用。
+
+    - stream：read_only 流式模式，供数据表读取（编号/SKU、B1、SN 日期、预定表、箱唛表），不解析隐藏表
+    - full()：按需完整加载，仅供只读模式拿不到的信息（字体颜色），最多加载一次
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.stream = load_workbook(filename=str(self.path), read_only=True, data_only=True)
+        self._full = None
+
+    def full(self):
+        if self._full is None:
+            self._full = load_workbook(filename=str(self.path), data_only=True)
+        return self._full
+
+    def close(self):
+        # 只读模式会一直占用文件句柄（Windows 下文件被锁），用完必须关闭
+        self.stream.close()
+        self._full = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
 def resolve_sheet_names(wb) -> dict:
     mapping = {}
     names = wb.sheetnames
@@ -108,10 +138,11 @@ def resolve_sheet_names(wb) -> dict:
 def read_id_sku_e_from_sheet(wb, real_sheet_name: str, id_col: int = 5, sku_col: int = 1, e_col: int = 5, start_row: int = 2):
     ws = wb[real_sheet_name]
     rows, seen = [], set()
-    for row_num, r in enumerate(ws.iter_rows(min_row=start_row), start=start_row):
-        idv = r[id_col - 1].value
-        skuv = r[sku_col - 1].value
-        e_val = r[e_col - 1].value
+    max_col = max(id_col, sku_col, e_col)
+    for row_num, r in enumerate(ws.iter_rows(min_row=start_row, max_col=max_col, values_only=True), start=start_row):
+        idv = r[id_col - 1]
+        skuv = r[sku_col - 1]
+        e_val = r[e_col - 1]
         if idv is None and skuv is None and e_val is None:
             continue
         idstr = str(idv).strip() if idv is not None else ""
@@ -153,11 +184,8 @@ def extract_mmdd_from_sn(sn: str):
             return sub
     return extract_mmdd_from_text_window(s)
 
-DATE_SRC_NOTE = ""
-
-def extract_date_tag_from_wb(wb, sheet_name_map: dict) -> str:
-    """遍历核心表 D 列(SN) 提取 MMDD；找不到回退当天。"""
-    global DATE_SRC_NOTE
+def extract_date_tag_and_note(wb, sheet_name_map: dict):
+    """遍历核心表 D 列(SN) 提取 MMDD；找不到回退当天。返回 (mmdd, 日期来源说明)，不依赖全局状态（可多线程并发调用）"""
     for exp in EXPECTED_SHEETS:
         real = sheet_name_map.get(exp)
         if not real: continue
@@ -167,11 +195,13 @@ def extract_date_tag_from_wb(wb, sheet_name_map: dict) -> str:
             if cell is None: continue
             mmdd = extract_mmdd_from_sn(str(cell))
             if mmdd:
-                DATE_SRC_NOTE = f"{real} 第{idx}行 D 列：{cell} → {mmdd}"
-                return mmdd
+                return mmdd, f"{real} 第{idx}行 D 列：{cell} → {mmdd}"
     mmdd_fallback = datetime.date.today().strftime("%m%d")
-    DATE_SRC_NOTE = f"未在 D 列 SN 中找到，回退当天：{mmdd_fallback}"
-    return mmdd_fallback
+    return mmdd_fallback, f"未在 D 列 SN 中找到，回退当天：{mmdd_fallback}"
+
+def extract_date_tag_from_wb(wb, sheet_name_map: dict) -> str:
+    """遍历核心表 D 列(SN) 提取 MMDD；找不到回退当天。"""
+    return extract_date_tag_and_note(wb, sheet_name_map)[0]
 
 def _has_3c_token(text: str) -> bool:
     s = to_halfwidth(text or "").lower()
@@ -225,15 +255,19 @@ def sheet_prefix_of(sheet: str) -> str:
         "兽无人机拆1": "兽无人机",
     }.get(sheet, "")
 
+# 编号清洗规则（预编译，供 build_variants / TemplateResolver 共用）
+PROPELLER_TYPO_FIXES = (("螺旋奖","螺旋桨"), ("螺施桨","螺旋桨"), ("螺桨","螺旋桨"))
+TAIL_PLUS_NUM_RE = re.compile(r"\+\d+$")
+
 def build_variants(raw_id: str):
     def normalize_basic(raw: str):
         s0=str(raw); s=s0
         if "售止" in s: s=s.replace("售止","")
         s=to_halfwidth(s).strip().replace(" ","")
-        for k,v in {"螺旋奖":"螺旋桨","螺施桨":"螺旋桨","螺桨":"螺旋桨"}.items():
+        for k,v in PROPELLER_TYPO_FIXES:
             s=s.replace(k,v)
         return s
-    def strip_tail_plus_num(s: str): return re.sub(r"\+\d+$","",s)
+    def strip_tail_plus_num(s: str): return TAIL_PLUS_NUM_RE.sub("",s)
     def remove_all_plus(s: str): return s.replace("+","")
     vs, seen=[], set()
     def add(v):
@@ -270,16 +304,130 @@ def candidate_filenames(sheet: str, id_variants: list, forced_names: list = None
             if prefix: add(f"{prefix}{the_id}.pld")
     return cands
 
-def build_pld_index(base_dir: Path):
+# --- 模板索引持久缓存：按目录 mtime 增量复核，只重扫有变动的目录 ---
+PLD_INDEX_CACHE_VERSION = 1
+MTIME_RACY_NS = 2_000_000_000  # 扫描前 2 秒内变动过的目录不信任缓存（FAT/网络盘 mtime 精度）
+
+def pld_index_cache_path(base_dir: Path) -> Path:
+    """缓存放在模板目录旁（而非目录内），避免写缓存本身改变模板根目录的 mtime"""
+    return base_dir.parent / f".{base_dir.name}.pld_index.json"
+
+def _scan_pld_dir(dir_path: str):
+    """列出单个目录：与 rglob("*.pld") 相同的匹配规则与 scandir 顺序，不跟随符号链接目录"""
+    files, subdirs = [], []
+    with os.scandir(dir_path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir() and not entry.is_symlink():
+                    subdirs.append(entry.name)
+                if fnmatch.fnmatch(entry.name, "*.pld") and entry.is_file():
+                    files.append(entry.name)
+            except OSError:
+                continue
+    return files, subdirs
+
+def _tmp_path(path: Path, suffix: str = ".tmp") -> Path:
+    """原子写入用的临时文件名：带进程/线程号，同一目录并发保存（监视模式多线程）互不覆盖"""
+    return path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}{suffix}")
+
+_PATH_LOCKS = {}
+_PATH_LOCKS_GUARD = threading.Lock()
+
+def path_lock(*key) -> threading.Lock:
+    """按 key（如 输出基础目录 + MMDD + 类型）取进程内共享的锁：写同一批输出的任务串行执行"""
+    key = tuple(os.path.normcase(os.path.abspath(k)) if isinstance(k, Path) else k for k in key)
+    with _PATH_LOCKS_GUARD:
+        return _PATH_LOCKS.setdefault(key, threading.Lock())
+
+def _load_pld_index_cache(cache_path: Path) -> dict:
+    try:
+        with cache_path.open("r", encoding="utf-8") as f:
+            cache = json.load(f)
+        if cache.get("version") == PLD_INDEX_CACHE_VERSION:
+            return cache
+    except Exception:
+        pass
+    return {}
+
+def _save_pld_index_cache(cache_path: Path, cache: dict):
+    tmp = _tmp_path(cache_path)
+    try:
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, cache_path)
+    except OSError:
+        pass  # 模板目录只读（安装目录/网络盘权限）时仅本次不缓存
+
+def walk_pld_tree(base_dir: Path, use_cache: bool = True, dir_mtimes: dict = None):
+    """
+    以 rglob 的先序深度优先顺序返回 base_dir 下所有 .pld 路径。
+    use_cache=True 时读取/回写持久缓存：目录 mtime 未变则沿用缓存的文件与子目录列表，
+    只对新增或有变动的目录执行 scandir。
+    传入 dir_mtimes 字典时填入 {相对目录: mtime_ns}，供常驻进程判断索引是否过期。
+    """
+    cache_path = pld_index_cache_path(base_dir)
+    cache = _load_pld_index_cache(cache_path) if use_cache else {}
+    old_dirs = cache.get("dirs", {})
+    trust_before = cache.get("scanned_at_ns", 0) - MTIME_RACY_NS
+    scanned_at_ns = time.time_ns()
+    new_dirs, paths = {}, []
+    rescanned = 0
+    stack = [""]
+    while stack:
+        rel = stack.pop()
+        full = os.path.join(str(base_dir), rel) if rel else str(base_dir)
+        try:
+            mtime = os.stat(full).st_mtime_ns
+        except OSError:
+            continue
+        hit = old_dirs.get(rel)
+        if hit and hit["mtime"] == mtime and mtime < trust_before:
+            files, subdirs = hit["files"], hit["subdirs"]
+        else:
+            try:
+                files, subdirs = _scan_pld_dir(full)
+            except OSError:
+                continue
+            rescanned += 1
+        new_dirs[rel] = {"mtime": mtime, "files": files, "subdirs": subdirs}
+        if dir_mtimes is not None:
+            dir_mtimes[rel] = mtime
+        dir_path = base_dir / rel if rel else base_dir
+        paths.extend(dir_path / name for name in files)
+        stack.extend(f"{rel}/{d}" if rel else d for d in reversed(subdirs))
+    if use_cache and (rescanned or new_dirs.keys() != old_dirs.keys()):
+        _save_pld_index_cache(cache_path, {"version": PLD_INDEX_CACHE_VERSION,
+                                           "scanned_at_ns": scanned_at_ns, "dirs": new_dirs})
+    return paths
+
+class PldEntries(list):
+    """
+    build_pld_index 返回的条目列表 [(stem_lower, name_lower, Path)]，
+    额外带一份按 stem 排序的前缀索引，数字前缀兜底用二分查找代替全表扫描。
+    """
+    def __init__(self, items=()):
+        super().__init__(items)
+        order = sorted(range(len(self)), key=lambda i: self[i][0])
+        self._sorted_stems = [self[i][0] for i in order]
+        self._sorted_pos = order
+
+    def positions_with_prefix(self, prefix: str) -> list:
+        """stem 以 prefix 开头的条目在列表中的下标（未排序）"""
+        if not prefix:
+            return list(range(len(self)))
+        lo = bisect_left(self._sorted_stems, prefix)
+        hi = bisect_left(self._sorted_stems, prefix[:-1] + chr(ord(prefix[-1]) + 1), lo)
+        return self._sorted_pos[lo:hi]
+
+def build_pld_index(base_dir: Path, use_cache: bool = True, dir_mtimes: dict = None):
     idx = {}; entries=[]
-    for p in base_dir.rglob("*.pld"):
-        if p.is_file():
-            name_l = p.name.lower()
-            if name_l not in idx:
-                idx[name_l]=p
-                entries.append((p.stem.lower(), name_l, p))
+    for p in walk_pld_tree(base_dir, use_cache=use_cache, dir_mtimes=dir_mtimes):
+        name_l = p.name.lower()
+        if name_l not in idx:
+            idx[name_l]=p
+            entries.append((p.stem.lower(), name_l, p))
     idx.pop("拷贝结果日志.txt".lower(), None)
-    entries=[e for e in entries if e[1] != "拷贝结果日志.txt".lower()]
+    entries=PldEntries(e for e in entries if e[1] != "拷贝结果日志.txt".lower())
     return idx, entries
 
 def find_matching_templates(index_lower: dict, cand_names: list):
@@ -290,12 +438,20 @@ def find_matching_templates(index_lower: dict, cand_names: list):
             matches.append(p); seen.add(p)
     return matches
 
+NUMERIC_PREFIX_RE = re.compile(r"(\d+)")
+
 def numeric_prefix(s: str) -> str:
-    m = re.match(r"(\d+)", s)
+    m = NUMERIC_PREFIX_RE.match(s)
     return m.group(1) if m else ""
 
 def fallback_by_number_prefix(entries, number_prefix: str, sheet: str):
     prefix_sheet = sheet_prefix_of(sheet).lower()
+    if isinstance(entries, PldEntries):
+        # 两段前缀区间取并集，按原条目顺序输出（与线性扫描命中顺序一致）
+        pos = set(entries.positions_with_prefix(number_prefix))
+        if prefix_sheet:
+            pos.update(entries.positions_with_prefix(prefix_sheet + number_prefix))
+        return [entries[i][2] for i in sorted(pos)]
     hits,seen=[],set()
     for stem_l, name_l, p in entries:
         ok=False
@@ -322,6 +478,9 @@ def find_ascii_spans(data: bytes, min_len: int = 6):
     return spans
 
 KEYWORDS_NEAR_DATE = ("----", "SN", "序列号", "SN序列号", "日期")
+MMDD_TEXT_RE = re.compile(r"(?<!\d)(\d{4})(?!\d)")
+SN_TEXT_RE = re.compile(r'([A-Za-z]{1,10})(\d{10,})')
+MMDD_BYTES_RE = re.compile(rb'(?<![0-9])([0-9]{4})(?![0-9])')
 
 def looks_mmdd_bytes(mm4b: bytes) -> bool:
     try:
@@ -334,7 +493,7 @@ def replace_independent_mmdd_in_block(buf: bytearray, start: int, end: int, new_
     changed=0
     block=buf[start:end+1]
     text=block.decode('latin1', errors='ignore')
-    for m in re.finditer(r"(?<!\d)(\d{4})(?!\d)", text):
+    for m in MMDD_TEXT_RE.finditer(text):
         mm=m.group(1)
         if looks_like_mmdd(mm):
             abs_pos = start + m.start(1)
@@ -348,7 +507,7 @@ def replace_corner_mmdd_in_block(buf: bytearray, start: int, end: int, new_mmdd:
     changed=0
     block=buf[start:end+1]
     text=block.decode('latin1', errors='ignore')
-    for m in re.finditer(r"(?<!\d)(\d{4})(?!\d)", text):
+    for m in MMDD_TEXT_RE.finditer(text):
         mm=m.group(1)
         if looks_like_mmdd(mm):
             abs_pos = start + m.start(1)
@@ -359,7 +518,7 @@ def replace_sn_mmdd_in_block(buf: bytearray, start: int, end: int, new_mmdd: byt
     changed=0
     block=buf[start:end+1]
     text=block.decode('latin1', errors='ignore')
-    for m in re.finditer(r'([A-Za-z]{1,10})(\d{10,})', text):
+    for m in SN_TEXT_RE.finditer(text):
         digits=m.group(2)
         if len(digits) >= 7:
             mmdd_pos_start = len(digits) - 7
@@ -369,25 +528,112 @@ def replace_sn_mmdd_in_block(buf: bytearray, start: int, end: int, new_mmdd: byt
 
 def replace_any_standalone_mmdd_bytes(buf: bytearray, new_mmdd: bytes) -> int:
     changed=0
-    for m in re.finditer(rb'(?<![0-9])([0-9]{4})(?![0-9])', buf):
+    for m in MMDD_BYTES_RE.finditer(buf):
         start=m.start(1)
         if looks_mmdd_bytes(buf[start:start+4]):
             buf[start:start+4]=new_mmdd; changed+=1
     return changed
 
-def process_pld_file(path: Path, new_mmdd: str, dry_run: bool, make_backup: bool) -> dict:
-    data = path.read_bytes()
-    buf = bytearray(data)
-    new_b = new_mmdd.encode('ascii')
-
+def patch_mmdd_multipass(data: bytes, buf: bytearray, new_b: bytes):
+    """原版四遍扫描（逐字节找区段 + 三次区段正则 + 整体字节兜底），作为单遍引擎的对照与兜底"""
     spans = find_ascii_spans(data, min_len=6)
     sn_changes = text_changes = corner_changes = 0
     for (s, e) in spans:
         sn_changes     += replace_sn_mmdd_in_block(buf, s, e, new_b)
         text_changes   += replace_independent_mmdd_in_block(buf, s, e, new_b)
         corner_changes += replace_corner_mmdd_in_block(buf, s, e, new_b)
-
     bytes_changes = replace_any_standalone_mmdd_bytes(buf, new_b)
+    return sn_changes, text_changes, corner_changes, bytes_changes
+
+# --- 单遍扫描引擎：一次找出所有可打印区段，区段内一次正则同时命中 SN 与独立4位 ---
+PRINTABLE_RUN_RE = re.compile(rb"[\x20-\x7e]+")
+SN_OR_MMDD_RE = re.compile(rb"[A-Za-z]{1,10}([0-9]{10,})|(?<![0-9])([0-9]{4})(?![0-9])")
+MMDD_BYTES = frozenset(b"%02d%02d" % (mm, dd) for mm in range(1, 13) for dd in range(1, 32))
+KEYWORDS_NEAR_DATE_BYTES = tuple(k.encode("latin1") for k in KEYWORDS_NEAR_DATE if k.isascii())
+
+def mmdd_edit_offsets(data, new_b: bytes):
+    """
+    单遍完成 SN/关键字/独立4位/字节兜底 四条规则，只读 data（bytes 或只读 mmap），
+    返回 (改写偏移列表, 计数)：每处改写为从偏移起的 4 字节 new_b，各处互不重叠，写入顺序无关。
+    前提：new_b 为4位ASCII数字（改写不改变数字串结构），否则调用方应回退多遍版本。
+    """
+    offsets = []
+    new_looks = new_b in MMDD_BYTES
+    sn_changes = text_changes = corner_changes = bytes_changes = 0
+    for run in PRINTABLE_RUN_RE.finditer(data):
+        s, e = run.span()
+        in_span = (e - s) >= 6
+        for m in SN_OR_MMDD_RE.finditer(data, s, e):
+            d_start = m.start(1)
+            if d_start >= 0:
+                if not in_span: continue
+                a = m.end(1) - 7
+                offsets.append(a); sn_changes += 1
+                continue
+            a = m.start(2)
+            if data[a:a+4] not in MMDD_BYTES: continue
+            offsets.append(a)
+            if not in_span:
+                bytes_changes += 1; continue
+            left = max(s, a - 80); right = min(e, a + 84)
+            if any(data.find(k, left, right) >= 0 for k in KEYWORDS_NEAR_DATE_BYTES):
+                text_changes += 1
+                if new_looks: corner_changes += 1
+            else:
+                corner_changes += 1
+            if new_looks: bytes_changes += 1
+    return offsets, (sn_changes, text_changes, corner_changes, bytes_changes)
+
+def patch_mmdd_single_pass(data: bytes, buf: bytearray, new_b: bytes):
+    """单遍引擎写回 buf，计数与写回结果与 patch_mmdd_multipass 完全一致（前提同 mmdd_edit_offsets）"""
+    offsets, counts = mmdd_edit_offsets(data, new_b)
+    mv = memoryview(buf)
+    for a in offsets:
+        mv[a:a+4] = new_b
+    return counts
+
+def patch_mmdd_buffer(data: bytes, new_mmdd: str):
+    """内存中批改日期，返回 (buf, (SN改, 文本改, 角标改, 字节改))"""
+    buf = bytearray(data)
+    new_b = new_mmdd.encode('ascii')
+    if len(new_b) == 4 and new_b.isdigit():
+        counts = patch_mmdd_single_pass(data, buf, new_b)
+    else:
+        counts = patch_mmdd_multipass(data, buf, new_b)
+    return buf, counts
+
+# --- 大模板（内嵌位图，动辄数 MB）走 mmap：只读映射扫描，不整体读入；改日期是定长改写，直接覆盖改动的字节 ---
+PLD_MMAP_MIN_SIZE = 1 << 20   # 不小于此大小的 .pld 走 mmap；None 关闭
+
+def _pld_mmap_eligible(path: Path, new_b: bytes) -> bool:
+    if PLD_MMAP_MIN_SIZE is None or not (len(new_b) == 4 and new_b.isdigit()):
+        return False
+    try:
+        return os.path.getsize(path) >= max(PLD_MMAP_MIN_SIZE, 1)
+    except OSError:
+        return False  # 读不到交给常规路径报错
+
+def scan_pld_mmap(path: Path, new_b: bytes):
+    """只读映射 path 做单遍扫描，返回 (改写偏移, 计数)"""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return mmdd_edit_offsets(data, new_b)
+
+def write_mmdd_edits(path: Path, offsets: list, new_b: bytes):
+    """在文件原位覆盖改动的 4 字节区段，其余字节不动"""
+    with open(path, "r+b") as f:
+        for a in offsets:
+            f.seek(a)
+            f.write(new_b)
+
+def process_pld_file(path: Path, new_mmdd: str, dry_run: bool, make_backup: bool) -> dict:
+    new_b = new_mmdd.encode('ascii')
+    use_mmap = _pld_mmap_eligible(path, new_b)
+    if use_mmap:
+        offsets, counts = scan_pld_mmap(path, new_b)
+    else:
+        data = path.read_bytes()
+        buf, counts = patch_mmdd_buffer(data, new_mmdd)
+    sn_changes, text_changes, corner_changes, bytes_changes = counts
 
     changed = (sn_changes + text_changes + corner_changes + bytes_changes) > 0
     wrote = False
@@ -396,8 +642,14 @@ def process_pld_file(path: Path, new_mmdd: str, dry_run: bool, make_backup: bool
         if make_backup:
             bak_path = path.with_suffix(path.suffix + ".bak")
             if not bak_path.exists():
-                bak_path.write_bytes(data)
-        path.write_bytes(buf)
+                if use_mmap:
+                    shutil.copyfile(path, bak_path)
+                else:
+                    bak_path.write_bytes(data)
+        if use_mmap:
+            write_mmdd_edits(path, offsets, new_b)
+        else:
+            path.write_bytes(buf)
         wrote = True
 
     return {
@@ -411,24 +663,388 @@ def process_pld_file(path: Path, new_mmdd: str, dry_run: bool, make_backup: bool
         "bak": str(bak_path) if bak_path else ""
     }
 
-def run_patch_step(base_dir: Path, mmdd: str, ext: str = ".pld", dry: bool = False, make_backup: bool = False, report_dir: Path = None):
-    targets = sorted(Path(base_dir).rglob(f"*{ext}"))
-    rows = []
-    tot_sn = tot_text = tot_corner = tot_bytes = tot_files = tot_wrote = 0
-    for p in targets:
+# 进程池子进程需按模块名反序列化本模块函数；wrapper 以 "label_box_core" 名称加载本文件，
+# 因此由 wrapper 将此处改为其自身模块名，子进程启动时先导入它完成注册
+POOL_BOOTSTRAP_MODULE = __name__
+
+def copy_and_patch_file(src: Path, dst: Path, new_mmdd: str, keep_data: bool = False) -> dict:
+    """
+    模板拷贝与日期批改合并：读取模板一次、内存中批改、写入目标一次。
+    结果等价于 shutil.copy2 + process_pld_file（有改动时目标 mtime 为写入时间，无改动时保留模板元数据）。
+    keep_data=True 时结果另带 "data"（写入的字节），供流式打包直接写入 ZIP；"bytes" 为写入的字节数，
+    "read_bytes" 为读取的字节数（mmap 路径扫描与系统拷贝各读一遍模板，带 data 时再读一遍目标）。
+    大模板走 mmap：扫描不读入内存，整文件由系统拷贝，再在目标上原位覆盖改动的字节。
+    """
+    new_b = new_mmdd.encode('ascii')
+    if _pld_mmap_eligible(src, new_b):
+        offsets, counts = scan_pld_mmap(src, new_b)
+        shutil.copyfile(src, dst)
+        if offsets:
+            write_mmdd_edits(dst, offsets, new_b)
+        data = buf = None
+    else:
+        data = src.read_bytes()
+        buf, counts = patch_mmdd_buffer(data, new_mmdd)
+    sn_changes, text_changes, corner_changes, bytes_changes = counts
+    changed = (sn_changes + text_changes + corner_changes + bytes_changes) > 0
+    if data is not None:
+        dst.write_bytes(buf if changed else data)
+    if changed:
+        shutil.copymode(src, dst)
+    else:
+        shutil.copystat(src, dst)
+    res = {
+        "file": str(dst),
+        "src": str(src),
+        "sn_changes": sn_changes,
+        "text_changes": text_changes,
+        "corner_changes": corner_changes,
+        "bytes_changes": bytes_changes,
+        "changed": changed,
+        "wrote": changed,
+        "bak": "",
+        "bytes": len(data) if data is not None else os.path.getsize(dst),
+    }
+    res["read_bytes"] = len(data) if data is not None else 2 * res["bytes"]
+    if keep_data:
+        if data is None:
+            res["data"] = Path(dst).read_bytes()
+            res["read_bytes"] += len(res["data"])
+        else:
+            res["data"] = bytes(buf) if changed else data
+    return res
+
+def copy_and_patch_file_safe(src: Path, dst: Path, new_mmdd: str, keep_data: bool = False) -> dict:
+    try:
+        return copy_and_patch_file(src, dst, new_mmdd, keep_data)
+    except PermissionError:
+        return {"file": str(dst), "src": str(src), "error": "无权访问（可能被占用）"}
+    except Exception as e:
+        return {"file": str(dst), "src": str(src), "error": str(e)}
+
+def _map_chunk(fn, chunk: list) -> list:
+    """进程池任务：一次处理一段参数，减少进程间往返（与 Executor.map 的 chunksize 相同）"""
+    return [fn(*args) for args in chunk]
+
+def _pool_map(fn, arg_lists: tuple, n_items: int, workers: int = 1, io_threads: int = 1) -> list:
+    """
+    按输入顺序返回 fn 的结果：workers>1 用进程池（CPU 并行，<=0 表示按 CPU 核数），
+    否则 io_threads>1 时用线程池重叠磁盘/网络 I/O，都不满足则串行。
+    进程池中途不可用（子进程崩溃/被杀、受限环境）时放弃进程池，已完成的结果保留，只在本进程补跑未完成的部分。
+    """
+    if workers is None or workers <= 0:
+        workers = os.cpu_count() or 1
+    workers = min(workers, n_items)
+    items = list(zip(*arg_lists))
+    results = [None] * n_items
+    todo = range(n_items)
+    if workers > 1:
+        chunksize = max(1, n_items // (workers * 4))
+        chunks = [range(a, min(a + chunksize, n_items)) for a in range(0, n_items, chunksize)]
+        pending = set(range(len(chunks)))
         try:
-            res = process_pld_file(p, mmdd, dry, make_backup)
-            rows.append(res)
-            tot_sn     += res["sn_changes"]
-            tot_text   += res["text_changes"]
-            tot_corner += res["corner_changes"]
-            tot_bytes  += res["bytes_changes"]
-            tot_files  += 1
-            tot_wrote  += 1 if res["wrote"] else 0
-        except PermissionError:
-            rows.append({"file": str(p), "error": "无权访问（可能被占用）"})
-        except Exception as e:
-            rows.append({"file": str(p), "error": str(e)})
+            with ProcessPoolExecutor(max_workers=workers, initializer=importlib.import_module,
+                                     initargs=(POOL_BOOTSTRAP_MODULE,)) as ex:
+                futures = {ex.submit(_map_chunk, fn, [items[i] for i in chunk]): k for k, chunk in enumerate(chunks)}
+                for fut in as_completed(futures):
+                    k = futures[fut]
+                    for i, res in zip(chunks[k], fut.result()):
+                        results[i] = res
+                    pending.discard(k)
+            return results
+        except (BrokenProcessPool, OSError) as e:
+            todo = [i for k in sorted(pending) for i in chunks[k]]
+            print(f"[警告] 进程池不可用，已放弃（{type(e).__name__}: {e}）；"
+                  f"已完成 {n_items - len(todo)} 项，其余 {len(todo)} 项改在本进程执行", file=sys.stderr)
+    run = lambda i: fn(*items[i])
+    io_threads = min(io_threads, len(todo))
+    if io_threads > 1:
+        with ThreadPoolExecutor(max_workers=io_threads) as ex:
+            for i, res in zip(todo, ex.map(run, todo)):
+                results[i] = res
+    else:
+        for i in todo:
+            results[i] = run(i)
+    return results
+
+COPY_IO_THREADS = 8
+
+def copy_patch_files(jobs: list, mmdd: str, workers: int = 1, io_threads: int = COPY_IO_THREADS, keep_data: bool = False) -> list:
+    """
+    批量执行 (src, dst) 拷贝+日期批改，按 jobs 顺序返回结果行（格式同 process_pld_file，另带 src）。
+    workers>1 走进程池；否则用 io_threads 个线程并发读写（模板常在网络盘上）。
+    """
+    args = ([src for src, _ in jobs], [dst for _, dst in jobs], repeat(mmdd), repeat(keep_data))
+    return _pool_map(copy_and_patch_file_safe, args, len(jobs), workers, io_threads)
+
+# --- 输出清单：输出文件 -> 来源模板内容哈希 + 改写参数，重跑时跳过已正确的输出 ---
+OUTPUT_MANIFEST_NAME = ".label_box_manifest.json"
+OUTPUT_MANIFEST_VERSION = 2   # 清单结构或指纹组成变化时递增，旧清单整体作废
+
+def _code_digest() -> str:
+    """改写代码标识：本文件（日期批改、箱唛改写）任何改动都使旧输出的指纹失效；读不到源文件时退回 VERSION"""
+    try:
+        return hashlib.blake2b(Path(__file__).read_bytes(), digest_size=16).hexdigest()
+    except OSError:
+        return VERSION
+
+OUTPUT_CODE_DIGEST = _code_digest()
+
+class OutputManifest:
+    """
+    输出清单（放在输出基础目录下，路径相对该目录记录）。
+
+    每个输出文件记录：指纹（模板内容哈希 + 改写参数 + 改写代码哈希）、写入后的 size/mtime_ns、本次结果。
+    重跑时指纹一致且文件未被改动/删除的输出直接复用记录的结果，只重新生成变动或缺失的文件；
+    中途中断（文件被占用、关闭窗口）时已 save() 的部分下次可直接跳过。
+    模板哈希按 (size, mtime_ns) 缓存在清单里，复跑只需 stat 不必重读模板。
+    同一输出基础目录可能有多个实例（监视模式多线程各处理一个工作簿）：save() 在进程内锁下重读磁盘上的清单，
+    只覆盖本实例改动过的条目后写回，不会丢掉其它实例的记录。
+    """
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.path = self.root / OUTPUT_MANIFEST_NAME
+        self.outputs, self.templates = self._load()
+        self.skipped = 0
+        self.bytes_read = 0    # 计算模板哈希读取的字节数（命中 size/mtime 缓存时不读）
+        self._changed_outputs, self._changed_templates = set(), set()
+
+    def _load(self):
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == OUTPUT_MANIFEST_VERSION:
+                return data.get("outputs", {}), data.get("templates", {})
+        except Exception:
+            pass
+        return {}, {}
+
+    def _rel(self, dst: Path) -> str:
+        try:
+            return Path(dst).relative_to(self.root).as_posix()
+        except ValueError:
+            return Path(dst).as_posix()
+
+    def template_hash(self, src: Path) -> str:
+        st = os.stat(src)
+        key = str(src)
+        hit = self.templates.get(key)
+        if hit and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+            return hit[2]
+        data = Path(src).read_bytes()
+        self.bytes_read += len(data)
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        self.templates[key] = [st.st_size, st.st_mtime_ns, digest]
+        self._changed_templates.add(key)
+        return digest
+
+    def fingerprint(self, src: Path, params) -> str:
+        payload = json.dumps([OUTPUT_CODE_DIGEST, self.template_hash(src), params], ensure_ascii=False, sort_keys=True)
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+    def lookup(self, dst: Path, key: str):
+        """输出已是最新时返回记录的结果，否则返回 None"""
+        rec = self.outputs.get(self._rel(dst))
+        if not rec or rec.get("key") != key:
+            return None
+        try:
+            st = os.stat(dst)
+        except OSError:
+            return None
+        if st.st_size != rec.get("size") or st.st_mtime_ns != rec.get("mtime_ns"):
+            return None
+        self.skipped += 1
+        return rec.get("result")
+
+    def record(self, dst: Path, key: str, result=None):
+        st = os.stat(dst)
+        rel = self._rel(dst)
+        self.outputs[rel] = {"key": key, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "result": result}
+        self._changed_outputs.add(rel)
+
+    def save(self):
+        if not (self._changed_outputs or self._changed_templates):
+            return
+        with path_lock(self.path):
+            # 以磁盘上的最新清单为底，合并本实例改动的条目
+            outputs, templates = self._load()
+            outputs.update({rel: self.outputs[rel] for rel in self._changed_outputs})
+            templates.update({key: self.templates[key] for key in self._changed_templates})
+            # 丢弃已不存在的输出，避免清单无限增长
+            outputs = {rel: rec for rel, rec in outputs.items() if (self.root / rel).exists()}
+            data = {"version": OUTPUT_MANIFEST_VERSION, "outputs": outputs, "templates": templates}
+            tmp = _tmp_path(self.path)
+            try:
+                with tmp.open("w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+                os.replace(tmp, self.path)
+            except OSError:
+                return  # 输出目录只读时仅本次不记录
+            self.outputs, self.templates = outputs, templates
+            self._changed_outputs.clear()
+            self._changed_templates.clear()
+
+def copy_patch_files_incremental(jobs: list, mmdd: str, manifest: OutputManifest = None, workers: int = 1,
+                                 keep_data: bool = False) -> list:
+    """
+    同 copy_patch_files，但先按输出清单跳过已是最新的 (src, dst)，只拷贝批改其余的；
+    跳过的条目返回上次记录的结果行（不带 "data"/"bytes"），报告与全量重跑一致。
+    """
+    if manifest is None:
+        return copy_patch_files(jobs, mmdd, workers=workers, keep_data=keep_data)
+    results, keys, todo = [None] * len(jobs), [None] * len(jobs), []
+    for i, (src, dst) in enumerate(jobs):
+        try:
+            keys[i] = manifest.fingerprint(src, {"mmdd": mmdd})
+        except OSError:
+            todo.append(i)  # 模板读不到：照常拷贝，由拷贝结果报告错误
+            continue
+        prev = manifest.lookup(dst, keys[i])
+        if prev is not None:
+            results[i] = dict(prev, file=str(dst), src=str(src))
+        else:
+            todo.append(i)
+    if todo:
+        for i, res in zip(todo, copy_patch_files([jobs[i] for i in todo], mmdd, workers=workers, keep_data=keep_data)):
+            results[i] = res
+            if keys[i] and "error" not in res:
+                manifest.record(jobs[i][1], keys[i], {k: v for k, v in res.items() if k not in ("data", "bytes", "read_bytes")})
+    return results
+
+# --- 流式 ZIP：输出生成时直接写入压缩包，打包阶段不再重读输出目录 ---
+ZIP_MAX_MEMBERS = 0xFFFF
+ZIP_MAX_OFFSET = 0xFFFFFFFF
+
+def _zip_compress(data: bytes, level: int):
+    """返回 (crc32, 压缩后数据)；level=0 为仅存储，否则为 raw deflate（与 zipfile 的 ZIP_DEFLATED 一致）"""
+    crc = zlib.crc32(data)
+    if not level:
+        return crc, data
+    co = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return crc, co.compress(data) + co.flush()
+
+def _zip_date_time(mtime: float):
+    tt = time.localtime(mtime)[:6]
+    return tt if tt[0] >= 1980 else (1980, 1, 1, 0, 0, 0)
+
+class ZipStreamWriter:
+    """
+    流式 ZIP 写入：成员字节一产生就写入压缩包（先写带进程/线程号的 .part 临时文件，commit() 后改为正式文件名）。
+
+    level=0 仅存储，1-9 为 deflate 级别；threads>1 时在线程池中压缩（zlib 压缩期间释放 GIL），
+    按提交顺序写入，成员顺序与单线程一致。父目录条目自动补齐（与 shutil.make_archive 的结构相同）。
+    不支持 ZIP64：成员数超过 65535 或体积超过 4GB 时报错（标签/箱唛输出远小于此）。
+    未 commit 就 close（中途失败/提前返回）时删除临时文件，不留下半个压缩包。
+    """
+    def __init__(self, path: Path, level: int = 6, threads: int = 1):
+        self.path = Path(path)
+        self.level = level
+        self._part = _tmp_path(self.path, ".part")
+        self._fp = self._part.open("wb")
+        self._central, self._dirs = [], set()
+        self._pending = deque()
+        self._threads = max(1, threads or 1)
+        self._pool = ThreadPoolExecutor(max_workers=self._threads) if self._threads > 1 else None
+        self.count = 0
+        self.bytes_read = 0    # add_file 从磁盘补读的字节数
+
+    def _write_member(self, arcname: str, crc: int, payload: bytes, size: int, method: int, date_time, external_attr: int):
+        if len(self._central) >= ZIP_MAX_MEMBERS or self._fp.tell() + len(payload) > ZIP_MAX_OFFSET:
+            raise ValueError("压缩包过大（超出普通 ZIP 限制），请改用不打包或分批处理")
+        zi = zipfile.ZipInfo(arcname, date_time)
+        zi.compress_type, zi.CRC, zi.compress_size, zi.file_size = method, crc, len(payload), size
+        zi.external_attr = external_attr
+        zi.create_system = 0 if sys.platform == "win32" else 3
+        offset = self._fp.tell()
+        self._fp.write(zi.FileHeader(False))
+        self._fp.write(payload)
+        self._central.append((zi, offset))
+
+    def _add_dirs(self, arcname: str, date_time):
+        parts = arcname.split("/")[:-1]
+        for i in range(1, len(parts) + 1):
+            d = "/".join(parts[:i]) + "/"
+            if d not in self._dirs:
+                self._dirs.add(d)
+                self._write_member(d, 0, b"", 0, zipfile.ZIP_STORED, date_time, (0o40755 << 16) | 0x10)
+
+    def _drain(self, block_until: int):
+        # 按提交顺序写出已压缩完成的成员；队列超过 block_until 时等待队首
+        while self._pending and (len(self._pending) > block_until or self._pending[0][-1].done()):
+            arcname, size, date_time, fut = self._pending.popleft()
+            crc, payload = fut.result()
+            self._add_dirs(arcname, date_time)
+            method = zipfile.ZIP_DEFLATED if self.level else zipfile.ZIP_STORED
+            self._write_member(arcname, crc, payload, size, method, date_time, 0o100644 << 16)
+
+    def add(self, arcname: str, data: bytes, mtime: float = None):
+        date_time = _zip_date_time(time.time() if mtime is None else mtime)
+        arcname = arcname.replace(os.sep, "/")
+        self.count += 1
+        if self._pool is None:
+            crc, payload = _zip_compress(data, self.level)
+            self._add_dirs(arcname, date_time)
+            method = zipfile.ZIP_DEFLATED if self.level else zipfile.ZIP_STORED
+            self._write_member(arcname, crc, payload, len(data), method, date_time, 0o100644 << 16)
+            return
+        self._pending.append((arcname, len(data), date_time, self._pool.submit(_zip_compress, data, self.level)))
+        self._drain(self._threads * 4)
+
+    def add_file(self, path: Path, arcname: str):
+        """补入未在本次生成的文件（如增量模式跳过的输出）"""
+        data = Path(path).read_bytes()
+        self.bytes_read += len(data)
+        self.add(arcname, data, os.stat(path).st_mtime)
+
+    def commit(self) -> Path:
+        self._drain(0)
+        cd_start = self._fp.tell()
+        for zi, offset in self._central:
+            name, flags = zi.filename, zi.flag_bits
+            try:
+                name_b = name.encode("ascii")
+            except UnicodeEncodeError:
+                name_b, flags = name.encode("utf-8"), flags | 0x800
+            dt_ = zi.date_time
+            dosdate = (dt_[0] - 1980) << 9 | dt_[1] << 5 | dt_[2]
+            dostime = dt_[3] << 11 | dt_[4] << 5 | (dt_[5] // 2)
+            self._fp.write(struct.pack(
+                "<4s4B4HL2L5H2L", b"PK\x01\x02", zi.create_version, zi.create_system, zi.extract_version, 0,
+                flags, zi.compress_type, dostime, dosdate, zi.CRC, zi.compress_size, zi.file_size,
+                len(name_b), 0, 0, 0, 0, zi.external_attr, offset))
+            self._fp.write(name_b)
+        cd_end = self._fp.tell()
+        n = len(self._central)
+        self._fp.write(struct.pack("<4s4H2LH", b"PK\x05\x06", 0, 0, n, n, cd_end - cd_start, cd_start, 0))
+        self._fp.close()
+        if self._pool:
+            self._pool.shutdown()
+        os.replace(self._part, self.path)
+        return self.path
+
+    def close(self):
+        """未 commit 时丢弃临时文件"""
+        if self._pool:
+            self._pool.shutdown(cancel_futures=True)
+        if not self._fp.closed:
+            self._fp.close()
+            try:
+                self._part.unlink()
+            except OSError:
+                pass
+
+def format_patch_report(base_dir: Path, mmdd: str, rows: list, dry: bool = False, make_backup: bool = False, report_dir: Path = None):
+    """汇总批改结果行（copy_and_patch_file / process_pld_file 的返回格式），返回 (summary, 报告路径或报告文本)"""
+    tot_sn = tot_text = tot_corner = tot_bytes = tot_files = tot_wrote = 0
+    for res in rows:
+        if "error" in res:
+            continue
+        tot_sn     += res["sn_changes"]
+        tot_text   += res["text_changes"]
+        tot_corner += res["corner_changes"]
+        tot_bytes  += res["bytes_changes"]
+        tot_files  += 1
+        tot_wrote  += 1 if res["wrote"] else 0
     summary = (
         f"目录：{base_dir}\n"
         f"目标MMDD：{mmdd}\n"
@@ -461,6 +1077,126 @@ def run_patch_step(base_dir: Path, mmdd: str, ext: str = ".pld", dry: bool = Fal
         # 不保存文件，只返回报告文本
         return summary, report_text
 
+# --- 运行计时：分阶段耗时 + 计数器，导出 JSON；环境变量 LABEL_BOX_PROFILE=1 时同时用 cProfile 采样 ---
+TIMINGS_NAME = "label_box_timings.json"
+PROFILE_ENV = "LABEL_BOX_PROFILE"
+PROFILE_TOP_N = 40
+# 同一时刻只允许一个 RunTimings 采样（Python 3.12 起 cProfile 全局独占，第二个 enable() 会抛 ValueError）
+_PROFILE_LOCK = threading.Lock()
+
+class RunTimings:
+    """
+    轻量分阶段计时。
+
+    phase(name) 结束上一阶段并开始新阶段，适合顺序执行的流程；同名阶段可多次出现（如逐表循环），
+    汇总时累加耗时与次数。count(key, n) 累加计数（行数、命中/缺失、读写字节等）。
+    profile=None 时按环境变量 LABEL_BOX_PROFILE 决定是否启用 cProfile（只采样当前线程，进程池子进程不计入）；
+    已有其它运行（监视模式多线程）或其它工具在采样时本次不采样，只计时。
+    """
+    def __init__(self, profile=None):
+        self.spans = []        # [阶段名, 开始偏移秒, 耗时秒]
+        self.counters = {}
+        self.started = dt.now()
+        self._t0 = time.perf_counter()
+        self._open = None      # (阶段名, 开始时刻)
+        self._total = None
+        if profile is None:
+            profile = os.environ.get(PROFILE_ENV, "").strip() not in ("", "0")
+        self.profiler = None
+        if profile and _PROFILE_LOCK.acquire(blocking=False):
+            import cProfile
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                self.profiler = profiler
+            except ValueError:
+                _PROFILE_LOCK.release()  # 其它采样工具已启用
+
+    @property
+    def profiling(self) -> bool:
+        return self.profiler is not None
+
+    def _close(self, now: float):
+        if self._open:
+            name, start = self._open
+            self.spans.append([name, start - self._t0, now - start])
+            self._open = None
+
+    def phase(self, name: str):
+        now = time.perf_counter()
+        self._close(now)
+        self._open = (name, now)
+
+    def count(self, key: str, n: int = 1):
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    def finish(self) -> float:
+        """结束当前阶段并停止采样，返回总耗时（秒）；可重复调用"""
+        if self._total is None:
+            now = time.perf_counter()
+            self._close(now)
+            self._total = now - self._t0
+            if self.profiler:
+                self.profiler.disable()
+                _PROFILE_LOCK.release()
+        return self._total
+
+    def stage_totals(self) -> dict:
+        """按阶段名汇总 {阶段名: [累计秒, 次数]}，保持首次出现的顺序"""
+        totals = {}
+        for name, _, sec in self.spans:
+            t = totals.setdefault(name, [0.0, 0])
+            t[0] += sec
+            t[1] += 1
+        return totals
+
+    def to_dict(self) -> dict:
+        total = self.finish()
+        return {
+            "version": VERSION,
+            "started": self.started.strftime("%Y-%m-%d %H:%M:%S"),
+            "total_ms": round(total * 1000, 3),
+            "stages": {name: {"ms": round(sec * 1000, 3), "count": n} for name, (sec, n) in self.stage_totals().items()},
+            "spans": [{"stage": name, "start_ms": round(start * 1000, 3), "ms": round(sec * 1000, 3)}
+                      for name, start, sec in self.spans],
+            "counters": dict(self.counters),
+        }
+
+    def breakdown_lines(self) -> list:
+        total = self.finish()
+        lines = [f"总耗时：{total:.2f} 秒"]
+        for name, (sec, n) in self.stage_totals().items():
+            share = sec / total * 100 if total else 0.0
+            times = f"（{n} 次）" if n > 1 else ""
+            lines.append(f"  {name}：{sec * 1000:.1f} ms  {share:.1f}%{times}")
+        if self.counters:
+            lines.append("  计数：" + "，".join(f"{k}={v}" for k, v in self.counters.items()))
+        return lines
+
+    def save(self, path: Path):
+        """
+        写出 JSON（临时文件 + 替换）；启用采样时同目录另存 .prof（可用 snakeviz/pstats 打开）
+        与按累计耗时排序的文本摘要。返回 JSON 路径，目录不可写时返回 None。
+        """
+        path = Path(path)
+        data = self.to_dict()
+        try:
+            if self.profiler:
+                import io, pstats
+                prof_path = path.with_suffix(".prof")
+                self.profiler.dump_stats(str(prof_path))
+                buf = io.StringIO()
+                pstats.Stats(self.profiler, stream=buf).sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+                path.with_suffix(".prof.txt").write_text(buf.getvalue(), encoding="utf-8")
+                data["profile"] = str(prof_path)
+            tmp = _tmp_path(path)
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, path)
+        except OSError:
+            return None
+        return path
+
 # ===================== 螺旋桨映射（增强版） =====================
 # 导入螺旋桨配置
 try:
@@ -489,6 +1225,8 @@ except ImportError:
         "兽无人机拆2": "兽",
     }
 
+PRODUCT_CODE_RE = re.compile(r'(\d{10,})')
+
 def build_dynamic_propeller_map(pld_index, pld_entries):
     """
     动态构建螺旋桨映射表，自动发现所有螺旋桨相关的PLD文件
@@ -525,11 +1263,11 @@ def build_dynamic_propeller_map(pld_index, pld_entries):
         filename_lower = filename.lower()
         
         # 检查文件名是否包含螺旋桨关键词
-        is_propeller_file = any(keyword in filename for keyword in PROPELLER_KEYWORDS)
+        is_propeller_file = has_keyword(filename, PROPELLER_KEYWORDS)
         
         if is_propeller_file:
             # 模式1: 直接的数字编号 (如: 100181107889螺旋桨.pld)
-            number_match = re.search(r'(\d{10,})', filename)
+            number_match = PRODUCT_CODE_RE.search(filename)
             if number_match:
                 product_code = number_match.group(1)
                 # 只有当 JSON 中没有这个映射时，才使用从文件名提取的
@@ -548,7 +1286,7 @@ def build_dynamic_propeller_map(pld_index, pld_entries):
     
     return dynamic_map
 
-def find_propeller_template(sku_str, raw_id_str, exp_sheet, pld_index, pld_entries):
+def find_propeller_template(sku_str, raw_id_str, exp_sheet, pld_index, pld_entries, dynamic_map=None):
     """
     增强的螺旋桨模板查找函数
     
@@ -558,6 +1296,7 @@ def find_propeller_template(sku_str, raw_id_str, exp_sheet, pld_index, pld_entri
         exp_sheet: 工作表名称
         pld_index: PLD文件索引
         pld_entries: PLD文件条目列表
+        dynamic_map: 已构建的动态映射表（可选，批量查找时复用以免逐行重建）
     
     返回:
         匹配的PLD文件名，如果没找到返回None
@@ -568,7 +1307,8 @@ def find_propeller_template(sku_str, raw_id_str, exp_sheet, pld_index, pld_entri
         return forced_name
     
     # 2. 构建动态映射表
-    dynamic_map = build_dynamic_propeller_map(pld_index, pld_entries)
+    if dynamic_map is None:
+        dynamic_map = build_dynamic_propeller_map(pld_index, pld_entries)
     
     # 3. 尝试商品编号直接匹配
     if sku_str and sku_str in dynamic_map:
@@ -605,9 +1345,242 @@ def find_propeller_template(sku_str, raw_id_str, exp_sheet, pld_index, pld_entri
         
         # 如果没有找到对应店铺的，返回第一个螺旋桨文件
         return propeller_files[0]
-    
+
     return None
 
+# --- 多关键词匹配 + PLD 商品编码提取：整段文本只扫描一两遍，结果按文件内容哈希缓存 ---
+# 关键词编译成单个交替正则，由 re 引擎在 C 层一次扫描；纯 Python 的 Aho–Corasick 逐字符循环反而更慢。
+
+@lru_cache(maxsize=None)
+def keyword_matcher(words: tuple):
+    """匹配任一关键词的预编译模式（长词在前），按关键词元组缓存"""
+    return re.compile("|".join(re.escape(w) for w in sorted(set(words), key=len, reverse=True)))
+
+def has_keyword(text: str, words) -> bool:
+    return keyword_matcher(tuple(words)).search(text) is not None
+
+PRODUCT_CODE_ENCODINGS = ("utf-8", "gbk", "latin1")  # latin1 总能解码，原先排在其后的 cp1252 不会被用到
+
+# 按优先级排列：(类型, 参数, 说明)。"label" 为带标注的正则（只含一个分组），
+# "star"/"run" 为星号包围的 N 位数字 / 任意位置的 N 位数字
+PRODUCT_CODE_RULES = (
+    ("label", r'商品编码[：:]\s*\*?(\d+)\*?', '明确标注的商品编码'),
+    ("label", r'SKU[：:]*\s*\*?(\d+)\*?', 'SKU编码'),
+    ("label", r'sku[：:]*\s*\*?(\d+)\*?', 'SKU编码(小写)'),
+    ("label", r'ID[：:]\s*\*?(\d+)\*?', 'ID编码'),
+    ("label", r'编码[：:]\s*\*?(\d+)\*?', '编码'),
+    ("star", 12, '星号包围的12位数字'),
+    ("star", 11, '星号包围的11位数字'),
+    ("star", 10, '星号包围的10位数字'),
+    ("label", r'(?:sku|SKU)\s+\*?(\d{10,})\*?', '条形码SKU'),
+    ("run", 12, '12位数字'),
+    ("run", 11, '11位数字'),
+    ("run", 10, '10位数字'),
+    ("run", 9, '9位数字'),
+    ("run", 8, '8位数字'),
+)
+PRODUCT_CODE_LABEL_INDEX = tuple(i for i, rule in enumerate(PRODUCT_CODE_RULES) if rule[0] == "label")
+PRODUCT_CODE_LABEL_RE = re.compile("|".join(f"(?:{PRODUCT_CODE_RULES[i][1]})" for i in PRODUCT_CODE_LABEL_INDEX))
+PRODUCT_CODE_STAR_INDEX = {rule[1]: i for i, rule in enumerate(PRODUCT_CODE_RULES) if rule[0] == "star"}
+PRODUCT_CODE_RUN_RULES = tuple((rule[1], i) for i, rule in enumerate(PRODUCT_CODE_RULES) if rule[0] == "run")
+DIGIT_RUN_RE = re.compile(r"\d+")
+
+def extract_product_code(text: str):
+    """
+    返回 (商品编码, 规则说明)，无匹配返回 (None, None)。
+    结果等价于对每条规则分别 findall 后取最长的匹配（同长取规则靠前、位置靠前者）：
+    各标注正则合成一个交替模式扫描一遍（标注之间只有“商品编码/编码”相互包含，合并后取值不变），
+    星号包围与任意位置的 N 位数字都由一遍数字串扫描得出。
+    """
+    best = {}  # 规则序号 -> 该规则首个最长匹配
+    for m in PRODUCT_CODE_LABEL_RE.finditer(text):
+        i = PRODUCT_CODE_LABEL_INDEX[m.lastindex - 1]
+        code = m.group(m.lastindex)
+        if len(code) > len(best.get(i, "")):
+            best[i] = code
+    for m in DIGIT_RUN_RE.finditer(text):
+        run = m.group()
+        n = len(run)
+        for width, i in PRODUCT_CODE_RUN_RULES:
+            if n >= width and i not in best:
+                best[i] = run[:width]
+        i = PRODUCT_CODE_STAR_INDEX.get(n)
+        if i is not None and i not in best and text[m.start() - 1:m.start()] == "*" and text[m.end():m.end() + 1] == "*":
+            best[i] = run
+    if not best:
+        return None, None
+    i = max(sorted(best), key=lambda k: len(best[k]))
+    return best[i], PRODUCT_CODE_RULES[i][2]
+
+def decode_pld_text(data: bytes) -> str:
+    for enc in PRODUCT_CODE_ENCODINGS:
+        try:
+            return data.decode(enc)
+        except UnicodeDecodeError:
+            continue
+    return data.decode("latin1")
+
+def product_code_of_file(path) -> list:
+    """读取一次文件：返回 [size, mtime_ns, 内容哈希, 商品编码或 ""]，供扫描缓存使用"""
+    st = os.stat(path)
+    data = Path(path).read_bytes()
+    code, _ = extract_product_code(decode_pld_text(data))
+    return [st.st_size, st.st_mtime_ns, hashlib.blake2b(data, digest_size=16).hexdigest(), code or ""]
+
+def product_code_of_file_safe(path):
+    try:
+        return product_code_of_file(path)
+    except OSError:
+        return None  # 读不到的文件不提取、不缓存
+
+PROPELLER_CODE_CACHE_VERSION = 1
+
+def propeller_code_cache_path(base_dir: Path) -> Path:
+    return base_dir.parent / f".{base_dir.name}.propeller_codes.json"
+
+def scan_propeller_codes(base_dir: Path, keywords=None, workers: int = 1, io_threads: int = COPY_IO_THREADS):
+    """
+    一次扫描模板树中文件名含螺旋桨关键词的 .pld，提取每个文件的商品编码。
+    返回 (文件名列表, {文件名: 商品编码或 ""})；同名文件以遍历顺序中第一个为准（与 rglob 查找一致）。
+    编码按文件内容哈希缓存在模板目录旁，(size, mtime_ns) 未变的文件不再读取；
+    需要读取的文件按 workers/io_threads 并行提取。
+    """
+    base_dir = Path(base_dir)
+    matcher = keyword_matcher(tuple(keywords or PROPELLER_KEYWORDS))
+    first = {}
+    for p in walk_pld_tree(base_dir):
+        if p.name not in first and matcher.search(p.name):
+            first[p.name] = p
+    cache_path = propeller_code_cache_path(base_dir)
+    cache = {}
+    try:
+        with cache_path.open("r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except Exception:
+        pass
+    if cache.get("version") != PROPELLER_CODE_CACHE_VERSION:
+        cache = {}
+    files, codes_by_hash = cache.get("files", {}), cache.get("codes", {})
+    codes, todo = {}, []
+    for name, p in first.items():
+        rec = files.get(str(p))
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        if rec and rec[0] == st.st_size and rec[1] == st.st_mtime_ns and rec[2] in codes_by_hash:
+            codes[name] = codes_by_hash[rec[2]]
+        else:
+            todo.append(name)
+    if todo:
+        results = _pool_map(product_code_of_file_safe, ([first[n] for n in todo],), len(todo), workers, io_threads)
+        for name, rec in zip(todo, results):
+            if rec is None:
+                continue
+            size, mtime_ns, digest, code = rec
+            files[str(first[name])] = [size, mtime_ns, digest]
+            codes_by_hash[digest] = code
+            codes[name] = code
+        live = {str(p) for p in first.values()}
+        files = {k: v for k, v in files.items() if k in live}
+        codes_by_hash = {d: codes_by_hash[d] for d in {v[2] for v in files.values()} if d in codes_by_hash}
+        tmp = _tmp_path(cache_path)
+        try:
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump({"version": PROPELLER_CODE_CACHE_VERSION, "files": files, "codes": codes_by_hash},
+                          f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, cache_path)
+        except OSError:
+            pass  # 模板目录只读时仅本次不缓存
+    return list(first), codes
+
+class TemplateResolver:
+    """
+    标签模板解析器：一次索引，多次查找。
+
+    对每行的 (工作表, 编号) 生成候选文件名并在索引中查找，结果按 (工作表, 编号) 记忆，
+    四张表中重复出现的 SKU 直接命中缓存；螺旋桨行额外以 A 列商品编号区分，
+    动态螺旋桨映射表只构建一次。hits/misses 统计按行计数，供拷贝日志输出。
+    经 from_dir 构建的解析器记录模板树各目录 mtime，常驻进程复用前用 is_stale 判断是否需要重建。
+    """
+    def __init__(self, pld_index: dict, pld_entries: list):
+        self.pld_index = pld_index
+        self.pld_entries = pld_entries
+        self._memo = {}
+        self._dynamic_map = None
+        self.hits = self.misses = self.memo_hits = 0
+        self.dir_mtimes = None
+        self.built_at_ns = time.time_ns()
+
+    @classmethod
+    def from_dir(cls, base_dir: Path):
+        dir_mtimes = {}
+        built_at_ns = time.time_ns()
+        resolver = cls(*build_pld_index(base_dir, dir_mtimes=dir_mtimes))
+        resolver.dir_mtimes = dir_mtimes
+        resolver.built_at_ns = built_at_ns
+        return resolver
+
+    def is_stale(self, base_dir: Path) -> bool:
+        """
+        模板树有新增/删除/改名时返回 True（只 stat 建索引时记录的目录，不重新列目录）。
+        未记录目录信息，或建索引前后 2 秒内变动过的目录（mtime 精度不足）一律视为过期。
+        """
+        if not self.dir_mtimes:
+            return True
+        trust_before = self.built_at_ns - MTIME_RACY_NS
+        for rel, mtime in self.dir_mtimes.items():
+            try:
+                now = os.stat(os.path.join(str(base_dir), rel) if rel else str(base_dir)).st_mtime_ns
+            except OSError:
+                return True
+            if now != mtime or mtime >= trust_before:
+                return True
+        return False
+
+    def _propeller_name(self, sku_str, raw_id_str, sheet):
+        if self._dynamic_map is None:
+            self._dynamic_map = build_dynamic_propeller_map(self.pld_index, self.pld_entries)
+        return find_propeller_template(sku_str, raw_id_str, sheet, self.pld_index, self.pld_entries,
+                                       dynamic_map=self._dynamic_map)
+
+    def resolve(self, sheet: str, raw_id: str, sku: str = "", e_txt: str = ""):
+        """
+        返回 (found, cand_names, forced_name)：
+        found 为命中的模板路径列表（每次返回新列表，调用方可追加兜底结果），
+        cand_names 为候选文件名，forced_name 为螺旋桨映射得到的文件名（未映射为 None）。
+        """
+        is_propeller = bool(e_txt) and ("螺旋桨" in e_txt)
+        key = (sheet, raw_id, sku if is_propeller else None)
+        hit = self._memo.get(key)
+        if hit is not None:
+            self.memo_hits += 1
+        else:
+            forced_name = self._propeller_name(sku, raw_id, sheet) if is_propeller else None
+            if forced_name:
+                cand_names = candidate_filenames(sheet, [], forced_names=[forced_name])
+            else:
+                cand_names = candidate_filenames(sheet, build_variants(raw_id))
+            found = find_matching_templates(self.pld_index, cand_names)
+            hit = self._memo[key] = (tuple(found), cand_names, forced_name)
+        found, cand_names, forced_name = hit
+        if found: self.hits += 1
+        else: self.misses += 1
+        return list(found), cand_names, forced_name
+
+    def reset_stats(self):
+        """同一进程处理多个工作簿时复用解析器（记忆保留），只清零本次统计"""
+        self.hits = self.misses = self.memo_hits = 0
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "memo_hits": self.memo_hits,
+                "unique_keys": len(self._memo)}
+
+    def stats_line(self) -> str:
+        st = self.stats()
+        return (f"模板解析：命中 {st['hits']} 行，未命中 {st['misses']} 行，"
+                f"缓存复用 {st['memo_hits']} 次（不同编号 {st['unique_keys']} 个）")
+
 # ===================== 箱唛侧工具 =====================
 FW = "\u3000"  # 全角空格 U+3000
 CITY_KEYS = ["北京","上海","广州","成都","武汉","沈阳","西安","德州"]
@@ -655,18 +1628,73 @@ def find_box_sheet(wb):
             return ws
     return visible[0] if visible else None
 
-def iter_visible_rows(ws):
+# 只读工作表的隐藏行快速路径：直接扫描工作表 XML 的 <row> 标签属性与值标签位置（不解析单元格）。
+# 依赖 openpyxl 私有接口 ReadOnlyWorksheet._get_source（requirements 固定 openpyxl==3.1.2，3.1.x 均可用）；
+# 接口缺失或读取失败时回退到公开接口（见 sheet_row_info）。
+ROW_TAG_RE = re.compile(rb"<(?:[A-Za-z_][\w.-]*:)?row\b([^>]*)>")
+ROW_NUM_ATTR_RE = re.compile(rb"\br=\"(\d+)\"")
+ROW_HIDDEN_ATTR_RE = re.compile(rb"\bhidden=\"(?:1|true)\"")
+CELL_VALUE_TAG_RE = re.compile(rb"<(?:[A-Za-z_][\w.-]*:)?(?:v|is)\b")
+
+def _scan_sheet_xml_rows(ws):
+    """快速路径：从只读工作表的 XML 取 (隐藏行号集合, 最后一个含值的行号)；不可用时返回 None"""
+    get_source = getattr(ws, "_get_source", None)
+    if get_source is None:
+        return None
+    try:
+        with get_source() as src:
+            xml = src.read()
+    except Exception:
+        return None
+    last_value_pos = -1
+    for m in CELL_VALUE_TAG_RE.finditer(xml):
+        last_value_pos = m.start()
+    hidden, row_no, last_row = set(), 0, 0
+    for m in ROW_TAG_RE.finditer(xml):
+        attrs = m.group(1)
+        r = ROW_NUM_ATTR_RE.search(attrs)
+        row_no = int(r.group(1)) if r else row_no + 1   # 缺省 r 属性时按顺序递增（与 openpyxl 一致）
+        if ROW_HIDDEN_ATTR_RE.search(attrs):
+            hidden.add(row_no)
+        if m.start() < last_value_pos:
+            last_row = row_no
+    return hidden, last_row
+
+def _hidden_rows(dims) -> set:
+    # 注意：openpyxl 中可见行 often 是 None 或 False；只有 True 才是隐藏
+    return {idx for idx, dim in dims.items() if dim.hidden is True}
+
+def sheet_row_info(ws, source=None):
+    """
+    返回 (隐藏行号集合, 最后一个含值的行号)，供逐行解析前跳过隐藏行、截掉尾部只有格式没有内容的行。
+    完整加载的工作表只遍历已有的行维度记录，不逐行探测，末行取 max_row；
+    只读工作表没有 row_dimensions，先走 XML 快速路径；不可用时末行用 iter_rows(values_only=True) 求得，
+    隐藏行取 source（WorkbookSource）完整加载后同名工作表的 row_dimensions，未给 source 时视为无隐藏行。
+    """
+    dims = getattr(ws, "row_dimensions", None)
+    if dims is not None:
+        return _hidden_rows(dims), ws.max_row
+    info = _scan_sheet_xml_rows(ws)
+    if info is not None:
+        return info
+    last_row = 0
+    for r, raw in enumerate(ws.iter_rows(values_only=True), start=1):
+        if any(v is not None for v in raw):
+            last_row = r
+    hidden = _hidden_rows(source.full()[ws.title].row_dimensions) if source is not None else set()
+    return hidden, last_row
+
+def iter_visible_rows(ws, source=None):
     """只迭代未隐藏的行号"""
+    hidden, _ = sheet_row_info(ws, source)
     for row_idx in range(1, ws.max_row + 1):
-        # 注意：openpyxl 中可见行 often 是 None 或 False；只有 True 才是隐藏
-        if ws.row_dimensions.get(row_idx) and ws.row_dimensions[row_idx].hidden is True:
-            continue
-        yield row_idx
+        if row_idx not in hidden:
+            yield row_idx
 
 def decide_store_subfolder(ws) -> str or None:
     hdr = ""
-    for r in range(1, 4):
-        row_vals = [str(ws.cell(row=r, column=c).value or "") for c in range(1, 5+1)]
+    for row in ws.iter_rows(min_row=1, max_row=3, max_col=5, values_only=True):
+        row_vals = [str(v or "") for v in row]
         hdr += " ".join(row_vals) + " "
     if "店箱唛" in hdr:   # 两店/四店等：不建子目录
         return None
@@ -675,7 +1703,12 @@ def decide_store_subfolder(ws) -> str or None:
             return key
     return None
 
-def parse_entries(ws):
+BOX_NO_RE = re.compile(r"序号\D*(\d{1,3})")
+SUPPLIER_STRIP_RE = re.compile(r"[^A-Za-z0-9_\-\.]")
+PO_DIGITS_RE = re.compile(r"(\d{6,})")
+
+def parse_entries(ws, source=None):
+    """source：ws 所属的 WorkbookSource，只读工作表拿不到隐藏行时用于回退（见 sheet_row_info）"""
     entries, cur = [], None
 
     def commit():
@@ -684,15 +1717,20 @@ def parse_entries(ws):
             entries.append(cur)
         cur = None
 
-    for r in iter_visible_rows(ws):
-        row_vals = [str(ws.cell(r, c).value or "").strip() for c in range(1, 10)]
+    hidden, last_row = sheet_row_info(ws, source)
+    # 一次取出 A:I 整块，读到最后一个含值的行为止；中间的空行直接跳过，不做字符串处理
+    rows = ws.iter_rows(min_row=1, max_row=last_row, max_col=9, values_only=True) if last_row else ()
+    for r, raw in enumerate(rows, start=1):
+        if not any(raw) or r in hidden:
+            continue
+        row_vals = [str(v or "").strip() for v in raw]
         line = " ".join(v for v in row_vals if v)
 
         if "目的地" in line:
             commit()
-            city = next((ck for ck in ["北京","上海","广州","成都","武汉","沈阳","西安","德州"] if ck in line), None)
+            city = next((ck for ck in CITY_KEYS if ck in line), None)
             cur = {"city": city, "po": None, "supplier": None, "depot": None, "no": None}
-            m = re.search(r"序号\D*(\d{1,3})", line)
+            m = BOX_NO_RE.search(line)
             if m: cur["no"] = m.group(1)
             continue
 
@@ -701,11 +1739,11 @@ def parse_entries(ws):
 
         if ("供应商简码" in line) or ("供应商代码" in line) or ("商家名称" in line):
             cand = [t for t in row_vals if t][-1]
-            cur["supplier"] = re.sub(r"[^A-Za-z0-9_\-\.]", "", cand)
+            cur["supplier"] = SUPPLIER_STRIP_RE.sub("", cand)
             continue
 
         if ("采购单号" in line) or ("PO" in line.upper()):
-            m = re.search(r"(\d{6,})", line) or next((re.match(r"(\d{6,})", v) for v in row_vals if re.match(r"(\d{6,})", v)), None)
+            m = PO_DIGITS_RE.search(line) or next((mv for mv in map(PO_DIGITS_RE.match, row_vals) if mv), None)
             if m: cur["po"] = m.group(1)
             continue
 
@@ -830,10 +1868,44 @@ def find_city_template(base_dir: Path, city: str):
             return q
     return None
 
+# ========= 正则/编码登记处：热点函数共用的预编译模式与编码缓存 =============
+# 箱唛改写每条都要定位十几次字段，原先每次调用都重新拼装正则、按三种编码重新编码并转义标签文字；
+# 固定模式在模块加载时编译，带参数的模式与编码结果按参数缓存，调用方只取现成对象。
+
+ASCII_WORD_RE = re.compile(rb"([A-Za-z0-9_\-\.]{1,64})")
+STAR_NUMBER_RE = re.compile(rb"\*([0-9]{6,20})\*")
+SUPPLIER_PLACEHOLDER_RE = re.compile(rb"(?<![A-Za-z0-9])stsnb(?![A-Za-z0-9])")
+LABEL_ENCODINGS = ("gbk", "utf-16le", "utf-8")
+DEPOT_FIELD_STOP_WORDS = ("目的地", "供应商", "采购", "箱唛", "序号")
+
+@lru_cache(maxsize=None)
+def digits_run_re(min_len: int, max_len: int):
+    """前后不接数字的 min_len~max_len 位数字串（bytes 模式）"""
+    return re.compile(rb"(?<!\d)(\d{%d,%d})(?!\d)" % (min_len, max_len))
+
+@lru_cache(maxsize=None)
+def encoded_literal_re(text: str, enc: str = "gbk"):
+    """按指定编码编码后的字面量模式（编码失败的字符忽略，与原先 errors="ignore" 一致）"""
+    return re.compile(re.escape(text.encode(enc, errors="ignore")))
+
+@lru_cache(maxsize=None)
+def city_suffix_re(city: str):
+    """“城市+数字 / 城市-数字”列名（如 北京2、广州-1），整串匹配"""
+    return re.compile(f"^{city}[-]?\\d+$")
+
+@lru_cache(maxsize=4096)
+def ascii_bytes(text: str) -> bytes:
+    return text.encode("ascii", errors="ignore")
+
+# 库房字段向后扫描时按 4 字节前瞻判断是否碰到下一个字段名：三字词（6 字节）永远放不进窗口，
+# 两字词（4 字节）命中即窗口起点，因此只需在区段里找两字词的最早出现位置
+DEPOT_FIELD_STOP_RE = re.compile(b"|".join(
+    re.escape(b) for b in (w.encode("gbk", errors="ignore") for w in DEPOT_FIELD_STOP_WORDS) if len(b) == 4))
+
 # 下面箱唛 patch 逻辑与原版一致（略去注释）
 
 def find_all_digits_regions(buf: bytes, min_len=6, max_len=20):
-    return [m for m in re.finditer(rb"(?<!\d)(\d{%d,%d})(?!\d)" % (min_len, max_len), buf)]
+    return list(digits_run_re(min_len, max_len).finditer(buf))
 
 def replace_region_bytes(buf: bytearray, start: int, old_len: int, new_bytes: bytes):
     if len(new_bytes) == old_len:
@@ -845,10 +1917,9 @@ def replace_region_bytes(buf: bytearray, start: int, old_len: int, new_bytes: by
 
 def search_label_positions(buf: bytes, text: str):
     hits=[]
-    for enc in ("gbk","utf-16le","utf-8"):
+    for enc in LABEL_ENCODINGS:
         try:
-            patt=text.encode(enc,errors="ignore")
-            for m in re.finditer(re.escape(patt), buf):
+            for m in encoded_literal_re(text, enc).finditer(buf):
                 hits.append(m.start())
         except Exception:
             pass
@@ -856,27 +1927,28 @@ def search_label_positions(buf: bytes, text: str):
 
 def find_next_digits_after(buf: bytes, pos: int, max_seek=3000, min_len=1, max_len=20, find_all=False):
     region = buf[pos:pos+max_seek]
+    pattern = digits_run_re(min_len, max_len)
     if not find_all:
-        m = re.search(rb"(?<!\d)(\d{%d,%d})(?!\d)" % (min_len, max_len), region)
+        m = pattern.search(region)
         if m:
             return [(pos + m.start(1), m.group(1))]
         return []
     else:
-        return [(pos + m.start(1), m.group(1)) for m in re.finditer(rb"(?<!\d)(\d{%d,%d})(?!\d)" % (min_len, max_len), region)]
+        return [(pos + m.start(1), m.group(1)) for m in pattern.finditer(region)]
 
 def find_ascii_word_after(buf: bytes, pos: int, max_seek=3000):
     region = buf[pos:pos+max_seek]
-    m = re.search(rb"([A-Za-z0-9_\-\.]{1,64})", region)
+    m = ASCII_WORD_RE.search(region)
     if m:
         return pos + m.start(1), m.group(1)
     return None, None
 
 def _gbk_find_all(buf: bytes, text: str):
     try:
-        patt = text.encode("gbk", errors="ignore")
+        pattern = encoded_literal_re(text, "gbk")
     except Exception:
         return []
-    return [ (m.start(), m.end()) for m in re.finditer(re.escape(patt), buf) ]
+    return [ (m.start(), m.end()) for m in pattern.finditer(buf) ]
 
 def find_city_display_windows(buf: bytes, city: str):
     prov_hits=[]; 
@@ -906,10 +1978,9 @@ def replace_bytes_window(buf: bytearray, win, new_text: str, tag: str, changed:
     changed.append(f"{tag}@{s}-{e}")
 
 def replace_star_number_all(buf: bytearray, new_num: str):
-    pattern = re.compile(rb"\*([0-9]{6,20})\*")
     positions=[]; cnt=0
-    new_b = new_num.encode("ascii", errors="ignore")
-    for m in list(pattern.finditer(buf)):
+    new_b = ascii_bytes(new_num)
+    for m in list(STAR_NUMBER_RE.finditer(buf)):
         a=m.start(1); b=m.end(1); old_len=b-a
         if len(new_b) == old_len: buf[a:b] = new_b
         elif len(new_b) < old_len: buf[a:b] = new_b + b" "*(old_len-len(new_b))
@@ -919,20 +1990,20 @@ def replace_star_number_all(buf: bytearray, new_num: str):
 
 def find_depot_region(buf: bytes, city_core: str, prefer_suffix=b"-CHN", window=1024):
     try:
-        city_bytes = city_core.encode("gbk", errors="ignore")
+        city_pattern = encoded_literal_re(city_core, "gbk")
     except Exception:
         return None, None
     last_pos = -1
-    for m in re.finditer(re.escape(city_bytes), buf):
+    for m in city_pattern.finditer(buf):
         last_pos = m.start()
     if last_pos < 0:
         return None, None
     tail = buf[last_pos:last_pos+window]
-    m2 = re.search(re.escape(prefer_suffix), tail)
-    if not m2:
+    suffix_at = tail.find(prefer_suffix)
+    if suffix_at < 0:
         end_idx = last_pos + min(window, 120)
         return last_pos, end_idx
-    end_idx = last_pos + m2.end()
+    end_idx = last_pos + suffix_at + len(prefer_suffix)
     return last_pos, end_idx
 
 def patch_city_display(buf: bytearray, city: str, changed: list, warns: list, debug: list):
@@ -958,10 +2029,10 @@ def patch_city_display(buf: bytearray, city: str, changed: list, warns: list, de
 
 def _gbk_find_once(buf: bytes, text: str):
     try:
-        patt = text.encode("gbk", errors="ignore")
+        pattern = encoded_literal_re(text, "gbk")
     except Exception:
         return None
-    m = re.search(re.escape(patt), buf)
+    m = pattern.search(buf)
     return (m.start(), m.end()) if m else None
 
 def find_depot_field_window(buf: bytes, labels=("目的库房", "目的仓"), max_seek=256):
@@ -976,16 +2047,15 @@ def find_depot_field_window(buf: bytes, labels=("目的库房", "目的仓"), ma
         while i < len(region) and region[i] in (0x20, 0x09, 0x0D, 0x0A):
             i += 1
 
-        j = i
-        while j < len(region):
-            b = region[j]
-            if b in (0x0D, 0x0A):
-                break
-            if j - i > 0 and j + 4 < len(region):
-                ahead = region[j:j+4]
-                if any(kw.encode("gbk", errors="ignore") in ahead for kw in ("目的地","供应商","采购","箱唛","序号")):
-                    break
-            j += 1
+        # 字段值止于换行，或止于其后（至少隔一字节、且前瞻窗口之后仍有字节）出现的下一个字段名
+        j = len(region)
+        for eol in (b"\r", b"\n"):
+            k = region.find(eol, i)
+            if 0 <= k < j:
+                j = k
+        m = DEPOT_FIELD_STOP_RE.search(region, i + 1, len(region) - 1)
+        if m and m.start() < j:
+            j = m.start()
 
         if j - i >= 8:
             start = lab_end + i
@@ -994,12 +2064,31 @@ def find_depot_field_window(buf: bytes, labels=("目的库房", "目的仓"), ma
 
     return None, None
 
-def patch_pld_with_entry(pld_path: Path, out_path: Path, entry: dict):
-    data = pld_path.read_bytes()
-    buf = bytearray(data)
+class _BoxMarkBuffer(bytearray):
+    """
+    箱唛改写缓冲区：记录每次切片写入 (start, stop, field, 写入字节)。
+    field 标明写入内容来源："po"/"po_fallback"=采购单号，"supplier"=商家名称，"no"=箱唛序号，None=库房/城市。
+    所有写入都等长替换，偏移量在整个改写过程中保持不变，供 BoxMarkPatcher 回放。
+    """
+    def __init__(self, data=b""):
+        super().__init__(data)
+        self.field = None
+        self.writes = []
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if isinstance(key, slice):
+            self.writes.append((key.start, key.stop, self.field, bytes(value)))
+
+def _po_visible(buf, po_bytes: bytes) -> bool:
+    return (po_bytes in buf) or (b"*" + po_bytes + b"*" in buf)
+
+def _patch_box_buffer(buf: _BoxMarkBuffer, entry: dict):
+    """就地改写箱唛模板缓冲区（不含最后的采购单号明文复核），返回 (changed, warns, debug)"""
     changed, warns, debug = [], [], []
 
     # 采购单号（*num* / 标签附近 / 兜底）
+    buf.field = "po"
     star_cnt, star_pos = replace_star_number_all(buf, entry["po"])
     if star_cnt:
         changed.append(f"可视采购单号（*num*）×{star_cnt}")
@@ -1008,7 +2097,7 @@ def patch_pld_with_entry(pld_path: Path, out_path: Path, entry: dict):
         debug.append("no star-number pattern found")
 
     pos_list = search_label_positions(buf, "采购单号")
-    po_bytes = entry["po"].encode("ascii", errors="ignore")
+    po_bytes = ascii_bytes(entry["po"])
     label_hits = 0
     for pos in pos_list:
         pairs = find_next_digits_after(buf, pos, max_seek=3000, min_len=6, max_len=20, find_all=True)
@@ -1018,7 +2107,8 @@ def patch_pld_with_entry(pld_path: Path, out_path: Path, entry: dict):
     if label_hits: changed.append(f"采购单号(标签附近)×{label_hits}")
     else: debug.append("no digits found after '采购单号'")
 
-    if (po_bytes not in buf) and (b"*" + po_bytes + b"*" not in buf):
+    if not _po_visible(buf, po_bytes):
+        buf.field = "po_fallback"
         regions = find_all_digits_regions(buf, min_len=6, max_len=20)
         if regions:
             regions.sort(key=lambda m: len(m.group(1)), reverse=True)
@@ -1030,8 +2120,9 @@ def patch_pld_with_entry(pld_path: Path, out_path: Path, entry: dict):
             warns.append("未找到可替换的采购单号区域（请检查模板）")
 
     # 商家名称
+    buf.field = "supplier"
     pos_list = search_label_positions(buf, "商家名称")
-    sup_bytes = entry["supplier"].encode("ascii", errors="ignore")
+    sup_bytes = ascii_bytes(entry["supplier"])
     sup_hits = 0
     for pos in pos_list:
         where, old = find_ascii_word_after(buf, pos, max_seek=3000)
@@ -1040,7 +2131,7 @@ def patch_pld_with_entry(pld_path: Path, out_path: Path, entry: dict):
             sup_hits += 1
     if sup_hits: changed.append(f"商家名称×{sup_hits}")
     else:
-        m = re.search(rb"(?<![A-Za-z0-9])stsnb(?![A-Za-z0-9])", buf)
+        m = SUPPLIER_PLACEHOLDER_RE.search(buf)
         if m:
             where = m.start(); old = m.group(0)
             replace_region_bytes(buf, where, len(old), sup_bytes)
@@ -1050,8 +2141,9 @@ def patch_pld_with_entry(pld_path: Path, out_path: Path, entry: dict):
 
     # 箱唛序号（可选）
     if entry.get("no"):
+        buf.field = "no"
         pos_list = search_label_positions(buf, "箱唛序号")
-        no_bytes = str(entry["no"]).encode("ascii", errors="ignore")
+        no_bytes = ascii_bytes(str(entry["no"]))
         no_hits = 0
         for pos in pos_list:
             pairs = find_next_digits_after(buf, pos, max_seek=3000, min_len=1, max_len=6, find_all=True)
@@ -1062,6 +2154,7 @@ def patch_pld_with_entry(pld_path: Path, out_path: Path, entry: dict):
         else: warns.append("未找到可替换的箱唛序号区域")
 
     # 目的库房（广州+东莞 优先字段标签法；其它情况 先字段法后城市锚点）
+    buf.field = None
     depot_written = False
 
     if entry["city"] == "广州" and ("东莞" in entry["depot"]):
@@ -1104,14 +2197,121 @@ def patch_pld_with_entry(pld_path: Path, out_path: Path, entry: dict):
 
     # 目的城市显示（省/市/合并 自适应）
     patch_city_display(buf, entry["city"], changed, warns, debug)
+    return changed, warns, debug
 
-    if (po_bytes not in buf) and (b"*" + po_bytes + b"*" not in buf):
-        warns.append("改写后未检测到新采购单号明文（条码对象可能以非明文保存）")
+PO_HIDDEN_WARN = "改写后未检测到新采购单号明文（条码对象可能以非明文保存）"
+
+def _read_box_buffer(path: Path) -> _BoxMarkBuffer:
+    """模板直接读进改写缓冲区，不经中间 bytes（大模板不在内存里存两份）"""
+    with open(path, "rb") as f:
+        buf = _BoxMarkBuffer(os.fstat(f.fileno()).st_size)
+        n = f.readinto(buf)
+    if n < len(buf):
+        del buf[n:]  # 读取期间文件变短
+    return buf
+
+def patch_pld_with_entry(pld_path: Path, out_path: Path, entry: dict):
+    buf = _read_box_buffer(pld_path)
+    changed, warns, debug = _patch_box_buffer(buf, entry)
+    if not _po_visible(buf, ascii_bytes(entry["po"])):
+        warns.append(PO_HIDDEN_WARN)
 
     out_path.parent.mkdir(parents=True, exist_ok=True)
     out_path.write_bytes(buf)
     return changed, warns, debug
 
+def _fit_ascii(value: bytes, old_len: int) -> bytes:
+    # 与 replace_region_bytes 相同的等长规则：不足补空格，超长截断
+    return value[:old_len].ljust(old_len, b" ")
+
+class BoxMarkPatcher:
+    """
+    箱唛模板分析缓存：同一城市模板被几十条箱唛反复改写时，只完整扫描一次。
+
+    首次遇到某个 (模板内容哈希, 城市, 库房, 商家名称, 采购单号位数, 序号位数) 组合时走完整流程，
+    记录每次写入的偏移与来源；之后同组合的条目直接在模板字节副本上按偏移切片写入。
+    各处查找只受写入字节的“形状”（数字/空格分布）影响，组合相同则偏移必然相同；
+    唯一与数值有关的分支（采购单号是否已明文存在 → 兜底最长数字）回放时复核，不一致即退回完整流程。
+    """
+    def __init__(self):
+        self._templates = {}   # 模板路径 -> (内容, 哈希)
+        self._plans = {}
+        self.replayed = self.analysed = 0
+        self.bytes_read = 0    # 读取模板的字节数（每个模板只读一次）
+
+    def _template(self, tpl_path: Path):
+        key = str(tpl_path)
+        hit = self._templates.get(key)
+        if hit is None:
+            data = tpl_path.read_bytes()
+            self.bytes_read += len(data)
+            hit = self._templates[key] = (data, hashlib.blake2b(data, digest_size=16).digest())
+        return hit
+
+    @staticmethod
+    def _replay_po(data: bytes, writes: list, po_bytes: bytes):
+        """按记录回放 "po" 段写入，返回 (缓冲区, 已回放条数)；之后紧接着是兜底判断"""
+        buf = bytearray(data)
+        n = 0
+        for start, stop, field, _ in writes:
+            if field != "po":
+                break
+            buf[start:stop] = _fit_ascii(po_bytes, stop - start)
+            n += 1
+        return buf, n
+
+    def patch(self, tpl_path: Path, out_path: Path, entry: dict, sink=None):
+        """
+        等价于 copy2(模板, out_path) + patch_pld_with_entry(out_path, out_path, entry)，返回 (changed, warns, debug)；
+        sink(out_path, 写入的字节) 可选，供流式打包。
+        """
+        data, digest = self._template(tpl_path)
+        po_bytes = ascii_bytes(entry["po"])
+        no_bytes = ascii_bytes(str(entry["no"])) if entry.get("no") else None
+        # 非纯数字的采购单号/序号会改变查找结果的形状，不走缓存
+        key = None
+        if po_bytes.isdigit() and (no_bytes is None or no_bytes.isdigit()):
+            key = (digest, entry["city"], entry["depot"], entry["supplier"], len(po_bytes),
+                   None if no_bytes is None else len(no_bytes))
+        plan = self._plans.get(key) if key else None
+
+        buf = None
+        if plan is not None:
+            writes, po_fallback, changed, warns, debug = plan
+            buf, n = self._replay_po(data, writes, po_bytes)
+            if (not _po_visible(buf, po_bytes)) != po_fallback:
+                buf = None
+            else:
+                for start, stop, field, value in writes[n:]:
+                    if field == "po_fallback":
+                        value = _fit_ascii(po_bytes, stop - start)
+                    elif field == "no":
+                        value = _fit_ascii(no_bytes, stop - start)
+                    buf[start:stop] = value
+                changed, warns, debug = list(changed), list(warns), list(debug)
+                self.replayed += 1
+
+        if buf is None:
+            buf = _BoxMarkBuffer(data)
+            changed, warns, debug = _patch_box_buffer(buf, entry)
+            self.analysed += 1
+            if key and plan is None:
+                replay_buf, _ = self._replay_po(data, buf.writes, po_bytes)
+                self._plans[key] = (buf.writes, not _po_visible(replay_buf, po_bytes),
+                                    tuple(changed), tuple(warns), tuple(debug))
+
+        if not _po_visible(buf, po_bytes):
+            warns.append(PO_HIDDEN_WARN)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        out_path.write_bytes(buf)
+        shutil.copymode(tpl_path, out_path)
+        if sink:
+            sink(out_path, buf)  # 每条都是新缓冲区，之后不再改动，无需再复制一份
+        return changed, warns, debug
+
+    def stats_line(self) -> str:
+        return f"箱唛模板分析：完整扫描 {self.analysed} 条，按缓存偏移写入 {self.replayed} 条"
+
 # ===================== 主流程：一次识别 → 同时产出 标签 + 箱唛 =====================
 
 def main():
@@ -1128,22 +2328,27 @@ def main():
         else: print("操作已取消：", e)
         return
 
-    # 打开
+    # 打开（数据表走只读流式；箱唛表需要行隐藏信息，按需完整加载）
+    timings = RunTimings()
+    timings.phase("打开工作簿")
     try:
-        wb = load_workbook(filename=str(workbook_path), data_only=True)
+        source = WorkbookSource(workbook_path)
+        wb = source.stream
+        timings.count("workbook_bytes", Path(workbook_path).stat().st_size)
     except Exception as e:
         if TK_OK: messagebox.showerror("读取失败", f"无法打开工作簿：{workbook_path}\n\n{e}")
         else: print("读取失败：", e)
         return
 
     # ====== 统一识别（供 标签 + 箱唛 共用）======
+    timings.phase("识别工作表")
     sheet_name_map = resolve_sheet_names(wb)
     b1_values = {exp: (read_b1(wb, real) if real else "") for exp, real in sheet_name_map.items()}
     label_type_simple = decide_label_type_by_b1(b1_values, sheet_name_map)    # "3C" / "玩具"
     label_type_full   = "3C标签" if label_type_simple == "3C" else "玩具标签"
     box_kind_dirname  = "3C箱唛" if label_type_simple == "3C" else "玩具箱唛"
 
-    mmdd = extract_date_tag_from_wb(wb, sheet_name_map)  # MMDD 来自标签 D 列 SN
+    mmdd, date_src_note = extract_date_tag_and_note(wb, sheet_name_map)  # MMDD 来自标签 D 列 SN
 
     # ====== A. 生成 标签 ======
     source_base, tried_paths = resolve_label_template_dir(root_dir, label_type_full)
@@ -1155,7 +2360,9 @@ def main():
     out_root_label = root_dir / f"{mmdd}-{label_type_full}"
     out_root_label.mkdir(parents=True, exist_ok=True)
 
+    timings.phase("标签模板索引")
     pld_index, pld_entries = build_pld_index(source_base)
+    resolver = TemplateResolver(pld_index, pld_entries)
     sheet_to_outfolder = {
         "外仓库配货表": "外星人",
         "梨配货表": "三只梨",
@@ -1168,6 +2375,7 @@ def main():
     copied_map  = {k: 0  for k in sheet_to_outfolder.keys()}
     detail_lines = []
     soldout_hits = []
+    patch_rows = []  # 拷贝时同步完成的日期批改结果
 
     for exp_sheet, outfolder in sheet_to_outfolder.items():
         real_sheet = sheet_name_map.get(exp_sheet)
@@ -1175,15 +2383,18 @@ def main():
             detail_lines.append(f"[错误] 未找到工作表：{exp_sheet}（注意命名差异）")
             continue
 
+        timings.phase("读取配货表")
         try:
             rows = read_id_sku_e_from_sheet(wb, real_sheet_name=real_sheet, id_col=5, sku_col=1, e_col=5, start_row=2)
         except Exception as e:
             detail_lines.append(f"[错误] 读取工作表 {real_sheet} 失败：{e}")
             continue
+        timings.count("rows", len(rows))
+        timings.phase("模板匹配")
 
         dest_dir = out_root_label / outfolder
-        created_dest = False
         count_before = total_copied
+        copy_plan = {}  # dst -> [src, 命中行数]
 
         for raw_id, sku, e_val in rows:
             raw_id_str = str(raw_id)
@@ -1197,19 +2408,8 @@ def main():
                 soldout_hits.append((exp_sheet, raw_id_str, cleaned))
                 raw_id_str = cleaned
 
-            # === 螺旋桨特判（增强版） ===
-            forced_name = None
-            if e_txt and ("螺旋桨" in e_txt):
-                # 使用增强的螺旋桨模板查找函数
-                forced_name = find_propeller_template(sku_str, raw_id_str, exp_sheet, pld_index, pld_entries)
-
-            if forced_name:
-                cand_names = candidate_filenames(exp_sheet, [], forced_names=[forced_name])
-            else:
-                id_variants = build_variants(raw_id_str)
-                cand_names = candidate_filenames(exp_sheet, id_variants, forced_names=None)
-
-            found = find_matching_templates(pld_index, cand_names)
+            # 螺旋桨特判 + 通用候选（解析器内按编号记忆）
+            found, cand_names, forced_name = resolver.resolve(exp_sheet, raw_id_str, sku=sku_str, e_txt=e_txt)
 
             if not found and not use_e_only:
                 # 数字前缀兜底（对 E-only 表禁用）
@@ -1222,6 +2422,7 @@ def main():
                         detail_lines.append(f"[数字前缀兜底] [{exp_sheet}] {raw_id} -> 命中 {len(num_hits)} 个")
 
             if not found:
+                timings.count("template_misses")
                 preview = ", ".join(cand_names[:5]) + (f" …共{len(cand_names)}项" if len(cand_names) > 5 else "")
                 mark = f"{raw_id}（候选：{preview}）"
                 if forced_name:
@@ -1229,20 +2430,29 @@ def main():
                 missing_map[exp_sheet].append(mark)
                 continue
 
-            if not created_dest and not dest_dir.exists():
-                dest_dir.mkdir(parents=True, exist_ok=True); created_dest = True
-
+            timings.count("template_hits")
             for src in found:
-                try:
-                    dst = dest_dir / src.name
-                    shutil.copy2(src, dst)
-                    total_copied += 1
-                except Exception as e:
-                    detail_lines.append(f"[复制失败] {src.name} -> {dest_dir}：{e}")
+                copy_plan.setdefault(dest_dir / src.name, [src, 0])[1] += 1
+
+        # 拷贝与日期批改合并执行：每个模板读一次、写一次
+        if copy_plan:
+            timings.phase("拷贝+日期批改")
+            dest_dir.mkdir(parents=True, exist_ok=True)
+            results = copy_patch_files([(src, dst) for dst, (src, _) in copy_plan.items()], mmdd)
+            for (src, n_rows), res in zip(copy_plan.values(), results):
+                if "error" in res:
+                    detail_lines.append(f"[复制失败] {src.name} -> {dest_dir}：{res['error']}")
+                else:
+                    total_copied += n_rows
+                    timings.count("label_bytes_written", res["bytes"])
+                    timings.count("label_bytes_read", res["read_bytes"])
+            patch_rows.extend(results)
 
         copied_map[exp_sheet] = total_copied - count_before
 
     # 统一日志目录
+    timings.phase("标签日志+批改报告")
+    timings.count("label_files", len(patch_rows))
     log_path_label = (root_dir / "日志") / "标签拷贝日志.txt"
     now_str = dt.now().strftime("%Y-%m-%d %H:%M:%S")
     try:
@@ -1251,8 +2461,9 @@ def main():
             f.write(f"执行时间：{now_str}\n")
             f.write(f"工作簿：{workbook_path}\n")
             f.write(f"SN提取日期（MMDD）：{mmdd}\n")
-            f.write(f"SN日期来源：{DATE_SRC_NOTE}\n")
+            f.write(f"SN日期来源：{date_src_note}\n")
             f.write(f"判定标签类型：{label_type_full}（模板来源：{source_base}）\n")
+            f.write(resolver.stats_line() + "\n")
             f.write("="*40 + "\n")
             for sheet, folder in sheet_to_outfolder.items():
                 f.write(f"【{sheet} → {folder}】复制文件数：{copied_map[sheet]}\n")
@@ -1271,13 +2482,15 @@ def main():
     except Exception:
         pass
 
-    # 标签 .pld 日期批改（报告也写入 LOG_DIR）
-    patch_summary, patch_report = run_patch_step(out_root_label, mmdd, ext=".pld", dry=False, make_backup=False, report_dir=(root_dir / "日志"))
+    # 标签 .pld 日期批改已在拷贝时完成，这里汇总报告（报告也写入 LOG_DIR）
+    patch_rows.sort(key=lambda r: Path(r["file"]))
+    patch_summary, patch_report = format_patch_report(out_root_label, mmdd, patch_rows, dry=False, make_backup=False, report_dir=(root_dir / "日志"))
 
     # ====== B. 生成 箱唛 ======
-    ws_box = find_box_sheet(wb)
+    timings.phase("箱唛解析")
+    ws_box = find_box_sheet(source.stream)
     store_sub = decide_store_subfolder(ws_box)
-    entries = parse_entries(ws_box)
+    entries = parse_entries(ws_box, source)
     if not entries:
         msg = "未在“箱唛”工作表中识别到任何城市条目（需包含 目的地/供应商简码/采购单号/目的库房）。"
         if TK_OK: messagebox.showwarning("未识别", msg)
@@ -1292,6 +2505,7 @@ def main():
             "【标签第二步：批量修改 .pld 日期】",
             patch_summary,
             f"标签日期报告：{patch_report}",
+            f"耗时统计：{timings.save(LOG_DIR / TIMINGS_NAME)}",
         ]
         print("\n".join(lines))
         if TK_OK:
@@ -1314,8 +2528,11 @@ def main():
     out_root_box.mkdir(parents=True, exist_ok=True)
 
     city_counts = {}
+    box_patcher = BoxMarkPatcher()
     summary_lines, debug_lines = [], []
     total_ok = total_warn = 0
+    timings.count("box_entries", len(entries))
+    timings.phase("箱唛生成")
 
     for ent in entries:
         city = ent["city"]
@@ -1329,8 +2546,9 @@ def main():
         city_counts[city] = cnt
         out_path = out_root_box / (tpl.name if cnt == 1 else f"{tpl.stem}-{cnt}{tpl.suffix}")
 
-        shutil.copy2(tpl, out_path)
-        changed, warns, debug = patch_pld_with_entry(out_path, out_path, ent)
+        changed, warns, debug = box_patcher.patch(tpl, out_path, ent)
+        timings.count("box_files")
+        timings.count("box_bytes_written", out_path.stat().st_size)
 
         if warns:
             total_warn += 1
@@ -1341,8 +2559,10 @@ def main():
 
         if debug:
             debug_lines.append(f"[{city}] {out_path.name} -> " + " | ".join(debug))
+    timings.count("box_template_bytes_read", box_patcher.bytes_read)
 
     # 箱唛日志 -> LOG_DIR
+    timings.phase("箱唛日志")
     log_path_box = (root_dir / "日志") / "箱唛处理日志.txt"
     head = [
         f"脚本版本：{VERSION}",
@@ -1378,6 +2598,7 @@ def main():
         f"箱唛输出目录：{out_root_box}",
         f"箱唛生成成功：{total_ok}  |  有提示/检查：{total_warn}",
         f"箱唛日志：{log_path_box}",
+        f"耗时统计：{timings.save(LOG_DIR / TIMINGS_NAME)}",
     ]
     print("\n".join(lines))
     if TK_OK:
@@ -1389,9 +2610,28 @@ def main():
 
 # ===================== 仅预定表功能（新增）=====================
 
+def _reservation_qty(value) -> int:
+    """配货表数量单元格转整数，非数字按 0"""
+    try:
+        return int(value) if value is not None else 0
+    except (ValueError, TypeError):
+        return 0
+
 def read_reservation_data_from_sheet(wb, real_sheet_name: str, sku_col: int = 1, city_start_col: int = 7, city_end_col: int = 14, start_row: int = 2):
     """
-    读取配货表中的商品编号(A列)和城市列数据
+    读取配货表中的商品编号(A列)和城市列数据（按行组织，参数同 read_reservation_columns）
+    
+    返回:
+        (city_names, data_rows)
+        data_rows: [(商品编号, [城市1数量, 城市2数量, ...]), ...]
+    """
+    city_names, skus, columns = read_reservation_columns(wb, real_sheet_name, sku_col, city_start_col, city_end_col, start_row)
+    rows = [list(q) for q in zip(*columns)] if columns else [[] for _ in skus]
+    return city_names, list(zip(skus, rows))
+
+def read_reservation_columns(wb, real_sheet_name: str, sku_col: int = 1, city_start_col: int = 7, city_end_col: int = 14, start_row: int = 2):
+    """
+    读取配货表中的商品编号(A列)和城市列数据，按列返回
     
     参数:
         wb: 工作簿对象
@@ -1402,9 +2642,10 @@ def read_reservation_data_from_sheet(wb, real_sheet_name: str, sku_col: int = 1,
         start_row: 起始行（默认第2行）
     
     返回:
-        (city_names, data_rows)
+        (city_names, skus, columns)
         city_names: 城市名称列表
-        data_rows: [(商品编号, [城市1数量, 城市2数量, ...]), ...]
+        skus: 商品编号列表（去重、仅纯数字，保持表内顺序）
+        columns: 每个城市一列数量 [[城市1数量...], [城市2数量...], ...]，与 skus 一一对应
     """
     ws = wb[real_sheet_name]
     
@@ -1418,10 +2659,13 @@ def read_reservation_data_from_sheet(wb, real_sheet_name: str, sku_col: int = 1,
     # 导入正则表达式
     import re
     
+    # 表头只读一次（只读流式模式下逐格 ws.cell 每次都要重新解析工作表）
+    header = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ())
+    
     # 从 city_start_col 开始识别城市列，直到遇到空单元格或非城市格式的单元格时停止
     # 这样可以避免读取表右边的其他表
-    for col in range(city_start_col, ws.max_column + 1):
-        cell_value = ws.cell(row=1, column=col).value
+    for col in range(city_start_col, len(header) + 1):
+        cell_value = header[col - 1]
         
         # 如果单元格为空，停止识别
         if not cell_value:
@@ -1436,7 +2680,7 @@ def read_reservation_data_from_sheet(wb, real_sheet_name: str, sku_col: int = 1,
         else:
             # 检查是否是城市+数字的格式（必须完全匹配）
             for std_city in standard_cities:
-                if re.match(f"^{std_city}[-]?\\d+$", city_name):
+                if city_suffix_re(std_city).match(city_name):
                     is_city = True
                     break
         
@@ -1454,18 +2698,19 @@ def read_reservation_data_from_sheet(wb, real_sheet_name: str, sku_col: int = 1,
     
     # 打印前几行的原始数据用于对比
     print(f"[DEBUG] 表头行（第1行）：", file=sys.stderr)
-    for col in range(1, ws.max_column + 1):
-        val = ws.cell(row=1, column=col).value
+    for col, val in enumerate(header, start=1):
         print(f"  列{col}({chr(64+col)}): {val}", file=sys.stderr)
     
-    # 读取数据行
-    data_rows = []
+    # 读取数据行：城市列是连续的一段，每行只切出这一段原值，整列再统一转数量
+    skus = []
+    city_values = []
     seen_skus = set()
+    lo, hi = (city_cols[0] - 1, city_cols[-1]) if city_cols else (0, 0)
     
-    for row in ws.iter_rows(min_row=start_row):
+    max_col = max([sku_col] + city_cols)
+    for row in ws.iter_rows(min_row=start_row, max_col=max_col, values_only=True):
         # 读取商品编号（A列）
-        sku_cell = row[sku_col - 1]
-        sku_value = sku_cell.value
+        sku_value = row[sku_col - 1]
         
         if sku_value is None:
             continue
@@ -1479,24 +2724,15 @@ def read_reservation_data_from_sheet(wb, real_sheet_name: str, sku_col: int = 1,
             continue
         
         seen_skus.add(sku)
-        
-        # 读取城市列的数据（使用检测到的 city_cols）
-        city_quantities = []
-        for col in city_cols:
-            cell = row[col - 1]
-            value = cell.value
-            
-            # 转换为数字，如果不是数字则为0
-            try:
-                qty = int(value) if value is not None else 0
-            except (ValueError, TypeError):
-                qty = 0
-            
-            city_quantities.append(qty)
-        
-        data_rows.append((sku, city_quantities))
+        skus.append(sku)
+        city_values.append(row[lo:hi])
     
-    return city_names, data_rows
+    # 按列转换为数字，整数原值直接保留，其余不是数字的为0
+    columns = [[v if type(v) is int else _reservation_qty(v) for v in col] for col in zip(*city_values)]
+    if not city_values:
+        columns = [[] for _ in city_cols]
+    
+    return city_names, skus, columns
 
 
 def generate_reservation_table(wb, sheet_name_map: dict, output_path: Path, callback=None):
@@ -1545,8 +2781,28 @@ def generate_reservation_table(wb, sheet_name_map: dict, output_path: Path, call
         "德州-2": ("德州", "德州2"),
     }
     
-    # 导入正则表达式模块
-    import re
+    def resolve_city(city_name):
+        """城市列名 → (标准城市, 备注, 城市序号)；每列只解析一次"""
+        remark = ""
+        mapped_city = city_name
+        
+        # 首先检查精确匹配
+        if city_name in city_alias_map:
+            mapped_city, remark = city_alias_map[city_name]
+        else:
+            # 尝试正则匹配：城市名+数字 或 城市名-数字
+            for standard_city in city_order:
+                if city_suffix_re(standard_city).match(city_name):
+                    mapped_city = standard_city
+                    remark = city_name  # 备注为原始名称
+                    break
+        
+        # 获取城市在标准顺序中的序号
+        try:
+            city_idx = city_order.index(mapped_city)
+        except ValueError:
+            city_idx = 999  # 未知城市排在最后
+        return mapped_city, remark, city_idx
     
     # 收集所有数据，记录工作表来源和城市
     all_data = []  # [(工作表序号, 城市序号, 商品编号, 配送中心名称, 数量, 备注), ...]
@@ -1559,38 +2815,15 @@ def generate_reservation_table(wb, sheet_name_map: dict, output_path: Path, call
         
         try:
             log(f"  读取工作表：{real_sheet}")
-            city_names, data_rows = read_reservation_data_from_sheet(wb, real_sheet)
+            city_names, skus, columns = read_reservation_columns(wb, real_sheet)
             
-            # 转置数据
-            for sku, quantities in data_rows:
-                for i, qty in enumerate(quantities):
-                    if qty > 0:  # 只记录数量大于0的
-                        city_name = city_names[i]
-                        # 检查是否需要映射城市名
-                        remark = ""
-                        mapped_city = city_name
-                        
-                        # 首先检查精确匹配
-                        if city_name in city_alias_map:
-                            mapped_city, remark = city_alias_map[city_name]
-                        else:
-                            # 尝试正则匹配：城市名+数字 或 城市名-数字
-                            for standard_city in city_order:
-                                # 匹配"城市+数字"或"城市-数字"
-                                pattern = f"^{standard_city}[-]?\\d+$"
-                                if re.match(pattern, city_name):
-                                    mapped_city = standard_city
-                                    remark = city_name  # 备注为原始名称
-                                    break
-                        
-                        # 获取城市在标准顺序中的序号
-                        try:
-                            city_idx = city_order.index(mapped_city)
-                        except ValueError:
-                            city_idx = 999  # 未知城市排在最后
-                        all_data.append((sheet_idx, city_idx, sku, mapped_city, qty, remark))
+            # 转置数据：逐列展开，只记录数量大于0的（排序后与逐行展开的结果一致）
+            for city_name, quantities in zip(city_names, columns):
+                mapped_city, remark, city_idx = resolve_city(city_name)
+                all_data.extend((sheet_idx, city_idx, sku, mapped_city, qty, remark)
+                                for sku, qty in zip(skus, quantities) if qty > 0)
             
-            log(f"    提取 {len(data_rows)} 个商品编号")
+            log(f"    提取 {len(skus)} 个商品编号")
         except Exception as e:
             log(f"  ✗ 读取失败：{e}")
             import traceback
@@ -1606,59 +2839,43 @@ def generate_reservation_table(wb, sheet_name_map: dict, output_path: Path, call
     
     log(f"  数据已按工作表和配送中心排序")
     
-    # 创建新的工作簿
-    new_wb = Workbook()
-    ws = new_wb.active
-    ws.title = "预定表"
+    # 创建新的工作簿（只写模式：逐行流式写出，不在内存里保留整张表）
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, NamedStyle
+    from openpyxl.utils import get_column_letter
     
-    # 导入样式模块
-    from openpyxl.styles import Alignment
+    new_wb = Workbook(write_only=True)
+    ws = new_wb.create_sheet("预定表")
     
-    # 写入表头
-    ws['A1'] = "商品编号"
-    ws['B1'] = "配送中心名称"
-    ws['C1'] = "有限预订数量"
-    ws['D1'] = "备注"
+    # 所有单元格共用一个居中的命名样式
+    centered = NamedStyle(name="预定表居中", alignment=Alignment(horizontal='center', vertical='center'))
+    new_wb.add_named_style(centered)
     
-    # 设置表头居中
-    for cell in ['A1', 'B1', 'C1', 'D1']:
-        ws[cell].alignment = Alignment(horizontal='center', vertical='center')
+    # 表头 + 数据（提取实际需要的字段：商品编号、城市、数量、备注；商品编号保持为文本格式，与原表一致）
+    header = ("商品编号", "配送中心名称", "有限预订数量", "备注")
+    rows = [(sku, city, qty, remark) for _sheet_idx, _city_idx, sku, city, qty, remark in all_data]
     
-    # 写入数据（提取实际需要的字段：商品编号、城市、数量、备注）
-    for idx, (sheet_idx, city_idx, sku, city, qty, remark) in enumerate(all_data, start=2):
-        # 商品编号保持为文本格式（与原表一致）
-        ws[f'A{idx}'] = sku
-        
-        ws[f'B{idx}'] = city
-        ws[f'C{idx}'] = qty
-        ws[f'D{idx}'] = remark
-        
-        # 设置每行数据居中
-        ws[f'A{idx}'].alignment = Alignment(horizontal='center', vertical='center')
-        ws[f'B{idx}'].alignment = Alignment(horizontal='center', vertical='center')
-        ws[f'C{idx}'].alignment = Alignment(horizontal='center', vertical='center')
-        ws[f'D{idx}'].alignment = Alignment(horizontal='center', vertical='center')
-    
-    # 自动调整列宽
-    from openpyxl.utils import get_column_letter
-    
-    for column_cells in ws.columns:
-        max_length = 0
-        column_letter = get_column_letter(column_cells[0].column)
-        
-        for cell in column_cells:
-            try:
-                if cell.value:
-                    # 计算内容长度（中文字符按2个字符计算）
-                    cell_value = str(cell.value)
-                    length = sum(2 if ord(c) > 127 else 1 for c in cell_value)
-                    max_length = max(max_length, length)
-            except:
-                pass
+    # 自动调整列宽（只写模式下须在写入行之前设置；同一值只计算一次长度）
+    for col_idx, values in enumerate(zip(header, *rows), start=1):
+        # 计算内容长度（中文字符按2个字符计算）
+        lengths = [sum(2 if ord(c) > 127 else 1 for c in str(v)) for v in set(values) if v]
+        max_length = max(lengths, default=0)
         
         # 设置列宽（加一点边距）
         adjusted_width = min(max_length + 2, 50)  # 最大宽度限制为50
-        ws.column_dimensions[column_letter].width = adjusted_width
+        ws.column_dimensions[get_column_letter(col_idx)].width = adjusted_width
+    
+    def styled_row(values):
+        cells = []
+        for v in values:
+            cell = WriteOnlyCell(ws, value=v)
+            cell.style = centered.name
+            cells.append(cell)
+        return cells
+    
+    ws.append(styled_row(header))
+    for row in rows:
+        ws.append(styled_row(row))
     
     # 保存文件
     output_path.parent.mkdir(parents=True, exist_ok=True)
@@ -54,6 +54,7 @@ class IntegratedApp:
         # 当前文件路径
         self.current_file = None
         self.processing = False
+        self.workbook_source = None  # 类型检查时打开的工作簿，交给处理线程复用
         
         # 输出路径 - 默认为系统下载文件夹
         self.output_dir = os.path.join(os.path.expanduser("~"), "Downloads")
@@ -66,6 +67,7 @@ class IntegratedApp:
         self.output_mode = tk.StringVar(value="both")  # both/label/box
         self.zip_mode = tk.BooleanVar(value=True)  # 是否打包zip（默认勾选）
         self.log_mode = tk.BooleanVar(value=True)  # 是否生成日志文件（默认勾选）
+        self.incremental_mode = tk.BooleanVar(value=False)  # 是否跳过上次已生成且未变动的文件（默认不勾选，全部重新生成）
         
         # 店铺筛选（只影响标签生成）- 根据类型动态变化
         # 3C店铺
@@ -317,7 +319,10 @@ class IntegratedApp:
         self.zip_checkbox.pack(side=tk.LEFT, padx=(0, 8))
         
         self.log_checkbox = self.create_flat_checkbox(self.options_frame, "生成日志文件", self.log_mode)
-        self.log_checkbox.pack(side=tk.LEFT)
+        self.log_checkbox.pack(side=tk.LEFT, padx=(0, 8))
+        
+        self.incremental_checkbox = self.create_flat_checkbox(self.options_frame, "跳过未变动文件", self.incremental_mode)
+        self.incremental_checkbox.pack(side=tk.LEFT)
         
         # 监听类型和输出模式变化，动态更新店铺筛选和其他选项显示
         self.type_mode.trace_add("write", lambda *args: self.update_shop_filters())
@@ -440,6 +445,8 @@ class IntegratedApp:
         
         # 存储选中的PLD文件路径
         self.selected_pld_file = None
+        # 自动扫描提取的商品编码：(模板目录, {文件名: 商品编码})
+        self.propeller_code_scan = None
         
         # 启动时加载螺旋桨映射
         self.load_propeller_mappings()
@@ -470,61 +477,16 @@ class IntegratedApp:
     
     
     def _extract_from_file_content(self, file_path):
-        """从文件内容中提取商品编码"""
+        """从文件内容中提取商品编码（读取一次、解码一次，14 条规则由 core.extract_product_code 合并扫描）"""
         try:
             print(f"从文件提取商品编码：{file_path}")
-            
-            # 尝试读取文件内容
-            content = None
-            for encoding in ['utf-8', 'gbk', 'latin1', 'cp1252']:
-                try:
-                    with open(file_path, 'r', encoding=encoding) as f:
-                        content = f.read()
-                    print(f"成功读取文件，使用编码：{encoding}")
-                    break
-                except UnicodeDecodeError:
-                    continue
-                except Exception as e:
-                    print(f"读取文件失败（{encoding}）：{e}")
-                    continue
-            
-            if content is None:
-                print("无法读取文件内容")
-                return None
-            
+            from wrapper import core
+            content = core.decode_pld_text(Path(file_path).read_bytes())
             print(f"文件内容长度：{len(content)} 字符")
             
-            # 使用正则表达式提取商品编码
-            import re
-            
-            patterns = [
-                (r'商品编码[：:]\s*\*?(\d+)\*?', '明确标注的商品编码'),
-                (r'SKU[：:]*\s*\*?(\d+)\*?', 'SKU编码'),
-                (r'sku[：:]*\s*\*?(\d+)\*?', 'SKU编码(小写)'),
-                (r'ID[：:]\s*\*?(\d+)\*?', 'ID编码'),
-                (r'编码[：:]\s*\*?(\d+)\*?', '编码'),
-                (r'\*(\d{12})\*', '星号包围的12位数字'),
-                (r'\*(\d{11})\*', '星号包围的11位数字'),
-                (r'\*(\d{10})\*', '星号包围的10位数字'),
-                (r'(?:sku|SKU)\s+\*?(\d{10,})\*?', '条形码SKU'),
-                (r'(\d{12})', '12位数字'),
-                (r'(\d{11})', '11位数字'),
-                (r'(\d{10})', '10位数字'),
-                (r'(\d{9})', '9位数字'),
-                (r'(\d{8})', '8位数字'),
-            ]
-            
-            all_matches = []
-            for pattern, description in patterns:
-                matches = re.findall(pattern, content)
-                for match in matches:
-                    all_matches.append((match, description))
-                    print(f"找到匹配（{description}）：{match}")
-            
-            if all_matches:
-                best_match = max(all_matches, key=lambda x: len(x[0]))
-                result = best_match[0]
-                print(f"选择最佳匹配：{result} ({best_match[1]})")
+            result, description = core.extract_product_code(content)
+            if result:
+                print(f"选择最佳匹配：{result} ({description})")
                 return result
             else:
                 print("没有找到任何匹配")
@@ -535,7 +497,7 @@ class IntegratedApp:
             return None
     
     def extract_product_code_from_pld(self, pld_filename, template_dir=None):
-        """从PLD文件中提取商品编码"""
+        """从PLD文件中提取商品编码（优先使用自动扫描时一次性提取的结果）"""
         try:
             print(f"开始提取商品编码：{pld_filename}")
             
@@ -552,20 +514,26 @@ class IntegratedApp:
             if isinstance(template_dir, str):
                 template_dir = Path(template_dir)
             
+            scanned = self.propeller_code_scan
+            if scanned and scanned[0] == str(template_dir) and pld_filename in scanned[1]:
+                return scanned[1][pld_filename] or None
+            
             print(f"在目录中搜索文件：{template_dir}")
             
-            # 递归搜索匹配的PLD文件
+            # 遍历一次模板树（走模板索引缓存），精确匹配优先，其次模糊匹配
             try:
-                for pld_file in template_dir.rglob("*.pld"):
+                from wrapper import core
+                pld_files = core.walk_pld_tree(template_dir)
+                for pld_file in pld_files:
                     if pld_file.name == pld_filename:
                         print(f"精确匹配找到文件：{pld_file}")
                         return self._extract_from_file_content(pld_file)
                 
                 # 如果精确匹配失败，尝试模糊匹配
-                for pld_file in template_dir.rglob("*.pld"):
+                for pld_file in pld_files:
                     # 检查文件名是否包含相同的关键词
                     if ("600" in pld_filename and "600" in pld_file.name and 
-                        ("螺旋桨" in pld_file.name or "操旋奖" in pld_file.name)):
+                        core.has_keyword(pld_file.name, ("螺旋桨", "操旋奖"))):
                         print(f"模糊匹配找到文件：{pld_file}")
                         return self._extract_from_file_content(pld_file)
                 
@@ -609,17 +577,19 @@ class IntegratedApp:
             self.shop_filter_frame.pack_forget()
     
     def update_ui_options(self):
-        """根据输出模式动态更新其他选项（ZIP、日志）的显示"""
+        """根据输出模式动态更新其他选项（ZIP、日志、增量）的显示"""
         output_val = self.output_mode.get()
         
-        # 当选择"仅预定表"时，隐藏ZIP和日志选项
+        # 当选择"仅预定表"时，隐藏ZIP、日志和增量选项
         if output_val == "reservation":
             self.zip_checkbox.pack_forget()
             self.log_checkbox.pack_forget()
+            self.incremental_checkbox.pack_forget()
         else:
             # 其他模式显示这些选项
             self.zip_checkbox.pack(side=tk.LEFT, padx=(0, 8))
-            self.log_checkbox.pack(side=tk.LEFT)
+            self.log_checkbox.pack(side=tk.LEFT, padx=(0, 8))
+            self.incremental_checkbox.pack(side=tk.LEFT)
         
         # 同时更新店铺筛选（联动更新）
         self.update_shop_filters()
@@ -893,14 +863,15 @@ class IntegratedApp:
             return
         
         # 如果用户手动选择了类型，先快速检查是否与自动识别一致
+        # 检查时打开的工作簿交给后台处理线程继续使用，避免重复解析
+        self.workbook_source = None
         if self.type_mode.get() != "auto":
             # 快速读取检查类型
             try:
-                from openpyxl import load_workbook
-                wb = load_workbook(filename=self.current_file, data_only=True)
-                
                 # 导入核心模块快速识别
                 from wrapper import core
+                self.workbook_source = core.WorkbookSource(self.current_file)
+                wb = self.workbook_source.stream
                 sheet_name_map = core.resolve_sheet_names(wb)
                 b1_values = {exp: (core.read_b1(wb, real) if real else "") 
                              for exp, real in sheet_name_map.items()}
@@ -909,8 +880,6 @@ class IntegratedApp:
                 user_type_map = {"3c": "3C", "toy": "玩具"}
                 user_type = user_type_map.get(self.type_mode.get(), "")
                 
-                wb.close()
-                
                 # 如果类型不一致，弹窗让用户选择
                 if auto_type != user_type:
                     result = messagebox.askyesnocancel(
@@ -924,6 +893,8 @@ class IntegratedApp:
                     )
                     
                     if result is None:  # 取消
+                        self.workbook_source.close()
+                        self.workbook_source = None
                         return
                     elif result is False:  # 使用自动识别
                         self.type_mode.set("auto")
@@ -1015,6 +986,8 @@ class IntegratedApp:
                 self.log_message("打包ZIP：是")
             if self.log_mode.get():
                 self.log_message("生成日志：是")
+            if self.incremental_mode.get():
+                self.log_message("跳过未变动文件：是")
             self.log_message("")
             
             self.update_progress(10, "正在读取Excel文件...")
@@ -1038,7 +1011,9 @@ class IntegratedApp:
                 output_mode=self.output_mode.get(),
                 create_zip=self.zip_mode.get(),
                 save_log=self.log_mode.get(),
-                selected_shops=selected_shops
+                selected_shops=selected_shops,
+                source=self.workbook_source,
+                incremental=self.incremental_mode.get()
             )
             
             # 检查类型不匹配 - 不再需要，改为事前确认
@@ -1086,6 +1061,8 @@ class IntegratedApp:
                     msg_lines.append(f"  已生成：{total_copied} 个")
                     if total_missing > 0:
                         msg_lines.append(f"  缺少：{total_missing} 个")
+                    if result.get('skipped_unchanged'):
+                        msg_lines.append(f"  未变动已跳过：{result['skipped_unchanged']} 个（与上次输出一致）")
                     
                     if result.get('box_ok') or result.get('box_warn'):
                         msg_lines.append(f"\n箱唛统计：")
@@ -1189,6 +1166,9 @@ class IntegratedApp:
             self.root.after(0, lambda msg=error_msg: messagebox.showerror("异常", f"发生异常：{msg}"))
             
         finally:
+            if self.workbook_source is not None:
+                self.workbook_source.close()
+                self.workbook_source = None
             # 恢复界面状态
             self.processing = False
             self.root.after(0, lambda: self.select_btn.config_state("normal"))
@@ -1314,12 +1294,10 @@ class IntegratedApp:
                     return
                 template_dir = Path(template_dir)
             
-            # 扫描螺旋桨相关的PLD文件
-            propeller_files = []
-            for pld_file in template_dir.rglob("*.pld"):
-                filename = pld_file.name
-                if any(keyword in filename for keyword in ["螺旋桨", "propeller", "螺桨"]):
-                    propeller_files.append(filename)
+            # 扫描螺旋桨相关的PLD文件，同时并行提取商品编码（按文件内容哈希缓存，映射窗口直接取用）
+            from wrapper import core
+            propeller_files, codes = core.scan_propeller_codes(template_dir, keywords=("螺旋桨", "propeller", "螺桨"))
+            self.propeller_code_scan = (str(template_dir), codes)
             
             if not propeller_files:
                 messagebox.showinfo("扫描结果", "未发现螺旋桨相关的PLD文件")
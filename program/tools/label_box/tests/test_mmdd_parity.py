@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+日期批改单遍引擎与多遍参考实现的一致性测试
+
+patch_mmdd_single_pass 必须与 patch_mmdd_multipass 写回完全相同的字节、返回相同的计数。
+覆盖随附的全部 .pld 模板，以及含 SN 串/独立4位月日的随机字节串。
+
+用法（在 program 目录下）：
+    python -m pytest -q tools/label_box/tests
+    python -m unittest discover -s tools/label_box/tests
+"""
+import importlib.util
+import random
+import sys
+import unittest
+from pathlib import Path
+
+# 与 wrapper 相同的方式加载 core.py（模块名 label_box_core）
+_CORE_PATH = Path(__file__).resolve().parent.parent / "core.py"
+if "label_box_core" in sys.modules:
+    core = sys.modules["label_box_core"]
+else:
+    _spec = importlib.util.spec_from_file_location("label_box_core", _CORE_PATH)
+    core = importlib.util.module_from_spec(_spec)
+    sys.modules["label_box_core"] = core
+    _spec.loader.exec_module(core)
+
+# 仓库根目录下的模板（与 wrapper 开发环境的 root_dir 一致）
+TEMPLATE_ROOT = Path(__file__).resolve().parents[4] / "templates"
+TARGET_MMDD = (b"0918", b"1231", b"0000", b"1340")
+
+FUZZ_SEED = 20250918
+FUZZ_ROUNDS = 3000
+FUZZ_ALPHABET = b"0123456789SN-ab \x00\x01\xff" + b"0918"
+FUZZ_SN = (b"SN20250918001", b"SN20250918001 ---- 1012 ", b"AB1234567890123", b"x0918y1231")
+
+
+def _patch_both(data: bytes, new_b: bytes):
+    buf_multi, buf_single = bytearray(data), bytearray(data)
+    counts_multi = core.patch_mmdd_multipass(data, buf_multi, new_b)
+    counts_single = core.patch_mmdd_single_pass(data, buf_single, new_b)
+    return (bytes(buf_multi), tuple(counts_multi)), (bytes(buf_single), tuple(counts_single))
+
+
+class MmddParityTest(unittest.TestCase):
+
+    def assertParity(self, data: bytes, new_b: bytes, label: str):
+        (buf_multi, counts_multi), (buf_single, counts_single) = _patch_both(data, new_b)
+        self.assertEqual(counts_single, counts_multi, f"{label} -> {new_b!r} 计数不一致")
+        if buf_single != buf_multi:
+            diff_at = next(i for i, (a, b) in enumerate(zip(buf_single, buf_multi)) if a != b)
+            self.fail(f"{label} -> {new_b!r} 第 {diff_at} 字节起写回结果不一致")
+
+    def test_bundled_templates(self):
+        files = sorted(TEMPLATE_ROOT.rglob("*.pld")) if TEMPLATE_ROOT.is_dir() else []
+        if not files:
+            self.skipTest(f"未找到模板目录：{TEMPLATE_ROOT}")
+        for path in files:
+            data = path.read_bytes()
+            for new_b in TARGET_MMDD:
+                with self.subTest(file=path.name, mmdd=new_b):
+                    self.assertParity(data, new_b, path.name)
+
+    def test_randomized_bytes(self):
+        rng = random.Random(FUZZ_SEED)
+        for i in range(FUZZ_ROUNDS):
+            data = bytes(rng.choice(FUZZ_ALPHABET) for _ in range(rng.randint(0, 400)))
+            if rng.random() < 0.7:
+                data = data.replace(b"ab", rng.choice(FUZZ_SN))
+            new_b = rng.choice(TARGET_MMDD)
+            with self.subTest(round=i):
+                self.assertParity(data, new_b, f"fuzz#{i}")
+
+    def test_counts_are_exercised(self):
+        """随机样本需真正触发四类改写，否则一致性测试形同虚设"""
+        rng = random.Random(FUZZ_SEED)
+        totals = [0, 0, 0, 0]
+        for _ in range(500):
+            data = bytes(rng.choice(FUZZ_ALPHABET) for _ in range(rng.randint(0, 400)))
+            data = data.replace(b"ab", b"SN20250918001 ---- 1012 ")
+            _, (_, counts) = _patch_both(data, b"0918")
+            totals = [t + c for t, c in zip(totals, counts)]
+        self.assertTrue(all(totals), f"四类计数：{totals}")
+
+
+if __name__ == "__main__":
+    unittest.main()
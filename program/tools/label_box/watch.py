@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+标签箱唛 监视文件夹模式（常驻进程）
+
+用法（在 program 目录下）：
+    python -m tools.label_box --watch D:/配货表收件箱 -o D:/输出 --zip
+    python -m tools.label_box --watch D:/配货表收件箱 --jobs 2 --poll 1 --settle 3
+
+轮询收件箱目录中的 Excel 工作簿：大小与修改时间连续两次轮询不变、且最后修改已超过 settle 秒
+才视为写入完成，放入队列，由固定数量的工作线程调用 wrapper.process_excel_file 处理。
+处理成功的工作簿移入 收件箱/已处理，失败的移入 收件箱/处理失败（文件被占用无法移动时按大小/mtime 记住，不会重复处理）。
+每个工作线程常驻一份模板索引（模板树有变动时自动重建），新工作簿不再重复导入与建索引。
+--jobs>1 时不同工作簿并行处理；同一日期、同一类型的工作簿写入相同的输出文件夹/压缩包，由 wrapper 按输出锁串行。
+每个工作簿的结果以一行 JSON 输出到 stdout，处理日志输出到 stderr。
+"""
+import json
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    from . import wrapper
+    from .cli import EXCEL_SUFFIXES
+except ImportError:
+    import wrapper
+    from cli import EXCEL_SUFFIXES
+
+DONE_DIRNAME = "已处理"
+FAILED_DIRNAME = "处理失败"
+DEFAULT_POLL = 2.0
+DEFAULT_SETTLE = 2.0
+
+
+class InboxWatcher:
+    """
+    收件箱监视器。
+
+    scan() 做一次轮询并把已写入完成的工作簿提交给线程池；run() 循环轮询直到 stop() 或 Ctrl+C。
+    process_kwargs 原样传给 wrapper.process_excel_file（type_mode/output_mode/create_zip/workers 等）。
+    """
+    def __init__(self, inbox, output=None, jobs=1, poll=DEFAULT_POLL, settle=DEFAULT_SETTLE,
+                 move_done=True, callback=None, on_result=None, **process_kwargs):
+        self.inbox = Path(inbox)
+        self.output = output
+        self.jobs = max(1, int(jobs))
+        self.poll = max(0.1, float(poll))
+        self.settle = max(0.0, float(settle))
+        self.move_done = move_done
+        self.callback = callback
+        self.on_result = on_result
+        self.process_kwargs = process_kwargs
+        self._seen = {}        # 路径 -> (size, mtime_ns, 首次看到该签名的时刻)
+        self._handled = {}     # 路径 -> (size, mtime_ns)：已处理但未能移走的工作簿
+        self._inflight = set()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="label_box_watch")
+
+    def log(self, msg):
+        if self.callback:
+            self.callback(msg)
+
+    def _index_cache(self) -> dict:
+        # 每个工作线程一份模板索引：解析器带命中统计与记忆，不在线程间共享
+        cache = getattr(self._local, "index_cache", None)
+        if cache is None:
+            cache = self._local.index_cache = {}
+        return cache
+
+    def _candidates(self):
+        try:
+            entries = list(self.inbox.iterdir())
+        except OSError:
+            return []
+        return sorted(p for p in entries
+                      if p.suffix.lower() in EXCEL_SUFFIXES and not p.name.startswith("~$") and p.is_file())
+
+    def scan(self) -> int:
+        """轮询一次，返回本次新提交的工作簿数"""
+        now = time.time()
+        submitted = 0
+        present = set()
+        for path in self._candidates():
+            key = str(path)
+            present.add(key)
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            sig = (st.st_size, st.st_mtime_ns)
+            with self._lock:
+                if key in self._inflight or self._handled.get(key) == sig:
+                    continue
+            prev = self._seen.get(key)
+            if prev is None or prev[:2] != sig:
+                self._seen[key] = (*sig, now)  # 新文件或仍在写入：重新计时
+                continue
+            if now - st.st_mtime < self.settle or st.st_size == 0:
+                continue
+            del self._seen[key]
+            with self._lock:
+                self._inflight.add(key)
+            self._pool.submit(self._process, path, sig, prev[2])
+            submitted += 1
+        # 已移走/删除的文件不再跟踪
+        for key in [k for k in self._seen if k not in present]:
+            del self._seen[key]
+        with self._lock:
+            for key in [k for k in self._handled if k not in present]:
+                del self._handled[key]
+        return submitted
+
+    def _move(self, path: Path, dirname: str):
+        dest_dir = self.inbox / dirname
+        dest_dir.mkdir(exist_ok=True)
+        dest = dest_dir / path.name
+        n = 1
+        while dest.exists():
+            n += 1
+            dest = dest_dir / f"{path.stem}-{n}{path.suffix}"
+        shutil.move(str(path), str(dest))
+        return dest
+
+    def _process(self, path: Path, sig, seen_at: float):
+        key = str(path)
+        started = time.time()
+        self.log(f"\n##### {path.name} #####")
+        try:
+            result = wrapper.process_excel_file(
+                str(path), output_base=self.output, callback=self.callback,
+                index_cache=self._index_cache(), **self.process_kwargs,
+            )
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        finished = time.time()
+        moved_to = None
+        if self.move_done:
+            try:
+                moved_to = self._move(path, DONE_DIRNAME if result.get("success") else FAILED_DIRNAME)
+            except OSError as e:
+                self.log(f"  无法移动 {path.name}（{e}），本次运行内不再重复处理")
+        record = {
+            "workbook": key,
+            "moved_to": str(moved_to) if moved_to else None,
+            "process_seconds": round(finished - started, 3),
+            "latency_seconds": round(finished - seen_at, 3),  # 从首次发现到处理完成
+            "result": result,
+        }
+        state = "✓" if result.get("success") else "✗"
+        self.log(f"{state} {path.name}：处理 {record['process_seconds']:.2f} 秒，"
+                 f"从放入到完成 {record['latency_seconds']:.2f} 秒")
+        with self._lock:
+            self._inflight.discard(key)
+            if moved_to is None:
+                self._handled[key] = sig
+        if self.on_result:
+            self.on_result(record)
+        return record
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """循环轮询直到 stop() 或 Ctrl+C；退出前等待已提交的工作簿处理完"""
+        self.inbox.mkdir(parents=True, exist_ok=True)
+        self.log(f"正在监视：{self.inbox}（每 {self.poll:g} 秒轮询，{self.jobs} 个工作线程，Ctrl+C 退出）")
+        try:
+            while not self._stop.is_set():
+                self.scan()
+                self._stop.wait(self.poll)
+        except KeyboardInterrupt:
+            self.log("\n正在退出，等待处理中的工作簿完成...")
+        finally:
+            self._pool.shutdown(wait=True)
+
+
+def run_watch(inbox, output=None, jobs=1, poll=DEFAULT_POLL, settle=DEFAULT_SETTLE, callback=None, **process_kwargs):
+    """命令行入口：每处理完一个工作簿向 stdout 输出一行 JSON"""
+    print_lock = threading.Lock()
+
+    def emit(record):
+        with print_lock:
+            print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
+
+    InboxWatcher(inbox, output=output, jobs=jobs, poll=poll, settle=settle,
+                 callback=callback, on_result=emit, **process_kwargs).run()
+    return 0
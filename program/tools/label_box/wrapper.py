@@ -4,7 +4,6 @@
 """
 import sys
 from pathlib import Path
-from openpyxl import load_workbook
 
 # 导入核心模块
 import importlib.util
@@ -12,6 +11,8 @@ spec = importlib.util.spec_from_file_location("label_box_core", Path(__file__).p
 core = importlib.util.module_from_spec(spec)
 sys.modules['label_box_core'] = core
 spec.loader.exec_module(core)
+# 进程池子进程通过导入本模块来注册 label_box_core
+core.POOL_BOOTSTRAP_MODULE = __name__
 
 
 def read_green_rows_from_sheet(wb, real_sheet_name, id_col=5, sku_col=1, e_col=5, start_row=2, debug=False):
@@ -110,7 +111,8 @@ def read_green_rows_from_sheet(wb, real_sheet_name, id_col=5, sku_col=1, e_col=5
 
 
 def process_excel_file(workbook_path, output_base=None, callback=None, progress_callback=None,
-                       type_mode="auto", output_mode="both", create_zip=False, save_log=False, selected_shops=None, label_type_simple_override=None):
+                       type_mode="auto", output_mode="both", create_zip=False, save_log=False, selected_shops=None, label_type_simple_override=None,
+                       workers=1, source=None, index_cache=None, incremental=False, zip_level=6, zip_threads=1):
     """
     处理Excel文件的包装函数（整理后版本）
     
@@ -121,12 +123,20 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
         progress_callback: 进度回调函数 progress_callback(value, text)
         type_mode: 类型模式 ("auto"/"3c"/"toy")
         output_mode: 输出模式 ("both"/"label"/"box")
-        create_zip: 是否创建ZIP
+        create_zip: 是否创建ZIP（输出生成时直接流式写入压缩包）
         save_log: 是否保存日志文件
         selected_shops: 选中的店铺列表（用于标签筛选）
+        workers: 标签日期批改的并行进程数（1=串行，<=0=按CPU核数）
+        source: 已打开的 core.WorkbookSource（可选，与界面的类型检查共用，由调用方负责关闭）
+        index_cache: 跨工作簿复用的模板索引缓存 {模板目录: TemplateResolver}（可选，批处理/监视模式传入同一个字典；
+                     模板树有变动时自动重建）
+        incremental: 按输出清单跳过上次已生成且未变动的文件（默认 False=全部重新生成；命令行/监视模式默认开启）
+        zip_level: ZIP 压缩级别（0=仅存储，1-9=deflate 级别）
+        zip_threads: ZIP 压缩线程数（>1 时并行压缩、按顺序写入）
     
     返回:
-        处理结果字典
+        处理结果字典（含 "timings"：分阶段耗时与计数，并汇总到日志；
+        设置环境变量 LABEL_BOX_PROFILE=1 时另在输出基础目录写出 label_box_timings.json 与 cProfile 结果）
     """
     def log(msg):
         if callback:
@@ -159,19 +169,32 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
     
     # 确保输出目录存在
     output_base.mkdir(parents=True, exist_ok=True)
+    manifest = core.OutputManifest(output_base) if incremental else None
+    label_zip = box_zip = None
+    output_lock = None
+    timings = None
     
     workbook_path = Path(workbook_path)
     
+    owns_source = source is None
     try:
+        timings = core.RunTimings()
+        timings.phase("打开工作簿")
         progress(10, "正在打开工作簿...")
         log(f"正在打开工作簿：{workbook_path.name}...")
-        wb = load_workbook(filename=str(workbook_path), data_only=True)
+        if owns_source:
+            source = core.WorkbookSource(workbook_path)
+        wb = source.stream
+        timings.count("workbook_bytes", workbook_path.stat().st_size)
     except Exception as e:
+        if timings:
+            timings.finish()  # 停止采样
         log(f"✗ 无法打开工作簿：{e}")
         return {"success": False, "error": str(e)}
     
     try:
         # 统一识别
+        timings.phase("识别工作表")
         progress(15, "正在识别工作表...")
         log("正在识别工作表...")
         sheet_name_map = core.resolve_sheet_names(wb)
@@ -198,10 +221,18 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
         
         log(f"识别类型：{label_type_full}")
         
+        timings.phase("提取日期")
         progress(20, "提取日期信息...")
-        mmdd = core.extract_date_tag_from_wb(wb, sheet_name_map)
+        mmdd, date_src_note = core.extract_date_tag_and_note(wb, sheet_name_map)
         log(f"提取日期(MMDD)：{mmdd}")
-        log(f"日期来源：{core.DATE_SRC_NOTE}")
+        log(f"日期来源：{date_src_note}")
+        
+        # 同一输出基础目录下同日期、同类型的工作簿写入相同的输出文件夹/压缩包，并发处理（监视模式）时串行执行
+        lock = core.path_lock(output_base, mmdd, label_type_name)
+        if not lock.acquire(blocking=False):
+            log(f"等待同一输出（{mmdd}-{label_type_name}）的其它工作簿处理完成...")
+            lock.acquire()
+        output_lock = lock
         
         # 不再创建统一的主文件夹，标签和箱唛分别输出
         log(f"\n输出基础目录：{output_base}")
@@ -213,6 +244,7 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
                 log(f"✗ {msg}")
                 return {"success": False, "error": msg}
             
+            timings.phase("生成预定表")
             progress(25, "正在生成预定表...")
             log("\n=== 生成仅预定表 ===")
             
@@ -223,6 +255,7 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
             result = core.generate_reservation_table(wb, sheet_name_map, output_path, callback=callback)
             
             if result["success"]:
+                timings.count("rows", result["total_rows"])
                 progress(100, "✓ 预定表生成完成！")
                 log(f"\n✓ 预定表生成完成：{output_path}")
                 return {
@@ -233,7 +266,8 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
                     "main_output": str(output_base),
                     "mmdd": mmdd,
                     "label_type": label_type_full,
-                    "label_type_name": label_type_name
+                    "label_type_name": label_type_name,
+                    "timings": timings.to_dict()
                 }
             else:
                 return {"success": False, "error": "生成预定表失败"}
@@ -243,6 +277,7 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
         out_root_label = None
         
         if output_mode in ["both", "label"]:
+            timings.phase("标签模板索引")
             progress(25, "开始生成标签...")
             log("\n=== 开始生成标签 ===")
             
@@ -259,9 +294,17 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
             out_root_label = output_base / f"{mmdd}-{label_type_name}标签"
             out_root_label.mkdir(parents=True, exist_ok=True)
             log(f"标签输出目录：{out_root_label}")
+            if create_zip:
+                label_zip = core.ZipStreamWriter(output_base / f"{mmdd}-{label_type_name}标签.zip", zip_level, zip_threads)
             
-            pld_index, pld_entries = core.build_pld_index(source_base)
-            log(f"已索引 {len(pld_index)} 个标签模板文件")
+            resolver = index_cache.get(str(source_base)) if index_cache is not None else None
+            if resolver is None or resolver.is_stale(source_base):
+                resolver = core.TemplateResolver.from_dir(source_base)
+                if index_cache is not None:
+                    index_cache[str(source_base)] = resolver
+            else:
+                resolver.reset_stats()
+            log(f"已索引 {len(resolver.pld_index)} 个标签模板文件")
             
             # 根据类型选择不同的文件夹名称
             if label_type_simple == "3C":
@@ -289,8 +332,10 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
             missing_details = {k: [] for k in sheet_to_outfolder.keys()}  # 存储缺少标签的详细信息
             copied_map = {k: 0 for k in sheet_to_outfolder.keys()}
             total_expected = 0  # 应该生成的总标签数
+            patch_rows = []  # 拷贝时已同步完成日期批改，汇总成批改报告
             
             progress(30, "正在复制标签文件...")
+            skipped_before = manifest.skipped if manifest else 0
             for exp_sheet, outfolder in sheet_to_outfolder.items():
                 real_sheet = sheet_name_map.get(exp_sheet)
                 if not real_sheet:
@@ -299,10 +344,12 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
                 
                 log(f"\n处理工作表：{exp_sheet} → {outfolder}")
                 
+                timings.phase("读取配货表")
                 try:
                     # 特殊处理：兽无人机拆2排除红字行
                     if exp_sheet == "兽无人机拆2":
-                        rows, debug_info = read_green_rows_from_sheet(wb, real_sheet_name=real_sheet, debug=True)
+                        # 字体颜色只有完整加载模式可靠，此处按需完整加载
+                        rows, debug_info = read_green_rows_from_sheet(source.full(), real_sheet_name=real_sheet, debug=True)
                         log(f"  筛选非红字行：{len(rows)} 个")
                         if debug_info:
                             log(f"  调试信息：检测到 {debug_info['total_rows']} 行，保留 {debug_info['green_count']} 行，排除红字 {debug_info['other_count']} 行")
@@ -315,10 +362,14 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
                 dest_dir = out_root_label / outfolder
                 count_before = total_copied
                 found_count = 0
+                # dst -> [src, 命中行数]：同一模板被多行命中只读写一次，计数仍按行累计
+                copy_plan = {}
                 # 统计应该生成的标签数（只计入数字SKU的行，已在read_id_sku_e_from_sheet中过滤）
                 total_expected += len(rows)
                 log(f"  读取行数：{len(rows)} 个（已过滤非数字SKU）")
+                timings.count("rows", len(rows))
                 
+                timings.phase("模板匹配")
                 for row_data in rows:
                     # 处理新的四元组格式 (id, sku, e_val, row_num)
                     if len(row_data) == 4:
@@ -338,35 +389,17 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
                     e_txt = str(e_val)
                     row_idx = row_num
                     
-                    # 螺旋桨特判（增强版）
-                    forced_name = None
-                    if e_txt and ("螺旋桨" in e_txt):
-                        forced_name = core.find_propeller_template(str(sku), raw_id_str, exp_sheet, pld_index, pld_entries)
-                        if forced_name:
-                            log(f"  [螺旋桨] SKU {sku} → 匹配到：{forced_name}")
-                    
+                    # 螺旋桨特判（增强版）+ 通用候选，由解析器按编号记忆
+                    found, cand_names, forced_name = resolver.resolve(exp_sheet, raw_id_str, sku=str(sku), e_txt=e_txt)
                     if forced_name:
-                        cand_names = core.candidate_filenames(exp_sheet, [], forced_names=[forced_name])
-                    else:
-                        id_variants = core.build_variants(raw_id_str)
-                        cand_names = core.candidate_filenames(exp_sheet, id_variants)
-                    
-                    found = core.find_matching_templates(pld_index, cand_names)
+                        log(f"  [螺旋桨] SKU {sku} → 匹配到：{forced_name}")
                     
                     if found:
-                        if not dest_dir.exists():
-                            dest_dir.mkdir(parents=True, exist_ok=True)
-                        
+                        timings.count("template_hits")
                         for src in found:
-                            import shutil
-                            try:
-                                dst = dest_dir / src.name
-                                shutil.copy2(src, dst)
-                                total_copied += 1
-                                found_count += 1
-                            except Exception as e:
-                                log(f"  复制失败：{src.name} → {e}")
+                            copy_plan.setdefault(dest_dir / src.name, [src, 0])[1] += 1
                     else:
+                        timings.count("template_misses")
                         # 标签未找到，添加到缺少列表
                         # 再次检查 SKU 是否是数字，排除非数据行
                         sku_is_number = str(sku).isdigit() if sku else False
@@ -388,11 +421,50 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
                         if forced_name:
                             log(f"  [警告] 螺旋桨文件未找到：{forced_name}（候选：{cand_names}）")
                 
+                # 并发拷贝：每个模板读一次、内存中改日期、写一次
+                if copy_plan:
+                    timings.phase("拷贝+日期批改")
+                    dest_dir.mkdir(parents=True, exist_ok=True)
+                    jobs = [(src, dst) for dst, (src, _) in copy_plan.items()]
+                    results = core.copy_patch_files_incremental(jobs, mmdd, manifest, workers=workers,
+                                                                keep_data=label_zip is not None)
+                    if manifest:
+                        manifest.save()  # 逐表落盘，中途中断时已完成的表下次可跳过
+                    for (src, n_rows), res in zip(copy_plan.values(), results):
+                        if "error" in res:
+                            log(f"  复制失败：{src.name} → {res['error']}")
+                        else:
+                            total_copied += n_rows
+                            found_count += n_rows
+                            timings.count("label_bytes_written", res.get("bytes", 0))
+                            timings.count("label_bytes_read", res.get("read_bytes", 0))
+                    if label_zip:
+                        timings.phase("标签写入ZIP")
+                        # 批改后的字节直接写入压缩包；增量跳过的文件没有字节，从输出目录补读
+                        for (src, dst), res in zip(jobs, results):
+                            data = res.pop("data", None)
+                            if "error" in res:
+                                continue
+                            arcname = dst.relative_to(out_root_label).as_posix()
+                            if data is None:
+                                label_zip.add_file(dst, arcname)
+                            else:
+                                label_zip.add(arcname, data)
+                    patch_rows.extend(results)
+                
                 copied_map[exp_sheet] = total_copied - count_before
                 log(f"  ✓ 已复制 {found_count} 个文件")
             
             log(f"\n标签复制完成，共复制 {total_copied} 个文件")
+            if manifest and manifest.skipped:
+                log(f"增量模式：{manifest.skipped} 个文件与上次一致，已跳过")
+            log(resolver.stats_line())
+            timings.count("label_files", len(patch_rows))
+            if manifest:
+                timings.count("label_files_skipped", manifest.skipped - skipped_before)
+                timings.count("manifest_hash_bytes_read", manifest.bytes_read)
             
+            timings.phase("螺旋桨检查")
             # 检查是否有螺旋桨文件未找到
             propeller_missing = []
             for sheet, missing_ids in missing_map.items():
@@ -427,12 +499,14 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
                     log(f"  - {item['sheet']} / SKU: {item['sku']} / ID: {item['id']}")
             
             # 标签日期批改
+            timings.phase("批改报告")
             progress(60, "正在批改标签日期...")
             log("\n=== 批量修改标签日期 ===")
             
-            # 不再单独保存patch报告文件，直接合并到日志中
-            patch_summary, patch_report = core.run_patch_step(
-                out_root_label, mmdd, ext=".pld", 
+            # 日期已在拷贝时写入，这里只汇总报告（不再单独保存patch报告文件，直接合并到日志中）
+            patch_rows.sort(key=lambda r: Path(r["file"]))
+            patch_summary, patch_report = core.format_patch_report(
+                out_root_label, mmdd, patch_rows,
                 dry=False, make_backup=False, report_dir=None
             )
             log(patch_summary)
@@ -452,9 +526,11 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
         
         # B. 生成箱唛 (如果需要)
         if output_mode in ["both", "box"]:
+            timings.phase("箱唛解析")
             progress(70, "开始生成箱唛...")
             log("\n=== 开始生成箱唛 ===")
-            ws_box = core.find_box_sheet(wb)
+            # 箱唛表流式读取：隐藏行由 sheet_row_info 获取（XML 快速路径，不可用时回退到完整加载）
+            ws_box = core.find_box_sheet(source.stream)
         else:
             ws_box = None
         
@@ -471,11 +547,13 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
                 "label_type_name": label_type_name,
                 "auto_detected_type": auto_detected_type,
                 "used_type": label_type_simple,
-                "type_mismatch": (type_mode != "auto" and label_type_simple != auto_detected_type)
+                "type_mismatch": (type_mode != "auto" and label_type_simple != auto_detected_type),
+                "skipped_unchanged": manifest.skipped if manifest else 0,
+                "timings": timings.to_dict()
             }
         
         store_sub = core.decide_store_subfolder(ws_box)
-        entries = core.parse_entries(ws_box)
+        entries = core.parse_entries(ws_box, source)
         
         if not entries:
             log("✗ 箱唛工作表中未识别到有效条目")
@@ -490,10 +568,13 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
                 "label_type_name": label_type_name,
                 "auto_detected_type": auto_detected_type,
                 "used_type": label_type_simple,
-                "type_mismatch": (type_mode != "auto" and label_type_simple != auto_detected_type)
+                "type_mismatch": (type_mode != "auto" and label_type_simple != auto_detected_type),
+                "skipped_unchanged": manifest.skipped if manifest else 0,
+                "timings": timings.to_dict()
             }
         
         log(f"识别到 {len(entries)} 个箱唛条目")
+        timings.count("box_entries", len(entries))
         
         # 使用新的模板路径
         box_tpl_dir = template_base / "箱唛模板" / box_kind_dirname
@@ -510,7 +591,9 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
                 "label_type_name": label_type_name,
                 "auto_detected_type": auto_detected_type,
                 "used_type": label_type_simple,
-                "type_mismatch": (type_mode != "auto" and label_type_simple != auto_detected_type)
+                "type_mismatch": (type_mode != "auto" and label_type_simple != auto_detected_type),
+                "skipped_unchanged": manifest.skipped if manifest else 0,
+                "timings": timings.to_dict()
             }
         
         log(f"箱唛模板目录：{box_tpl_dir}")
@@ -521,10 +604,17 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
             out_root_box = out_root_box / store_sub
         out_root_box.mkdir(parents=True, exist_ok=True)
         log(f"箱唛输出目录：{out_root_box}")
+        box_sink = None
+        if create_zip:
+            box_zip = core.ZipStreamWriter(output_base / f"{mmdd}-{label_type_name}箱唛.zip", zip_level, zip_threads)
+            box_sink = lambda path, data: box_zip.add(path.relative_to(out_root_box).as_posix(), data)
         
         city_counts = {}
         total_ok = total_warn = 0
+        box_patcher = core.BoxMarkPatcher()
+        skipped_before = manifest.skipped if manifest else 0
         
+        timings.phase("箱唛生成")
         progress(75, "正在生成箱唛文件...")
         for ent in entries:
             city = ent["city"]
@@ -539,9 +629,20 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
             city_counts[city] = cnt
             out_path = out_root_box / (tpl.name if cnt == 1 else f"{tpl.stem}-{cnt}{tpl.suffix}")
             
-            import shutil
-            shutil.copy2(tpl, out_path)
-            changed, warns, debug = core.patch_pld_with_entry(out_path, out_path, ent)
+            key = prev = None
+            if manifest:
+                key = manifest.fingerprint(tpl, {"box": [ent["city"], ent["po"], ent["supplier"], ent["depot"], ent["no"]]})
+                prev = manifest.lookup(out_path, key)
+            if prev is not None:
+                changed, warns, debug = prev
+                if box_zip:
+                    box_zip.add_file(out_path, out_path.relative_to(out_root_box).as_posix())
+            else:
+                changed, warns, debug = box_patcher.patch(tpl, out_path, ent, sink=box_sink)
+                timings.count("box_files")
+                timings.count("box_bytes_written", out_path.stat().st_size)
+                if key:
+                    manifest.record(out_path, key, [changed, warns, debug])
             
             if warns:
                 total_warn += 1
@@ -551,6 +652,11 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
                 log(f"  ✓ [{city}] {out_path.name}")
         
         log(f"\n箱唛生成完成：成功 {total_ok} 个，警告 {total_warn} 个")
+        log(box_patcher.stats_line())
+        if manifest and manifest.skipped > skipped_before:
+            log(f"增量模式：{manifest.skipped - skipped_before} 个箱唛与上次一致，已跳过")
+            timings.count("box_files_skipped", manifest.skipped - skipped_before)
+        timings.count("box_template_bytes_read", box_patcher.bytes_read)
         
         progress(95, "处理完成...")
         
@@ -558,27 +664,21 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
         
         # ZIP打包功能
         if create_zip:
+            timings.phase("ZIP收尾")
             progress(97, "正在打包ZIP...")
             log("\n=== 打包ZIP文件 ===")
-            import shutil
             
             zip_files = []
             try:
-                # 打包标签文件夹
-                if out_root_label and out_root_label.exists():
-                    zip_name = f"{mmdd}-{label_type_name}标签"
-                    zip_path = output_base / zip_name
-                    shutil.make_archive(str(zip_path), 'zip', str(out_root_label))
-                    zip_files.append(f"{zip_name}.zip")
-                    log(f"  ✓ 已打包：{zip_name}.zip")
-                
-                # 打包箱唛文件夹
-                if output_mode in ["both", "box"] and out_root_box and out_root_box.exists():
-                    zip_name = f"{mmdd}-{label_type_name}箱唛"
-                    zip_path = output_base / zip_name
-                    shutil.make_archive(str(zip_path), 'zip', str(out_root_box))
-                    zip_files.append(f"{zip_name}.zip")
-                    log(f"  ✓ 已打包：{zip_name}.zip")
+                # 标签/箱唛在生成时已流式写入，这里只收尾（写中央目录并改为正式文件名）
+                for writer in (label_zip, box_zip):
+                    if writer:
+                        writer.commit()
+                        zip_files.append(writer.path.name)
+                        timings.count("zip_bytes_written", writer.path.stat().st_size)
+                        if writer.bytes_read:
+                            timings.count("zip_bytes_reread", writer.bytes_read)  # 增量跳过的文件从输出目录补读
+                        log(f"  ✓ 已打包：{writer.path.name}")
                 
                 log(f"\nZIP打包完成，共生成 {len(zip_files)} 个压缩包")
             except Exception as zip_err:
@@ -603,7 +703,9 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
             "auto_detected_type": auto_detected_type,
             "used_type": label_type_simple,
             "type_mismatch": (type_mode != "auto" and label_type_simple != auto_detected_type),
-            "propeller_missing": propeller_missing  # 添加螺旋桨未找到的信息
+            "propeller_missing": propeller_missing,  # 添加螺旋桨未找到的信息
+            "skipped_unchanged": manifest.skipped if manifest else 0,  # 增量模式下与上次一致而跳过的文件数
+            "timings": timings.to_dict()
         }
         
     except Exception as e:
@@ -612,6 +714,23 @@ def process_excel_file(workbook_path, output_base=None, callback=None, progress_
         log(f"\n✗ 处理异常：{e}")
         log(error_trace)
         return {"success": False, "error": str(e), "traceback": error_trace}
+    finally:
+        for writer in (label_zip, box_zip):
+            if writer:
+                writer.close()  # 未完成打包的临时文件在此丢弃
+        if manifest:
+            manifest.save()  # 出错中断时也保留已完成部分的记录
+        if output_lock:
+            output_lock.release()
+        if owns_source:
+            source.close()
+        # 分阶段耗时汇总到日志（出错中断时也输出已完成的阶段）；仅在采样时写出明细文件，不在输出目录留下多余文件
+        timings_path = timings.save(output_base / core.TIMINGS_NAME) if timings.profiling else None
+        log("\n=== 耗时统计 ===")
+        for line in timings.breakdown_lines():
+            log(line)
+        if timings_path:
+            log(f"耗时明细：{timings_path}")
 
 
 if __name__ == "__main__":
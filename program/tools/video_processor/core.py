@@ -0,0 +1,606 @@
+# -*- coding: utf-8 -*-
+"""
+视频处理核心模块（与界面无关）
+- FFmpegScheduler：多个 ffmpeg 进程并发执行，按 CPU 核数分配并发数与每个进程的编码线程数，支持取消；
+  通过 -progress pipe:1 实时解析编码进度（单个文件与总进度、剩余时间、fps），stderr 只保留末尾若干行
+- ProbeCache：ffprobe 结果缓存（路径+大小+修改时间为键），持久化到本地，添加视频时后台并发预取
+- plan_conversion：格式转换时按探测结果判断能否直接封装（-c copy），只转码不兼容的流
+- encode_to_size：按目标文件大小两遍编码（libx264），超出目标时仅重跑第二遍校正码率
+"""
+import glob
+import json
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+CREATE_NO_WINDOW = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+
+# libx264 在 4 线程以内扩展接近线性，再多收益递减；默认按每个编码进程 4 线程切分 CPU
+DEFAULT_THREADS_PER_JOB = 4
+
+PROGRESS_INTERVAL = 0.25   # 进度回调的最短间隔（秒），避免刷屏拖慢界面
+STDERR_TAIL_LINES = 40     # 只保留 ffmpeg stderr 的最后若干行用于报错
+STDERR_LINE_MAX = 1000     # 单行超长时截断
+
+
+class JobCancelled(Exception):
+    """调度器已取消：运行中的 ffmpeg 被终止，尚未开始的任务不再执行"""
+
+
+def format_eta(seconds):
+    """剩余秒数转为 h:mm:ss / m:ss"""
+    seconds = max(0, int(seconds))
+    h, rem = divmod(seconds, 3600)
+    m, sec = divmod(rem, 60)
+    return f"{h}:{m:02d}:{sec:02d}" if h else f"{m}:{sec:02d}"
+
+
+def _read_tail(stream, tail):
+    # stderr 排空线程：逐行读取，只留最后 STDERR_TAIL_LINES 行
+    for line in iter(stream.readline, b''):
+        tail.append(line if len(line) <= STDERR_LINE_MAX else line[:STDERR_LINE_MAX] + b'...\n')
+    stream.close()
+
+
+def plan_job_slots(n_jobs, cpu_count=None, threads_per_job=None):
+    """
+    返回 (并发数, 每个 ffmpeg 的 -threads)。
+    并发数 = 核数 // 每进程线程数（至少 1，且不超过任务数）；
+    未指定每进程线程数时，任务数少于可并发数的部分核分给每个进程。
+    """
+    cpus = cpu_count or os.cpu_count() or 1
+    per_job = threads_per_job or DEFAULT_THREADS_PER_JOB
+    slots = max(1, min(max(n_jobs, 1), cpus // per_job or 1))
+    threads = threads_per_job or max(1, cpus // slots)
+    return slots, threads
+
+
+class FFmpegScheduler:
+    """
+    ffmpeg 并发任务调度。
+
+    map(fn, items) 在线程池中对每个条目执行 fn(item)，fn 内可多次调用 run(cmd) 启动 ffmpeg；
+    返回与 items 顺序一致的结果列表，fn 抛出的异常（含 JobCancelled）作为结果返回，不中断其它任务。
+    cancel() 可在任意线程调用：终止运行中的 ffmpeg，未开始的任务直接以 JobCancelled 结束。
+    on_progress(snapshot) 在编码过程中（工作线程里）按 PROGRESS_INTERVAL 节流回调，snapshot 见 progress_snapshot()；
+    多个工作线程的回调可能乱序到达，调用方按 snapshot["seq"] 丢弃比已显示的更旧的快照。
+    """
+    def __init__(self, n_jobs, max_jobs=None, threads_per_job=None, on_progress=None):
+        self.max_jobs, self.threads = plan_job_slots(n_jobs, threads_per_job=threads_per_job)
+        if max_jobs:
+            self.max_jobs = max(1, min(max_jobs, max(n_jobs, 1)))
+            self.threads = threads_per_job or max(1, (os.cpu_count() or 1) // self.max_jobs)
+        self.on_progress = on_progress
+        self._cancel = threading.Event()
+        self._procs = set()
+        self._lock = threading.Lock()
+        self._path_locks = {}
+        self._local = threading.local()
+        self._items = []
+        self._fractions = {}   # 条目序号 -> 该条目完成比例（0~1，只增不减）
+        self._done = 0
+        self._fps = {}         # 条目序号 -> 正在运行的 ffmpeg 最近一次报告的 fps
+        self._started = time.monotonic()
+        self._last_emit = 0.0
+        self._seq = 0          # 快照序号，与快照内容在同一把锁下生成
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def thread_args(self):
+        """编码命令的 -threads 参数（放在输出文件之前），避免多个编码进程各自占满全部核"""
+        return ['-threads', str(self.threads)]
+
+    def exclusive(self, key):
+        """同一输出路径的任务串行执行（不同目录下同名视频会写到同一个输出文件）"""
+        with self._lock:
+            return self._path_locks.setdefault(str(key), threading.Lock())
+
+    def run(self, cmd, duration=None, span=(0.0, 1.0)):
+        """
+        启动 ffmpeg 并等待结束，返回 (returncode, stderr 最后若干行)；已取消时抛出 JobCancelled。
+        给出 duration（秒）时加 -progress pipe:1 -nostats 实时解析编码位置，
+        按 span 映射为当前条目的完成比例（多遍编码时每遍占一段）。
+        """
+        if self._cancel.is_set():
+            raise JobCancelled()
+        track = bool(duration and duration > 0)
+        if track:
+            cmd = [cmd[0], '-progress', 'pipe:1', '-nostats', *cmd[1:]]
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE if track else subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            creationflags=CREATE_NO_WINDOW
+        )
+        tail = deque(maxlen=STDERR_TAIL_LINES)
+        drain = threading.Thread(target=_read_tail, args=(proc.stderr, tail), daemon=True)
+        drain.start()
+        with self._lock:
+            self._procs.add(proc)
+        try:
+            if self._cancel.is_set():
+                proc.kill()  # 登记前已取消
+            if track:
+                self._follow_progress(proc.stdout, duration, span)
+            proc.wait()
+            drain.join()
+        finally:
+            with self._lock:
+                self._procs.discard(proc)
+                self._fps.pop(getattr(self._local, 'index', None), None)
+        if self._cancel.is_set():
+            raise JobCancelled()
+        return proc.returncode, b''.join(tail).decode('utf-8', errors='replace')
+
+    def run_checked(self, cmd, duration=None, span=(0.0, 1.0)):
+        """同 run()，ffmpeg 返回非 0 时抛出带 stderr 末尾内容的 RuntimeError"""
+        returncode, stderr = self.run(cmd, duration, span)
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg 退出码 {returncode}: {stderr.strip()[-500:]}")
+
+    def _follow_progress(self, stream, duration, span):
+        # -progress 每个块由若干 key=value 行组成，以 progress=continue/end 结束
+        lo, hi = span
+        out_us = fps = None
+        for raw in iter(stream.readline, b''):
+            key, _, value = raw.decode('ascii', errors='ignore').strip().partition('=')
+            if key in ('out_time_us', 'out_time_ms'):  # 两者单位都是微秒（out_time_ms 是历史命名）
+                try:
+                    out_us = int(value)
+                except ValueError:
+                    pass
+            elif key == 'fps':
+                try:
+                    fps = float(value)
+                except ValueError:
+                    pass
+            elif key == 'progress':
+                fraction = None
+                if out_us is not None:
+                    fraction = lo + (hi - lo) * min(max(out_us / 1e6 / duration, 0.0), 1.0)
+                self._report(fraction, fps)
+        stream.close()
+
+    def _report(self, fraction, fps):
+        index = getattr(self._local, 'index', None)
+        if index is None:
+            return
+        with self._lock:
+            if fraction is not None:
+                self._fractions[index] = max(self._fractions.get(index, 0.0), fraction)
+            if fps is not None:
+                self._fps[index] = fps
+            now = time.monotonic()
+            if self.on_progress is None or now - self._last_emit < PROGRESS_INTERVAL:
+                return
+            self._last_emit = now
+            snap = self._snapshot_locked(index)
+        self.on_progress(snap)
+
+    def progress_snapshot(self, index=None):
+        """
+        当前进度：{"item": 条目, "file_fraction": 该条目完成比例, "overall": 总完成比例,
+        "done": 已完成条目数, "total": 总数, "eta": 预计剩余秒数或 None, "fps": 运行中编码的 fps 之和,
+        "seq": 快照序号（单调递增，序号越大内容越新）}
+        """
+        with self._lock:
+            return self._snapshot_locked(index)
+
+    def _snapshot_locked(self, index):
+        # 调用方持有 self._lock
+        total = len(self._items) or 1
+        overall = sum(self._fractions.values()) / total
+        done = self._done
+        fps = sum(self._fps.values())
+        file_fraction = self._fractions.get(index, 0.0) if index is not None else None
+        self._seq += 1
+        elapsed = time.monotonic() - self._started
+        eta = elapsed * (1 - overall) / overall if overall >= 0.01 else None
+        return {
+            'item': self._items[index] if index is not None else None,
+            'file_fraction': file_fraction,
+            'overall': overall,
+            'done': done,
+            'total': len(self._items),
+            'eta': eta,
+            'fps': fps,
+            'seq': self._seq
+        }
+
+    def cancel(self):
+        self._cancel.set()
+        with self._lock:
+            procs = list(self._procs)
+        for proc in procs:
+            try:
+                proc.kill()
+            except OSError:
+                pass
+
+    def _call(self, fn, index, item):
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self._local.index = index
+        try:
+            return fn(item)
+        finally:
+            self._local.index = None
+            with self._lock:
+                self._fractions[index] = 1.0
+                self._done += 1
+
+    def map(self, fn, items, on_done=None):
+        """
+        并发执行 fn(item)，返回按 items 顺序排列的结果。
+        每完成一个条目调用 on_done(已完成数, 总数, item, 结果)：在调用 map 的线程中串行调用，完成数单调递增。
+        """
+        items = self._items = list(items)
+        self._fractions = {}
+        self._done = 0
+        self._started = time.monotonic()
+        results = [None] * len(items)
+        with ThreadPoolExecutor(max_workers=self.max_jobs) as ex:
+            futures = {ex.submit(self._call, fn, i, item): i for i, item in enumerate(items)}
+            for done, fut in enumerate(as_completed(futures), 1):
+                i = futures[fut]
+                try:
+                    results[i] = fut.result()
+                except Exception as e:
+                    results[i] = e
+                if on_done:
+                    on_done(done, len(items), items[i], results[i])
+        return results
+
+
+# ========== ffprobe 结果缓存 ==========
+
+PROBE_CACHE_VERSION = 1
+PROBE_CACHE_NAME = "video_probe_cache.json"
+PROBE_CACHE_MAX_ENTRIES = 5000   # 超出时按最近使用时间淘汰
+PROBE_WORKERS = 8                # ffprobe 主要等磁盘读文件头，并发数不必跟核数走
+
+
+def probe_cache_path():
+    """持久化缓存位置：Windows 为 %LOCALAPPDATA%\\Workit，其它系统为 ~/.cache/workit"""
+    base = os.environ.get('LOCALAPPDATA')
+    root = Path(base) / 'Workit' if base else Path.home() / '.cache' / 'workit'
+    return root / PROBE_CACHE_NAME
+
+
+def summarize_probe(info):
+    """从 ffprobe JSON 取第一个视频流的宽高与时长（流上没有时长时用容器时长）；无视频流返回全 0"""
+    for stream in (info or {}).get('streams', []):
+        if stream.get('codec_type') == 'video':
+            duration = stream.get('duration') or (info.get('format') or {}).get('duration') or 0
+            try:
+                duration = float(duration)
+            except (TypeError, ValueError):
+                duration = 0
+            return {
+                'width': stream.get('width', 0),
+                'height': stream.get('height', 0),
+                'duration': duration
+            }
+    return {'width': 0, 'height': 0, 'duration': 0}
+
+
+class ProbeCache:
+    """
+    ffprobe 结果缓存。
+
+    每个文件只运行一次 ffprobe（-show_streams -show_format），完整 JSON 按 (绝对路径, 大小, mtime_ns) 缓存；
+    文件被替换或修改后签名变化，自动重新探测。探测失败不缓存。
+    probe() / prefetch() 可在任意线程调用；同一文件同时被多处请求时只探测一次。
+    缓存首次使用时从磁盘加载，save() 原子写回（只在有变化时写）。
+    """
+    def __init__(self, ffprobe_cmd='ffprobe', path=None):
+        self.ffprobe_cmd = ffprobe_cmd
+        self.path = Path(path) if path else probe_cache_path()
+        self._entries = None   # 路径 -> {"size", "mtime_ns", "used", "info"}
+        self._inflight = {}    # 路径 -> threading.Event（正在探测）
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(video_path):
+        return os.path.normcase(os.path.abspath(str(video_path)))
+
+    def _load(self):
+        # 调用方持有 self._lock
+        if self._entries is not None:
+            return self._entries
+        entries = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == PROBE_CACHE_VERSION:
+                entries = data.get('entries', {})
+        except (OSError, ValueError, AttributeError):
+            pass
+        self._entries = entries
+        return entries
+
+    def _run_ffprobe(self, video_path):
+        cmd = [
+            self.ffprobe_cmd,
+            '-v', 'quiet',
+            '-print_format', 'json',
+            '-show_streams',
+            '-show_format',
+            str(video_path)
+        ]
+        try:
+            result = subprocess.run(
+                cmd,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                creationflags=CREATE_NO_WINDOW
+            )
+        except OSError:
+            return None
+        if result.returncode != 0:
+            return None
+        try:
+            return json.loads(result.stdout.decode('utf-8', errors='replace'))
+        except ValueError:
+            return None
+
+    def cached(self, video_path):
+        """只查缓存不探测：命中返回 ffprobe JSON，否则返回 None"""
+        try:
+            st = os.stat(video_path)
+        except OSError:
+            return None
+        key = self._key(video_path)
+        with self._lock:
+            entry = self._load().get(key)
+            if entry and entry.get('size') == st.st_size and entry.get('mtime_ns') == st.st_mtime_ns:
+                entry['used'] = time.time()
+                return entry['info']
+        return None
+
+    def probe(self, video_path):
+        """返回文件的 ffprobe JSON（缓存未命中时运行一次 ffprobe），失败返回 None"""
+        try:
+            st = os.stat(video_path)
+        except OSError:
+            return None
+        key = self._key(video_path)
+        while True:
+            with self._lock:
+                entry = self._load().get(key)
+                if entry and entry.get('size') == st.st_size and entry.get('mtime_ns') == st.st_mtime_ns:
+                    entry['used'] = time.time()
+                    return entry['info']
+                pending = self._inflight.get(key)
+                if pending is None:
+                    pending = self._inflight[key] = threading.Event()
+                    break
+            # 其它线程正在探测同一文件：等它完成后重新查缓存（它失败时由本线程重试）
+            pending.wait()
+        try:
+            info = self._run_ffprobe(video_path)
+            if info is not None:
+                with self._lock:
+                    self._entries[key] = {
+                        'size': st.st_size,
+                        'mtime_ns': st.st_mtime_ns,
+                        'used': time.time(),
+                        'info': info
+                    }
+                    self._dirty = True
+            return info
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            pending.set()
+
+    def prefetch(self, paths, workers=PROBE_WORKERS):
+        """并发探测尚未缓存的文件并写回磁盘，返回新探测的文件数"""
+        missing = [p for p in paths if self.cached(p) is None]
+        if missing:
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(missing)))) as ex:
+                list(ex.map(self.probe, missing))
+            self.save()
+        return len(missing)
+
+    def save(self):
+        """有变化时原子写回磁盘；超出上限时淘汰最久未使用的条目"""
+        with self._lock:
+            if not self._dirty or self._entries is None:
+                return
+            entries = self._entries
+            if len(entries) > PROBE_CACHE_MAX_ENTRIES:
+                keep = sorted(entries, key=lambda k: entries[k].get('used', 0), reverse=True)
+                self._entries = entries = {k: entries[k] for k in keep[:PROBE_CACHE_MAX_ENTRIES]}
+            text = json.dumps({'version': PROBE_CACHE_VERSION, 'entries': entries}, ensure_ascii=False)
+            self._dirty = False
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(text, encoding='utf-8')
+            os.replace(tmp, self.path)
+        except OSError:
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
+
+
+# ========== 按目标大小压缩 ==========
+
+AUDIO_BITRATE = 128000
+MIN_VIDEO_BITRATE = 32000
+SIZE_SAFETY = 0.97          # 为容器开销预留 3%
+MAX_SIZE_ATTEMPTS = 3       # 两遍编码后结果超出目标时，最多再校正 2 次第二遍
+FALLBACK_CRF = 28           # 取不到时长时按 CRF 压缩，超出目标再逐次提高
+CRF_STEP = 4
+
+
+def format_size(size):
+    """字节数转为 KB/MB 文本"""
+    if size >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.2f} MB"
+    return f"{size / 1024:.1f} KB"
+
+
+def plan_video_bitrate(target_bytes, duration, audio_bitrate=AUDIO_BITRATE):
+    """目标大小对应的视频码率（bit/s）：总码率扣除音频，并预留容器开销"""
+    total = target_bytes * 8 * SIZE_SAFETY / duration
+    return max(int(total - audio_bitrate), MIN_VIDEO_BITRATE)
+
+
+def _remove_passlogs(passlog):
+    # 文件名可能含 []、*、? 等通配符（如 视频[1].mp4），需转义后再匹配 -0.log / -0.log.mbtree 等
+    for f in passlog.parent.glob(glob.escape(passlog.name) + '*'):
+        try:
+            f.unlink()
+        except OSError:
+            pass
+
+
+def encode_to_size(scheduler, ffmpeg_cmd, src, dst, target_bytes, duration):
+    """
+    把 src 压缩到不超过 target_bytes 的 dst。
+
+    有时长：libx264 两遍编码（第一遍只分析画面复杂度，不输出音频）；结果超出目标时按实际/目标比例
+    下调码率，复用第一遍统计只重跑第二遍。无时长：按 CRF 编码，超出目标时提高 CRF 重编。
+    返回 {"size", "target", "attempts", "mode", "bitrate"|"crf", "ok"}；ffmpeg 失败时抛出 RuntimeError。
+    """
+    dst = Path(dst)
+    audio = ['-c:a', 'aac', '-b:a', str(AUDIO_BITRATE)]
+    record = {'target': target_bytes, 'attempts': 0}
+
+    if duration and duration > 0:
+        passlog = dst.with_name(f".{dst.stem}.2pass")
+        bitrate = plan_video_bitrate(target_bytes, duration)
+        record['mode'] = 'two-pass'
+        try:
+            returncode, stderr = scheduler.run([
+                ffmpeg_cmd, '-y', '-i', str(src),
+                '-c:v', 'libx264', '-b:v', str(bitrate),
+                '-pass', '1', '-passlogfile', str(passlog),
+                '-an', *scheduler.thread_args(),
+                '-f', 'null', '-'
+            ], duration, span=(0.0, 0.5))
+            if returncode != 0:
+                raise RuntimeError(f"第一遍编码失败: {stderr.strip()[-300:]}")
+            while True:
+                record['attempts'] += 1
+                record['bitrate'] = bitrate
+                returncode, stderr = scheduler.run([
+                    ffmpeg_cmd, '-y', '-i', str(src),
+                    '-c:v', 'libx264', '-b:v', str(bitrate),
+                    '-pass', '2', '-passlogfile', str(passlog),
+                    *audio, *scheduler.thread_args(),
+                    str(dst)
+                ], duration, span=(0.5, 1.0))
+                if returncode != 0:
+                    raise RuntimeError(f"第二遍编码失败: {stderr.strip()[-300:]}")
+                size = dst.stat().st_size
+                if size <= target_bytes or record['attempts'] >= MAX_SIZE_ATTEMPTS or bitrate <= MIN_VIDEO_BITRATE:
+                    break
+                # 按超出比例下调视频码率（音频码率固定，超出部分全部由视频承担）
+                over_bits = (size - target_bytes * SIZE_SAFETY) * 8 / duration
+                bitrate = max(int(bitrate - over_bits), MIN_VIDEO_BITRATE)
+        finally:
+            _remove_passlogs(passlog)
+    else:
+        crf = FALLBACK_CRF
+        record['mode'] = 'crf'
+        while True:
+            record['attempts'] += 1
+            record['crf'] = crf
+            returncode, stderr = scheduler.run([
+                ffmpeg_cmd, '-y', '-i', str(src),
+                '-c:v', 'libx264', '-crf', str(crf),
+                *audio, *scheduler.thread_args(),
+                str(dst)
+            ])
+            if returncode != 0:
+                raise RuntimeError(f"编码失败: {stderr.strip()[-300:]}")
+            size = dst.stat().st_size
+            if size <= target_bytes or record['attempts'] >= MAX_SIZE_ATTEMPTS or crf >= 51:
+                break
+            crf = min(crf + CRF_STEP, 51)
+
+    record['size'] = size
+    record['ok'] = size <= target_bytes
+    return record
+
+
+# ========== 格式转换：直接封装 / 转码 ==========
+
+# 可直接放入 H.264 + AAC 的目标容器（AVI 对 AAC 支持不好，始终转码）
+COPY_COMPATIBLE = {
+    'mp4': ({'h264'}, {'aac'}),
+    'mov': ({'h264'}, {'aac'}),
+    'mkv': ({'h264'}, {'aac'}),
+}
+FASTSTART_FORMATS = {'mp4', 'mov'}
+
+CONVERT_REMUX = "直接封装"
+CONVERT_PARTIAL = "部分转码"
+CONVERT_ENCODE = "完全转码"
+
+
+def _first_stream_raw(info, codec_type):
+    for stream in (info or {}).get('streams', []):
+        if stream.get('codec_type') == codec_type:
+            return stream
+    return None
+
+
+def _first_stream(info, codec_type):
+    for stream in (info or {}).get('streams', []):
+        if stream.get('codec_type') != codec_type:
+            continue
+        if (stream.get('disposition') or {}).get('attached_pic'):
+            continue  # 内嵌封面图不是视频轨
+        return stream
+    return None
+
+
+def plan_conversion(info, format_ext):
+    """
+    根据 ffprobe 结果决定格式转换方式，返回 (编码参数, 方式)。
+    视频流为 H.264、音频流为 AAC（或没有）且目标容器支持时用 copy，只对不兼容的流转码；
+    探测失败时按完全转码处理。输出为 MP4/MOV 且有流被直接复制时加 +faststart。
+    """
+    video_ok_codecs, audio_ok_codecs = COPY_COMPATIBLE.get(format_ext, (set(), set()))
+    video = _first_stream(info, 'video')
+    audio = _first_stream(info, 'audio')
+    copy_video = video is not None and video.get('codec_name') in video_ok_codecs
+    copy_audio = audio is None or audio.get('codec_name') in audio_ok_codecs
+    if not info or not audio_ok_codecs:
+        copy_video = copy_audio = False
+
+    args = ['-c:v', 'copy'] if copy_video else ['-c:v', 'libx264']
+    args += ['-c:a', 'copy'] if copy_audio else ['-c:a', 'aac']
+    copied_audio = copy_audio and audio is not None
+    if (copy_video or copied_audio) and format_ext in FASTSTART_FORMATS:
+        args += ['-movflags', '+faststart']
+    if copy_video and video is not _first_stream_raw(info, 'video'):
+        # 有内嵌封面图时显式选择真正的视频轨，避免默认选流选中封面
+        args = ['-map', f"0:{video.get('index')}", '-map', '0:a:0?'] + args
+
+    if copy_video and copy_audio:
+        mode = CONVERT_REMUX
+    elif copy_video or copied_audio:
+        mode = CONVERT_PARTIAL
+    else:
+        mode = CONVERT_ENCODE
+    return args, mode
+
+
+def encode_args_for(format_ext):
+    """完全转码参数（直接封装失败时回退用）"""
+    return plan_conversion(None, format_ext)
@@ -9,10 +9,8 @@ import os
 from datetime import datetime
 import threading
 import subprocess
-import json
 import shutil
 from zipfile import ZipFile, ZIP_DEFLATED
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
 import sys
 
@@ -23,6 +21,12 @@ from razer_ui import Razer3DCard, Razer3DRadio, Razer3DCheckbox
 from unified_button import UnifiedButton
 from theme_toggle import ThemeToggleButton
 
+# 导入核心模块
+try:
+    from . import core
+except ImportError:
+    import core
+
 
 class VideoProcessorApp:
     def __init__(self, root):
@@ -40,6 +44,8 @@ class VideoProcessorApp:
         self.output_dir = None
         self.output_dir_manual = False
         self.processing = False
+        self.scheduler = None  # 当前批处理的 ffmpeg 调度器（取消时终止其中的进程）
+        self.probe_cache = core.ProbeCache(self.get_ffmpeg_path()[1])
         
         # 检查ffmpeg是否可用
         self.ffmpeg_available = self.check_ffmpeg()
@@ -666,6 +672,19 @@ class VideoProcessorApp:
         )
         self.progress_bar.pack()
         
+        cancel_btn = tk.Label(
+            self.progress_frame,
+            text="取消",
+            font=("Microsoft YaHei UI", 9),
+            bg=self.colors['bg_card'],
+            fg=self.colors['text_muted'],
+            cursor="hand2"
+        )
+        cancel_btn.pack(pady=(5, 0))
+        cancel_btn.bind("<Button-1>", lambda e: self.cancel_processing())
+        cancel_btn.bind("<Enter>", lambda e: cancel_btn.config(fg=self.colors['primary']))
+        cancel_btn.bind("<Leave>", lambda e: cancel_btn.config(fg=self.colors['text_muted']))
+        
         # 监听处理类型变化
         self._current_mode = None
         
@@ -768,10 +787,13 @@ class VideoProcessorApp:
                 self.output_dir = os.path.dirname(last_file)
                 self.output_path_label.config(text=f"📁 {os.path.basename(self.output_dir)}")
             
+            new_files = []
             for file in files:
                 if file not in self.video_files:
                     self.video_files.append(file)
                     self.video_listbox.insert(tk.END, Path(file).name)
+                    new_files.append(file)
+            self.prefetch_video_info(new_files)
     
     def add_folder(self):
         """添加文件夹中的所有视频"""
@@ -796,13 +818,15 @@ class VideoProcessorApp:
             
             video_paths.sort(key=natural_sort_key)
             
-            added_count = 0
+            new_files = []
             for file_path in video_paths:
                 file_str = str(file_path)
                 if file_str not in self.video_files:
                     self.video_files.append(file_str)
                     self.video_listbox.insert(tk.END, file_path.name)
-                    added_count += 1
+                    new_files.append(file_str)
+            added_count = len(new_files)
+            self.prefetch_video_info(new_files)
             
             if added_count > 0:
                 messagebox.showinfo("成功", f"已添加 {added_count} 个视频")
@@ -907,49 +931,94 @@ class VideoProcessorApp:
             self.root.after(0, lambda: messagebox.showerror("错误", f"处理失败: {e}"))
         finally:
             self.processing = False
+            self.scheduler = None
+            self.probe_cache.save()
             self.root.after(0, lambda: self.process_btn.config_state("normal"))
             self.root.after(0, lambda: self.progress_frame.pack_forget())
     
     def update_progress(self, current, total, text=""):
-        """更新进度"""
+        """更新进度（可在工作线程调用：投递到主循环执行，由主循环负责重绘）"""
         progress = int((current / total) * 100)
-        self.root.after(0, lambda: self.progress_bar.config(value=progress))
-        if text:
-            self.root.after(0, lambda: self.progress_label.config(text=text))
-        self.root.after(0, lambda: self.root.update())
+        def apply():
+            self.progress_bar.config(value=progress)
+            if text:
+                self.progress_label.config(text=text)
+        self.root.after(0, apply)
+    
+    def cancel_processing(self):
+        """取消当前批处理：终止运行中的 ffmpeg，未开始的视频不再处理"""
+        scheduler = self.scheduler
+        if scheduler and not scheduler.cancelled:
+            scheduler.cancel()
+            self.progress_label.config(text="正在取消...")
+    
+    def run_ffmpeg_jobs(self, job, items, verb, threads_per_job=None, progress_range=(0, 100)):
+        """
+        并发处理 items：job(item, scheduler) 在工作线程中执行，返回与 items 顺序一致的结果
+        （job 抛出的异常作为结果返回）。编码过程中按 ffmpeg 实时进度更新进度条（当前文件/总进度/剩余时间/fps）。
+        """
+        items = list(items)
+        start, end = progress_range
+        
+        def progress_text(snap, item):
+            text = f"{verb} {snap['done']}/{snap['total']}: {Path(item).name}"
+            if snap['file_fraction'] is not None and snap['file_fraction'] < 1:
+                text += f" {snap['file_fraction']:.0%}"
+            text += f"  总进度 {snap['overall']:.0%}"
+            if snap['eta'] is not None and snap['overall'] < 1:
+                text += f"  剩余 {core.format_eta(snap['eta'])}"
+            if snap['fps'] > 0:
+                text += f"  {snap['fps']:.0f} fps"
+            return text
+        
+        # 多个工作线程的快照可能乱序到达：只显示比已投递的更新的快照，进度条不会回退
+        shown = {'seq': 0}
+        shown_lock = threading.Lock()
+        
+        def show(snap, item):
+            with shown_lock:
+                if snap['seq'] <= shown['seq']:
+                    return
+                shown['seq'] = snap['seq']
+                self.update_progress(start + (end - start) * snap['overall'], 100, progress_text(snap, item))
+        
+        def on_progress(snap):
+            show(snap, snap['item'])
+        
+        scheduler = self.scheduler = core.FFmpegScheduler(len(items), threads_per_job=threads_per_job,
+                                                          on_progress=on_progress)
+        
+        def on_done(done, total, item, result):
+            if isinstance(result, Exception) and not isinstance(result, core.JobCancelled):
+                print(f"处理 {item} 失败: {result}")
+            show(scheduler.progress_snapshot(), item)
+        
+        self.update_progress(start, 100, f"{verb}（{scheduler.max_jobs} 个并行）...")
+        return scheduler.map(lambda item: job(item, scheduler), items, on_done=on_done)
+    
+    @staticmethod
+    def tally_results(results):
+        """统计 run_ffmpeg_jobs 的结果，返回 (成功, 失败, 跳过, 已取消)"""
+        success = error = skipped = cancelled = 0
+        for r in results:
+            if isinstance(r, core.JobCancelled):
+                cancelled += 1
+            elif r == "skipped":
+                skipped += 1
+            elif r is True:
+                success += 1
+            else:
+                error += 1
+        return success, error, skipped, cancelled
     
     def get_video_info(self, video_path):
-        """获取视频信息"""
-        try:
-            _, ffprobe_cmd = self.get_ffmpeg_path()
-            cmd = [
-                ffprobe_cmd,
-                '-v', 'quiet',
-                '-print_format', 'json',
-                '-show_streams',
-                video_path
-            ]
-            
-            result = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-            )
-            
-            if result.returncode == 0:
-                info = json.loads(result.stdout.decode('utf-8'))
-                for stream in info.get('streams', []):
-                    if stream.get('codec_type') == 'video':
-                        return {
-                            'width': stream.get('width', 0),
-                            'height': stream.get('height', 0),
-                            'duration': float(stream.get('duration', 0))
-                        }
-        except:
-            pass
-        
-        return {'width': 0, 'height': 0, 'duration': 0}
+        """获取视频信息（走探测缓存，同一文件只运行一次 ffprobe）"""
+        return core.summarize_probe(self.probe_cache.probe(video_path))
+    
+    def prefetch_video_info(self, paths):
+        """后台并发探测新添加的视频，处理时直接命中缓存"""
+        if paths:
+            threading.Thread(target=self.probe_cache.prefetch, args=(list(paths),), daemon=True).start()
     
     def convert_videos(self):
         """格式转换"""
@@ -958,51 +1027,80 @@ class VideoProcessorApp:
         final_output_dir = Path(self.output_dir) / output_folder_name
         final_output_dir.mkdir(parents=True, exist_ok=True)
         
-        total = len(self.video_files)
-        success_count = 0
-        error_count = 0
+        ffmpeg_cmd, _ = self.get_ffmpeg_path()
         
-        for idx, video_path in enumerate(self.video_files, 1):
-            try:
-                self.update_progress(idx - 0.5, total, f"正在转换 {idx}/{total}: {Path(video_path).name}")
-                
-                output_filename = Path(video_path).stem + f".{format_ext}"
-                output_path = final_output_dir / output_filename
-                
-                ffmpeg_cmd, _ = self.get_ffmpeg_path()
-                cmd = [
+        def convert_one(video_path, scheduler):
+            info = self.probe_cache.probe(video_path)
+            duration = core.summarize_probe(info)['duration']
+            output_filename = Path(video_path).stem + f".{format_ext}"
+            output_path = final_output_dir / output_filename
+            
+            # 已是 H.264/AAC 的流直接复制，只转码不兼容的流
+            codec_args, mode = core.plan_conversion(info, format_ext)
+            
+            def build_cmd(args):
+                return [
                     ffmpeg_cmd,
                     '-i', video_path,
-                    '-c:v', 'libx264',
-                    '-c:a', 'aac',
+                    *args,
+                    *scheduler.thread_args(),
                     '-y',
                     str(output_path)
                 ]
-                
-                result = subprocess.run(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-                )
-                
-                if result.returncode == 0:
-                    success_count += 1
+            
+            with scheduler.exclusive(output_path):
+                if mode == core.CONVERT_ENCODE:
+                    scheduler.run_checked(build_cmd(codec_args), duration)
                 else:
-                    error_count += 1
-                
-                self.update_progress(idx, total)
-                
-            except Exception as e:
+                    returncode, stderr = scheduler.run(build_cmd(codec_args), duration)
+                    if returncode != 0:
+                        # 直接复制失败（时间戳异常、容器不接受等），回退完全转码
+                        print(f"{Path(video_path).name} {mode}失败，改为完全转码: {stderr.strip()[-300:]}")
+                        codec_args, mode = core.encode_args_for(format_ext)
+                        scheduler.run_checked(build_cmd(codec_args), duration)
+            return mode
+        
+        results = self.run_ffmpeg_jobs(convert_one, self.video_files, "正在转换")
+        
+        mode_counts = {}
+        error_count = cancelled_count = 0
+        report_lines = []
+        for video_path, r in zip(self.video_files, results):
+            name = Path(video_path).name
+            if isinstance(r, core.JobCancelled):
+                cancelled_count += 1
+                report_lines.append(f"{name}\t已取消")
+            elif isinstance(r, Exception):
                 error_count += 1
-                print(f"处理 {video_path} 失败: {e}")
+                report_lines.append(f"{name}\t失败：{r}")
+            else:
+                mode_counts[r] = mode_counts.get(r, 0) + 1
+                report_lines.append(f"{name}\t{r}")
+        success_count = sum(mode_counts.values())
         
-        if error_count == 0:
+        # 每个文件走的是直接封装还是转码，写入报告
+        report_path = final_output_dir / "转换报告.txt"
+        try:
+            report_path.write_text("\n".join(report_lines) + "\n", encoding='utf-8')
+        except OSError as e:
+            print(f"写入转换报告失败: {e}")
+        
+        detail = "\n".join(f"{mode}：{mode_counts[mode]} 个"
+                           for mode in (core.CONVERT_REMUX, core.CONVERT_PARTIAL, core.CONVERT_ENCODE)
+                           if mode_counts.get(mode))
+        if error_count == 0 and cancelled_count == 0:
             self.root.after(0, lambda: messagebox.showinfo("成功", 
-                f"已成功转换 {success_count} 个视频为 {format_ext.upper()} 格式！\n保存在：{output_folder_name}"))
+                f"已成功转换 {success_count} 个视频为 {format_ext.upper()} 格式！\n{detail}\n\n"
+                f"每个文件的处理方式见：{report_path.name}\n保存在：{output_folder_name}"))
         else:
-            self.root.after(0, lambda: messagebox.showwarning("完成", 
-                f"成功: {success_count} 个\n失败: {error_count} 个\n保存在：{output_folder_name}"))
+            msg = f"成功: {success_count} 个\n"
+            if detail:
+                msg += detail + "\n"
+            msg += f"失败: {error_count} 个\n"
+            if cancelled_count > 0:
+                msg += f"已取消: {cancelled_count} 个\n"
+            msg += f"\n每个文件的处理方式见：{report_path.name}\n保存在：{output_folder_name}"
+            self.root.after(0, lambda: messagebox.showwarning("完成", msg))
     
     def compress_videos(self):
         """视频压缩"""
@@ -1020,99 +1118,76 @@ class VideoProcessorApp:
         final_output_dir = Path(self.output_dir) / output_folder_name
         final_output_dir.mkdir(parents=True, exist_ok=True)
         
-        total = len(self.video_files)
-        success_count = 0
-        error_count = 0
-        skipped_count = 0
+        ffmpeg_cmd, _ = self.get_ffmpeg_path()
         
-        for idx, video_path in enumerate(self.video_files, 1):
-            try:
-                self.update_progress(idx - 0.5, total, f"正在检查 {idx}/{total}: {Path(video_path).name}")
-                
-                output_filename = Path(video_path).stem + ".mp4"
-                output_path = final_output_dir / output_filename
-                
-                # 检查原视频大小
-                original_size = Path(video_path).stat().st_size
-                
-                # 如果已经小于目标大小，直接复制
-                if original_size <= target_size_bytes:
-                    self.update_progress(idx - 0.3, total, f"跳过 {idx}/{total}: {Path(video_path).name} (已满足大小)")
+        def compress_one(video_path, scheduler):
+            output_filename = Path(video_path).stem + ".mp4"
+            output_path = final_output_dir / output_filename
+            
+            # 检查原视频大小
+            original_size = Path(video_path).stat().st_size
+            
+            # 如果已经小于目标大小，直接复制
+            if original_size <= target_size_bytes:
+                with scheduler.exclusive(output_path):
                     shutil.copy2(video_path, output_path)
+                return {'target': target_size_bytes, 'size': original_size, 'attempts': 0,
+                        'mode': 'copy', 'ok': True}
+            
+            # 获取视频时长，两遍编码并校验结果大小
+            duration = self.get_video_info(video_path).get('duration', 0)
+            with scheduler.exclusive(output_path):
+                return core.encode_to_size(scheduler, ffmpeg_cmd, video_path, output_path,
+                                           target_size_bytes, duration)
+        
+        results = self.run_ffmpeg_jobs(compress_one, self.video_files, "正在压缩")
+        
+        success_count = error_count = skipped_count = over_count = cancelled_count = 0
+        report_lines = []
+        for video_path, r in zip(self.video_files, results):
+            name = Path(video_path).name
+            if isinstance(r, core.JobCancelled):
+                cancelled_count += 1
+                report_lines.append(f"{name}\t已取消")
+            elif isinstance(r, Exception):
+                error_count += 1
+                report_lines.append(f"{name}\t失败：{r}")
+            else:
+                if r['mode'] == 'copy':
                     skipped_count += 1
+                    state = "已满足大小，直接复制"
+                elif r['ok']:
                     success_count += 1
-                    self.update_progress(idx, total)
-                    continue
-                
-                # 需要压缩
-                self.update_progress(idx - 0.5, total, f"正在压缩 {idx}/{total}: {Path(video_path).name}")
-                
-                # 获取视频时长
-                video_info = self.get_video_info(video_path)
-                duration = video_info.get('duration', 0)
-                
-                ffmpeg_cmd, _ = self.get_ffmpeg_path()
-                
-                if duration > 0:
-                    # 计算目标比特率 (bytes * 8 / duration)
-                    target_bitrate = int((target_size_bytes * 8) / duration)
-                    # 减去音频比特率 (128k)
-                    target_video_bitrate = max(target_bitrate - 128000, 128000)
-                    
-                    cmd = [
-                        ffmpeg_cmd,
-                        '-i', video_path,
-                        '-b:v', str(target_video_bitrate),
-                        '-maxrate', str(target_video_bitrate),
-                        '-bufsize', str(target_video_bitrate * 2),
-                        '-c:v', 'libx264',
-                        '-c:a', 'aac',
-                        '-b:a', '128k',
-                        '-y',
-                        str(output_path)
-                    ]
+                    state = f"压缩完成（{r['attempts']} 次编码）"
                 else:
-                    # 无法获取时长，使用默认压缩
-                    cmd = [
-                        ffmpeg_cmd,
-                        '-i', video_path,
-                        '-c:v', 'libx264',
-                        '-crf', '28',
-                        '-c:a', 'aac',
-                        '-b:a', '128k',
-                        '-y',
-                        str(output_path)
-                    ]
-                
-                result = subprocess.run(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-                )
-                
-                if result.returncode == 0:
-                    success_count += 1
-                else:
-                    error_count += 1
-                
-                self.update_progress(idx, total)
-                
-            except Exception as e:
-                error_count += 1
-                print(f"处理 {video_path} 失败: {e}")
+                    over_count += 1
+                    state = f"仍超出目标（{r['attempts']} 次编码）"
+                report_lines.append(f"{name}\t{core.format_size(r['size'])} / 目标 {core.format_size(r['target'])}"
+                                    f"（{r['size'] / r['target']:.0%}）\t{state}")
+        
+        # 每个文件的实际大小与目标大小写入报告
+        report_path = final_output_dir / "压缩报告.txt"
+        try:
+            report_path.write_text("\n".join(report_lines) + "\n", encoding='utf-8')
+        except OSError as e:
+            print(f"写入压缩报告失败: {e}")
         
         # 显示结果
         msg = f"处理完成！\n\n"
-        if success_count - skipped_count > 0:
-            msg += f"压缩：{success_count - skipped_count} 个\n"
+        if success_count > 0:
+            msg += f"压缩：{success_count} 个\n"
         if skipped_count > 0:
             msg += f"跳过：{skipped_count} 个（已满足大小）\n"
+        if over_count > 0:
+            msg += f"仍超出目标：{over_count} 个（已降到最低码率或达到重试上限）\n"
         if error_count > 0:
             msg += f"失败：{error_count} 个\n"
+        if cancelled_count > 0:
+            msg += f"已取消：{cancelled_count} 个\n"
+        msg += f"\n每个文件的大小见：{report_path.name}"
         msg += f"\n保存在：{output_folder_name}"
         
-        if error_count == 0:
+        if error_count == 0 and over_count == 0 and cancelled_count == 0:
             self.root.after(0, lambda: messagebox.showinfo("成功", msg))
         else:
             self.root.after(0, lambda: messagebox.showwarning("完成", msg))
@@ -1138,6 +1213,17 @@ class VideoProcessorApp:
         # 是否提取封面
         extract_cover = self.extract_cover_var.get() == 1
         cover_format = self.cover_format_var.get()
+        ffmpeg_cmd, _ = self.get_ffmpeg_path()
+        
+        def cover_cmd_for(video_path, cover_path):
+            return [
+                ffmpeg_cmd,
+                '-i', video_path,
+                '-ss', '00:00:01',
+                '-vframes', '1',
+                '-y',
+                str(cover_path)
+            ]
         
         # 如果仅导出封面
         if preset == "cover_only":
@@ -1150,52 +1236,27 @@ class VideoProcessorApp:
             final_output_dir = Path(self.output_dir) / output_folder_name
             final_output_dir.mkdir(parents=True, exist_ok=True)
             
-            total = len(self.video_files)
-            success_count = 0
-            error_count = 0
+            def cover_one(video_path, scheduler):
+                cover_filename = Path(video_path).stem + f"_cover.{cover_format}"
+                cover_path = final_output_dir / cover_filename
+                
+                with scheduler.exclusive(cover_path):
+                    scheduler.run_checked(cover_cmd_for(video_path, cover_path))
+                return True
             
-            for idx, video_path in enumerate(self.video_files, 1):
-                try:
-                    self.update_progress(idx - 0.5, total, f"正在提取封面 {idx}/{total}: {Path(video_path).name}")
-                    
-                    cover_filename = Path(video_path).stem + f"_cover.{cover_format}"
-                    cover_path = final_output_dir / cover_filename
-                    
-                    ffmpeg_cmd, _ = self.get_ffmpeg_path()
-                    cover_cmd = [
-                        ffmpeg_cmd,
-                        '-i', video_path,
-                        '-ss', '00:00:01',
-                        '-vframes', '1',
-                        '-y',
-                        str(cover_path)
-                    ]
-                    
-                    result = subprocess.run(
-                        cover_cmd,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-                    )
-                    
-                    if result.returncode == 0:
-                        success_count += 1
-                    else:
-                        error_count += 1
-                    
-                    self.update_progress(idx, total)
-                    
-                except Exception as e:
-                    error_count += 1
-                    print(f"处理 {video_path} 失败: {e}")
+            # 只解码一帧，每个进程单线程即可，并发数按核数
+            results = self.run_ffmpeg_jobs(cover_one, self.video_files, "正在提取封面", threads_per_job=1)
+            success_count, error_count, _, cancelled_count = self.tally_results(results)
             
             # 显示结果
             msg = f"成功提取 {success_count} 个封面"
             if error_count > 0:
                 msg += f"\n失败 {error_count} 个"
+            if cancelled_count > 0:
+                msg += f"\n已取消 {cancelled_count} 个"
             msg += f"\n保存在：{output_folder_name}"
             
-            if error_count == 0:
+            if error_count == 0 and cancelled_count == 0:
                 self.root.after(0, lambda: messagebox.showinfo("成功", msg))
             else:
                 self.root.after(0, lambda: messagebox.showwarning("完成", msg))
@@ -1206,67 +1267,35 @@ class VideoProcessorApp:
         final_output_dir = Path(self.output_dir) / output_folder_name
         final_output_dir.mkdir(parents=True, exist_ok=True)
         
-        total = len(self.video_files)
-        success_count = 0
-        error_count = 0
+        def resize_one(video_path, scheduler):
+            duration = self.get_video_info(video_path).get('duration', 0)
+            output_filename = Path(video_path).stem + f"_{target_width}x{target_height}.mp4"
+            output_path = final_output_dir / output_filename
+            
+            # 使用ffmpeg调整尺寸
+            cmd = [
+                ffmpeg_cmd,
+                '-i', video_path,
+                '-vf', f'scale={target_width}:{target_height}',
+                '-c:a', 'copy',
+                *scheduler.thread_args(),
+                '-y',
+                str(output_path)
+            ]
+            
+            with scheduler.exclusive(output_path):
+                scheduler.run_checked(cmd, duration)
+            
+            # 如果需要提取封面
+            if extract_cover:
+                cover_filename = Path(video_path).stem + f"_cover.{cover_format}"
+                cover_path = final_output_dir / cover_filename
+                with scheduler.exclusive(cover_path):
+                    scheduler.run(cover_cmd_for(video_path, cover_path))
+            return True
         
-        for idx, video_path in enumerate(self.video_files, 1):
-            try:
-                self.update_progress(idx - 0.5, total, f"正在调整尺寸 {idx}/{total}: {Path(video_path).name}")
-                
-                output_filename = Path(video_path).stem + f"_{target_width}x{target_height}.mp4"
-                output_path = final_output_dir / output_filename
-                
-                # 使用ffmpeg调整尺寸
-                ffmpeg_cmd, _ = self.get_ffmpeg_path()
-                cmd = [
-                    ffmpeg_cmd,
-                    '-i', video_path,
-                    '-vf', f'scale={target_width}:{target_height}',
-                    '-c:a', 'copy',
-                    '-y',
-                    str(output_path)
-                ]
-                
-                result = subprocess.run(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-                )
-                
-                if result.returncode == 0:
-                    success_count += 1
-                    
-                    # 如果需要提取封面
-                    if extract_cover:
-                        cover_filename = Path(video_path).stem + f"_cover.{cover_format}"
-                        cover_path = final_output_dir / cover_filename
-                        
-                        ffmpeg_cmd, _ = self.get_ffmpeg_path()
-                        cover_cmd = [
-                            ffmpeg_cmd,
-                            '-i', video_path,
-                            '-ss', '00:00:01',
-                            '-vframes', '1',
-                            '-y',
-                            str(cover_path)
-                        ]
-                        
-                        subprocess.run(
-                            cover_cmd,
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE,
-                            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-                        )
-                else:
-                    error_count += 1
-                
-                self.update_progress(idx, total)
-                
-            except Exception as e:
-                error_count += 1
-                print(f"处理 {video_path} 失败: {e}")
+        results = self.run_ffmpeg_jobs(resize_one, self.video_files, "正在调整尺寸")
+        success_count, error_count, _, cancelled_count = self.tally_results(results)
         
         # 显示结果
         msg = f"成功调整 {success_count} 个视频尺寸"
@@ -1274,9 +1303,11 @@ class VideoProcessorApp:
             msg += f"\n同时提取了 {success_count} 个封面"
         if error_count > 0:
             msg += f"\n失败 {error_count} 个"
+        if cancelled_count > 0:
+            msg += f"\n已取消 {cancelled_count} 个"
         msg += f"\n保存在：{output_folder_name}"
         
-        if error_count == 0:
+        if error_count == 0 and cancelled_count == 0:
             self.root.after(0, lambda: messagebox.showinfo("成功", msg))
         else:
             self.root.after(0, lambda: messagebox.showwarning("完成", msg))
@@ -1296,58 +1327,38 @@ class VideoProcessorApp:
         final_output_dir = Path(self.output_dir) / output_folder_name
         final_output_dir.mkdir(parents=True, exist_ok=True)
         
-        total = len(self.video_files)
-        success_count = 0
-        error_count = 0
-        skipped_count = 0
+        ffmpeg_cmd, _ = self.get_ffmpeg_path()
         
-        for idx, video_path in enumerate(self.video_files, 1):
-            try:
-                self.update_progress(idx - 0.5, total, f"正在提取封面 {idx}/{total}: {Path(video_path).name}")
-                
-                # 获取视频尺寸
-                video_info = self.get_video_info(video_path)
-                video_width = video_info.get('width', 0)
-                video_height = video_info.get('height', 0)
-                
-                # 检查尺寸是否满足要求
-                if video_width < min_width or video_height < min_height:
-                    skipped_count += 1
-                    print(f"跳过 {Path(video_path).name}: 尺寸不足 ({video_width}x{video_height})")
-                    self.update_progress(idx, total)
-                    continue
-                
-                output_filename = Path(video_path).stem + f"_cover.{cover_format}"
-                output_path = final_output_dir / output_filename
-                
-                # 提取第1秒的帧作为封面
-                ffmpeg_cmd, _ = self.get_ffmpeg_path()
-                cmd = [
-                    ffmpeg_cmd,
-                    '-i', video_path,
-                    '-ss', '00:00:01',
-                    '-vframes', '1',
-                    '-y',
-                    str(output_path)
-                ]
-                
-                result = subprocess.run(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-                )
-                
-                if result.returncode == 0:
-                    success_count += 1
-                else:
-                    error_count += 1
-                
-                self.update_progress(idx, total)
-                
-            except Exception as e:
-                error_count += 1
-                print(f"处理 {video_path} 失败: {e}")
+        def cover_one(video_path, scheduler):
+            # 获取视频尺寸
+            video_info = self.get_video_info(video_path)
+            video_width = video_info.get('width', 0)
+            video_height = video_info.get('height', 0)
+            
+            # 检查尺寸是否满足要求
+            if video_width < min_width or video_height < min_height:
+                print(f"跳过 {Path(video_path).name}: 尺寸不足 ({video_width}x{video_height})")
+                return "skipped"
+            
+            output_filename = Path(video_path).stem + f"_cover.{cover_format}"
+            output_path = final_output_dir / output_filename
+            
+            # 提取第1秒的帧作为封面
+            cmd = [
+                ffmpeg_cmd,
+                '-i', video_path,
+                '-ss', '00:00:01',
+                '-vframes', '1',
+                '-y',
+                str(output_path)
+            ]
+            
+            with scheduler.exclusive(output_path):
+                scheduler.run_checked(cmd)
+            return True
+        
+        results = self.run_ffmpeg_jobs(cover_one, self.video_files, "正在提取封面", threads_per_job=1)
+        success_count, error_count, skipped_count, cancelled_count = self.tally_results(results)
         
         # 显示结果
         msg = f"成功提取 {success_count} 个封面"
@@ -1355,9 +1366,11 @@ class VideoProcessorApp:
             msg += f"\n跳过 {skipped_count} 个（尺寸不足 {min_width}x{min_height}）"
         if error_count > 0:
             msg += f"\n失败 {error_count} 个"
+        if cancelled_count > 0:
+            msg += f"\n已取消 {cancelled_count} 个"
         msg += f"\n保存在：{output_folder_name}"
         
-        if error_count == 0:
+        if error_count == 0 and cancelled_count == 0:
             self.root.after(0, lambda: messagebox.showinfo("成功", msg))
         else:
             self.root.after(0, lambda: messagebox.showwarning("完成", msg))
@@ -1528,27 +1541,23 @@ class VideoProcessorApp:
             temp_dir = Path(self.output_dir) / f"_temp_videos_{timestamp}"
             temp_dir.mkdir(exist_ok=True)
             
-            # 预处理视频（720p规则）
-            processed_videos = []
-            total = len(self.video_files)
+            # 预处理视频（720p规则），多个视频并发缩放
+            ffmpeg_cmd, _ = self.get_ffmpeg_path()
             
-            for idx, video_path in enumerate(self.video_files, 1):
-                self.update_progress(5 + (idx / total) * 40, 100, f"预处理 {idx}/{total}: {Path(video_path).name}")
+            def preprocess_one(video_path, scheduler):
+                # 获取视频尺寸
+                video_info = self.get_video_info(video_path)
+                w = video_info.get('width', 0)
+                h = video_info.get('height', 0)
                 
-                try:
-                    # 获取视频尺寸
-                    video_info = self.get_video_info(video_path)
-                    w = video_info.get('width', 0)
-                    h = video_info.get('height', 0)
-                    
-                    output_path = temp_dir / Path(video_path).name
-                    
-                    # 判断是否需要缩放
-                    scale_expr = self.get_scale_expr(w, h)
-                    
+                output_path = temp_dir / Path(video_path).name
+                
+                # 判断是否需要缩放
+                scale_expr = self.get_scale_expr(w, h)
+                
+                with scheduler.exclusive(output_path):
                     if scale_expr:
                         # 需要缩放
-                        ffmpeg_cmd, _ = self.get_ffmpeg_path()
                         cmd = [
                             ffmpeg_cmd,
                             '-y', '-i', str(video_path),
@@ -1557,25 +1566,26 @@ class VideoProcessorApp:
                             '-preset', 'veryfast',
                             '-crf', '23',
                             '-c:a', 'copy',
+                            *scheduler.thread_args(),
                             str(output_path)
                         ]
-                        
-                        subprocess.run(
-                            cmd,
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE,
-                            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-                        )
+                        scheduler.run(cmd, video_info.get('duration', 0))
                     else:
                         # 不需要缩放，直接复制
                         shutil.copy2(video_path, output_path)
-                    
-                    # 获取文件大小
-                    if output_path.exists():
-                        size = output_path.stat().st_size
-                        processed_videos.append((output_path, size))
-                except Exception as e:
-                    print(f"预处理失败 {Path(video_path).name}: {e}")
+                
+                # 获取文件大小
+                if output_path.exists():
+                    return output_path, output_path.stat().st_size
+                return None
+            
+            results = self.run_ffmpeg_jobs(preprocess_one, self.video_files, "预处理", progress_range=(5, 45))
+            if self.tally_results(results)[3]:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                self.root.after(0, lambda: messagebox.showinfo("提示", "已取消分组打包"))
+                return
+            # 结果与 self.video_files 顺序一致
+            processed_videos = [r for r in results if isinstance(r, tuple)]
             
             if not processed_videos:
                 self.root.after(0, lambda: messagebox.showerror("错误", "没有成功预处理的视频"))
@@ -1659,6 +1669,7 @@ class VideoProcessorApp:
         if self.processing:
             if not messagebox.askyesno("确认", "当前有任务在执行，切换主题会重启窗口，确定继续吗？"):
                 return
+            self.cancel_processing()
 
         # 保存当前基本状态
         saved_videos = list(self.video_files)
@@ -1804,6 +1815,7 @@ class VideoProcessorApp:
         if self.processing:
             if not messagebox.askyesno("确认", "正在处理中，确定要返回吗？"):
                 return
+            self.cancel_processing()
         
         self.root.destroy()
         import sys